@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Doctor, Patient
+from .models import User, Doctor, DoctorWorkingHours, DoctorLeave, Patient
+from appointments.counter_utils import verify_profiles
+from .directory_utils import invalidate_doctor_directory
 
 
 @admin.register(User)
@@ -16,16 +18,31 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class DoctorWorkingHoursInline(admin.TabularInline):
+    """Weekly working hours edited on the doctor page"""
+    model = DoctorWorkingHours
+    extra = 0
+
+
+class DoctorLeaveInline(admin.TabularInline):
+    """Leave and holidays edited on the doctor page"""
+    model = DoctorLeave
+    extra = 0
+
+
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     """Doctor admin"""
+    inlines = [DoctorWorkingHoursInline, DoctorLeaveInline]
     list_display = ('user', 'specialization', 'contact', 'experience_years', 'verified', 'created_at')
     list_filter = ('verified', 'specialization', 'created_at')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'specialization')
     actions = ['verify_doctors']
     
     def verify_doctors(self, request, queryset):
-        queryset.update(verified=True)
+        # A queryset update sends no post_save, so refresh the directory here
+        if verify_profiles(queryset):
+            invalidate_doctor_directory()
     verify_doctors.short_description = "Verify selected doctors"
 
 
@@ -38,5 +55,5 @@ class PatientAdmin(admin.ModelAdmin):
     actions = ['verify_patients']
     
     def verify_patients(self, request, queryset):
-        queryset.update(verified=True)
+        verify_profiles(queryset)
     verify_patients.short_description = "Verify selected patients"
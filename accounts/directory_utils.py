@@ -0,0 +1,74 @@
+"""
+Cached directory of verified doctors
+
+Booking forms, doctor lists and admin filters all need the same small list
+of verified doctors. It is built once into plain dicts and kept in the
+default cache until a doctor or a doctor's name changes (see signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import Doctor
+
+
+CACHE_KEY = 'accounts:doctor_directory'
+
+
+def build_doctor_directory():
+    """
+    Read the verified doctors into cacheable dicts
+
+    Returns:
+        list: One dict per doctor with id, names, specialization,
+            qualification, experience_years and contact, ordered by name
+    """
+    # Always from the primary: a copy built from a lagging replica would be
+    # cached long after the replica caught up
+    doctors = Doctor.objects.using(DEFAULT_DB_ALIAS).filter(verified=True).values(
+        'id', 'user__first_name', 'user__last_name',
+        'specialization', 'qualification', 'experience_years', 'contact'
+    ).order_by('user__first_name', 'user__last_name', 'id')
+    return [
+        {
+            'id': doctor['id'],
+            'first_name': doctor['user__first_name'],
+            'last_name': doctor['user__last_name'],
+            'full_name': f"{doctor['user__first_name']} {doctor['user__last_name']}".strip(),
+            'specialization': doctor['specialization'],
+            'qualification': doctor['qualification'],
+            'experience_years': doctor['experience_years'],
+            'contact': doctor['contact'],
+        }
+        for doctor in doctors
+    ]
+
+
+def get_doctor_directory():
+    """Verified doctors as dicts, from the cache when possible (see build_doctor_directory)"""
+    return cache.get_or_set(
+        CACHE_KEY, build_doctor_directory, getattr(settings, 'DOCTOR_DIRECTORY_CACHE_SECONDS', 3600)
+    )
+
+
+def doctor_choices():
+    """(id, label) choices for doctor select fields, labelled like Doctor.__str__"""
+    return [
+        (doctor['id'], f"Dr. {doctor['full_name']} - {doctor['specialization']}")
+        for doctor in get_doctor_directory()
+    ]
+
+
+def specialization_choices():
+    """Distinct specializations of verified doctors, sorted"""
+    return sorted({doctor['specialization'] for doctor in get_doctor_directory()})
+
+
+def invalidate_doctor_directory():
+    """
+    Drop the cached directory
+
+    It is dropped again once the transaction commits, so a request that
+    rebuilt it from the old rows in the meantime cannot keep a stale copy.
+    """
+    cache.delete(CACHE_KEY)
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
@@ -1,5 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.password_validation import validate_password
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from .models import User, Doctor, Patient
 
 
@@ -101,3 +103,64 @@ class PatientProfileForm(forms.ModelForm):
             self.fields['first_name'].initial = self.instance.user.first_name
             self.fields['last_name'].initial = self.instance.user.last_name
             self.fields['email'].initial = self.instance.user.email
+
+
+class UserImportForm(forms.Form):
+    """One row of a bulk user import (see import_utils); checked without queries"""
+    username = forms.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    first_name = forms.CharField(max_length=30)
+    last_name = forms.CharField(max_length=30)
+    email = forms.EmailField()
+    # Rows without a password get an unusable one and must reset it
+    password = forms.CharField(required=False, strip=False)
+    contact = forms.CharField(max_length=15)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        password = cleaned_data.get('password')
+        if password and cleaned_data.get('username'):
+            user = User(
+                username=cleaned_data['username'],
+                first_name=cleaned_data.get('first_name', ''),
+                last_name=cleaned_data.get('last_name', ''),
+                email=cleaned_data.get('email', ''),
+            )
+            try:
+                validate_password(password, user)
+            except forms.ValidationError as e:
+                self.add_error('password', e)
+        return cleaned_data
+
+
+class DoctorImportForm(UserImportForm):
+    """Doctor row of a bulk import; fields as on DoctorSignUpForm"""
+    specialization = forms.CharField(max_length=100)
+    qualification = forms.CharField(max_length=200, required=False)
+    experience_years = forms.IntegerField(min_value=0, required=False)
+
+    def profile_fields(self):
+        """Doctor model fields from the cleaned row"""
+        data = self.cleaned_data
+        return {
+            'specialization': data['specialization'],
+            'contact': data['contact'],
+            'qualification': data['qualification'],
+            'experience_years': data['experience_years'] or 0,
+        }
+
+
+class PatientImportForm(UserImportForm):
+    """Patient row of a bulk import; fields as on PatientSignUpForm"""
+    age = forms.IntegerField(min_value=0, required=False)
+    address = forms.CharField(required=False)
+    blood_group = forms.CharField(max_length=5, required=False)
+
+    def profile_fields(self):
+        """Patient model fields from the cleaned row"""
+        data = self.cleaned_data
+        return {
+            'age': data['age'],
+            'contact': data['contact'],
+            'address': data['address'],
+            'blood_group': data['blood_group'],
+        }
@@ -0,0 +1,203 @@
+"""
+Bulk import of doctors and patients from CSV or JSONL files
+
+Rows are validated a batch at a time, with one query checking the whole
+batch's usernames. Passwords are hashed in a process pool, because PBKDF2
+costs far more than anything else here. Users and profiles are then
+written with bulk_create, one transaction per batch. bulk_create sends no
+post_save, so the work the signal handlers would do (dashboard counters,
+doctor search index, doctor directory) is done here once per batch.
+"""
+import csv
+import json
+from itertools import islice
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from appointments.counter_utils import profile_keys, counter_deltas, apply_counter_deltas
+from .forms import DoctorImportForm, PatientImportForm
+from .models import User, Doctor, Patient
+from .search_utils import index_new_doctors
+from .directory_utils import invalidate_doctor_directory
+
+
+# Row form and profile model for each importable role
+IMPORT_ROLES = {
+    'doctor': (DoctorImportForm, Doctor),
+    'patient': (PatientImportForm, Patient),
+}
+
+
+def read_rows(path):
+    """
+    Read an import file: CSV with a header row, or JSON Lines (.jsonl)
+
+    Yields:
+        tuple: (line number, row dict), or (line number, None) for a line
+            that is not a JSON object
+    """
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        if str(path).lower().endswith('.jsonl'):
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+        else:
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def batches(iterable, size):
+    """Split an iterable into lists of at most ``size`` items"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def setup_worker():
+    """Process pool initializer: make settings (PASSWORD_HASHERS) available"""
+    django.setup()
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """
+    Hash a batch of passwords, in a process pool if one is given
+
+    Args:
+        passwords: Raw passwords; empty ones get an unusable password
+        pool: Optional concurrent.futures executor
+        workers: Number of processes in the pool, to size the work chunks
+
+    Returns:
+        list: Encoded passwords in the same order
+    """
+    given = [password for password in passwords if password]
+    if pool is not None and given:
+        chunksize = max(1, len(given) // (4 * workers))
+        hashed = iter(pool.map(make_password, given, chunksize=chunksize))
+    else:
+        hashed = map(make_password, given)
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def _form_errors(form):
+    return '; '.join(
+        f'{field}: {error}' if field != '__all__' else error
+        for field, errors in form.errors.items() for error in errors
+    )
+
+
+def validate_batch(rows, default_role, seen):
+    """
+    Validate a batch of rows
+
+    Args:
+        rows: List of (line number, row dict) pairs
+        default_role: Role for rows without a role column
+        seen: Usernames accepted from earlier batches; updated in place
+
+    Returns:
+        tuple: (valid, errors) where valid holds (line number, role, form)
+            and errors holds (line number, username, message)
+    """
+    candidates, errors = [], []
+    for number, row in rows:
+        if row is None:
+            errors.append((number, '', 'Line is not a JSON object'))
+            continue
+        username = str(row.get('username') or '')
+        role = str(row.get('role') or default_role or '').strip().lower()
+        if role not in IMPORT_ROLES:
+            errors.append((number, username, f"role must be one of: {', '.join(IMPORT_ROLES)}"))
+            continue
+        form = IMPORT_ROLES[role][0](row)
+        if not form.is_valid():
+            errors.append((number, username, _form_errors(form)))
+        elif form.cleaned_data['username'] in seen:
+            errors.append((number, username, 'Duplicate username in the import file'))
+        else:
+            seen.add(form.cleaned_data['username'])
+            candidates.append((number, role, form))
+
+    taken = set(User.objects.filter(
+        username__in=[form.cleaned_data['username'] for number, role, form in candidates]
+    ).values_list('username', flat=True))
+    valid = []
+    for number, role, form in candidates:
+        if form.cleaned_data['username'] in taken:
+            errors.append((number, form.cleaned_data['username'], 'A user with that username already exists'))
+        else:
+            valid.append((number, role, form))
+    return valid, errors
+
+
+def _insert(entries, verified):
+    """Write users and profiles for (role, form, password hash) entries; returns the profiles"""
+    users = [
+        User(
+            username=form.cleaned_data['username'],
+            first_name=form.cleaned_data['first_name'],
+            last_name=form.cleaned_data['last_name'],
+            email=form.cleaned_data['email'],
+            role=role,
+            password=password,
+        )
+        for role, form, password in entries
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        if users[0].pk is None:
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(User.objects.filter(
+                username__in=[user.username for user in users]
+            ).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        profiles = [
+            IMPORT_ROLES[role][1](user=user, verified=verified, **form.profile_fields())
+            for (role, form, password), user in zip(entries, users)
+        ]
+        for model in (Doctor, Patient):
+            model.objects.bulk_create([profile for profile in profiles if isinstance(profile, model)])
+
+        # What the post_save handlers would have done for each profile
+        apply_counter_deltas(counter_deltas([], [
+            key for profile in profiles for key in profile_keys(type(profile), profile.verified)
+        ]))
+        doctors = [profile for profile in profiles if isinstance(profile, Doctor)]
+        index_new_doctors(doctors)
+        if any(doctor.verified for doctor in doctors):
+            invalidate_doctor_directory()
+    return profiles
+
+
+def insert_batch(valid, hashes, verified=False):
+    """
+    Create the users and profiles of a validated batch in one transaction
+
+    A batch that hits a unique constraint (a username taken since it was
+    validated) is retried row by row so only the clashing rows fail.
+
+    Returns:
+        tuple: (profiles created, errors as (line number, username, message))
+    """
+    if not valid:
+        return [], []
+    entries = [(role, form, password) for (number, role, form), password in zip(valid, hashes)]
+    try:
+        return _insert(entries, verified), []
+    except IntegrityError:
+        pass
+
+    profiles, errors = [], []
+    for (number, role, form), entry in zip(valid, entries):
+        try:
+            profiles += _insert([entry], verified)
+        except IntegrityError:
+            errors.append((number, form.cleaned_data['username'], 'A user with that username already exists'))
+    return profiles, errors
@@ -0,0 +1,98 @@
+"""
+Django management command to bulk import doctors and patients
+Usage: python manage.py import_users FILE [--role doctor|patient] [--verified] [--batch-size N]
+       [--workers N] [--report PATH] [--dry-run]
+
+FILE is CSV with a header row or JSON Lines (.jsonl), with the sign-up form
+fields: username, first_name, last_name, email, password, contact and either
+specialization, qualification, experience_years (doctors) or age, address,
+blood_group (patients). A role column overrides --role per row. Rows that
+cannot be imported are written to the report with the reason.
+"""
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from accounts.import_utils import (
+    IMPORT_ROLES, read_rows, batches, setup_worker, hash_passwords, validate_batch, insert_batch
+)
+
+
+class Command(BaseCommand):
+    help = 'Import doctors and patients from a CSV or JSONL file in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV or .jsonl file to import')
+        parser.add_argument('--role', choices=list(IMPORT_ROLES),
+                            help='Role of rows without a role column')
+        parser.add_argument('--verified', action='store_true',
+                            help='Mark imported profiles as verified')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows validated and inserted per transaction (default: 500)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes hashing passwords (default: one per CPU)')
+        parser.add_argument('--report', default=None,
+                            help='Where to write rejected rows (default: FILE.errors.csv)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate only; create nothing')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        path = options['file']
+        if not os.path.isfile(path):
+            raise CommandError(f'No such file: {path}')
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+        report_path = options['report'] or f'{path}.errors.csv'
+        workers = options['workers']
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Validating' if options['dry_run'] else 'Importing'} {path}..."
+        ))
+
+        read = created = failed = 0
+        started = time.perf_counter()
+        report = None
+        with ExitStack() as stack:
+            pool = None
+            if workers > 1 and not options['dry_run']:
+                # Forked workers must not share the parent's database connections
+                connections.close_all()
+                pool = stack.enter_context(ProcessPoolExecutor(workers, initializer=setup_worker))
+            seen = set()
+
+            for batch in batches(read_rows(path), options['batch_size']):
+                read += len(batch)
+                valid, errors = validate_batch(batch, options['role'], seen)
+                if options['dry_run']:
+                    created += len(valid)
+                else:
+                    hashes = hash_passwords(
+                        [form.cleaned_data['password'] for number, role, form in valid], pool, workers
+                    )
+                    profiles, insert_errors = insert_batch(valid, hashes, verified=options['verified'])
+                    created += len(profiles)
+                    errors += insert_errors
+
+                if errors:
+                    if report is None:
+                        report = csv.writer(stack.enter_context(open(report_path, 'w', newline='')))
+                        report.writerow(['line', 'username', 'error'])
+                    report.writerows(sorted(errors))
+                    failed += len(errors)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{read} row(s) read, {created} {"valid" if options["dry_run"] else "created"}, '
+                    f'{failed} rejected ({read / elapsed:.0f} rows/s)'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Validated' if options['dry_run'] else 'Imported'} {created} of {read} row(s) "
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} row(s) rejected; see {report_path}'))
@@ -0,0 +1,26 @@
+"""
+Django management command to rebuild the doctor and appointment search indexes
+Usage: python manage.py rebuild_search_index
+"""
+from django.core.management.base import BaseCommand
+from accounts.search_utils import rebuild_search_index, search_index_enabled
+from appointments.search_utils import rebuild_search_index as rebuild_appointment_search_index
+
+
+class Command(BaseCommand):
+    help = 'Re-index every doctor and appointment in the full-text search indexes'
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        if not search_index_enabled():
+            self.stdout.write(self.style.WARNING('This database uses plain substring search; nothing to rebuild.'))
+            return
+        
+        self.stdout.write(self.style.SUCCESS('Rebuilding search indexes...'))
+        
+        doctors = rebuild_search_index()
+        appointments = rebuild_appointment_search_index()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {doctors} doctor(s) and {appointments} appointment(s)")
+        )
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+SEARCH_TABLE = 'accounts_doctor_search'
+
+
+def create_search_index(apps, schema_editor):
+    """Create and fill the FTS5 doctor index (SQLite only, see search_utils)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 34):
+        # The trigram tokenizer needs SQLite 3.34+
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5(name, specialization, qualification, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, specialization, qualification) "
+        f"SELECT d.id, TRIM(u.first_name || ' ' || u.last_name), d.specialization, d.qualification "
+        f"FROM accounts_doctor d JOIN accounts_user u ON u.id = d.user_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_doctor_schedule'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -32,6 +32,65 @@ class Doctor(models.Model):
         ordering = ['-created_at']
 
 
+class DoctorWorkingHours(models.Model):
+    """Weekly working-hours template for a doctor"""
+    WEEKDAY_CHOICES = (
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    )
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='working_hours')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+    
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        verbose_name_plural = 'doctor working hours'
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(end_time__gt=models.F('start_time')),
+                name='working_hours_end_after_start'
+            )
+        ]
+
+
+class DoctorLeave(models.Model):
+    """Leave, holiday or other exception to a doctor's working hours"""
+    REASON_CHOICES = (
+        ('leave', 'Leave'),
+        ('holiday', 'Holiday'),
+        ('other', 'Other'),
+    )
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='leaves')
+    start_date = models.DateField()
+    end_date = models.DateField()
+    # Leave both times empty to block the whole day
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES, default='leave')
+    note = models.CharField(max_length=200, blank=True)
+    
+    def __str__(self):
+        return f"{self.get_reason_display()}: {self.start_date} to {self.end_date}"
+    
+    class Meta:
+        ordering = ['start_date']
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(end_date__gte=models.F('start_date')),
+                name='leave_end_on_or_after_start'
+            )
+        ]
+
+
 class Patient(models.Model):
     """Patient profile model"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='patient_profile')
@@ -0,0 +1,186 @@
+"""
+Doctor full-text search utilities
+
+On SQLite, doctors are indexed in an FTS5 table using the trigram tokenizer
+(created by migration 0003 and kept in sync by accounts.signals). A query is
+split into trigrams, so partial words and most single typos still match.
+Candidates are ranked by the share of the query's trigrams they contain,
+then by bm25. Other backends, SQLite builds the migration could not create
+the index on (older than 3.34 or without FTS5), and queries too short to form
+a trigram fall back to case-insensitive substring matching.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Doctor
+
+
+SEARCH_TABLE = 'accounts_doctor_search'
+
+# Share of the query's trigrams a doctor must contain to be a match
+MIN_SIMILARITY = 0.6
+
+# Most candidates read from the index for one search
+MAX_CANDIDATES = 200
+
+# User fields that appear in search indexes
+NAME_FIELDS = {'first_name', 'last_name'}
+
+# Whether each (database, FTS5 table) exists, looked up once per process
+_index_tables = {}
+
+
+def search_index_enabled(table=SEARCH_TABLE):
+    """
+    Whether an FTS5 search table exists in the database
+
+    The answer is cached, so signal handlers can call this on every save.
+
+    Args:
+        table: Search table name (default: the doctor index)
+    """
+    if connection.vendor != 'sqlite':
+        return False
+    key = (str(connection.settings_dict['NAME']), table)
+    if key not in _index_tables:
+        _index_tables[key] = table in connection.introspection.table_names()
+    return _index_tables[key]
+
+
+def reset_search_index_cache():
+    """Forget which search tables exist, e.g. after migrations ran"""
+    _index_tables.clear()
+
+
+def trigrams(text):
+    """
+    Get the set of trigrams in each word of a text
+
+    Args:
+        text: Search query or indexed text
+
+    Returns:
+        set: Lowercase three-character substrings
+    """
+    grams = set()
+    for word in text.lower().split():
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def match_expression(query_grams):
+    """FTS5 query matching any of the given trigrams"""
+    return ' OR '.join('"{}"'.format(gram.replace('"', '""')) for gram in sorted(query_grams))
+
+
+def similarity(query_grams, text):
+    """Share of the query's trigrams that occur in a text"""
+    return len(query_grams & trigrams(text)) / len(query_grams)
+
+
+def doctor_document(doctor):
+    """Indexed column values for a doctor"""
+    return (
+        doctor.id,
+        doctor.user.get_full_name(),
+        doctor.specialization,
+        doctor.qualification,
+    )
+
+
+def index_doctor(doctor):
+    """Add or replace a doctor in the search index"""
+    if not search_index_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [doctor.id])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, specialization, qualification) VALUES (%s, %s, %s, %s)',
+            doctor_document(doctor)
+        )
+
+
+def index_new_doctors(doctors):
+    """
+    Add doctors created without post_save (bulk_create) to the search index
+
+    Args:
+        doctors: Saved Doctor instances with their user attached
+    """
+    if not search_index_enabled() or not doctors:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, specialization, qualification) VALUES (%s, %s, %s, %s)',
+            [doctor_document(doctor) for doctor in doctors]
+        )
+
+
+def unindex_doctor(doctor_id):
+    """Remove a doctor from the search index"""
+    if not search_index_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [doctor_id])
+
+
+def rebuild_search_index():
+    """
+    Re-index every doctor
+
+    Returns:
+        int: Number of doctors indexed
+    """
+    if not search_index_enabled():
+        return 0
+    doctors = [doctor_document(doctor) for doctor in Doctor.objects.select_related('user')]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, specialization, qualification) VALUES (%s, %s, %s, %s)',
+            doctors
+        )
+    return len(doctors)
+
+
+def _ranked_ids(query_grams):
+    """Doctor ids matching enough query trigrams, best match first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid, name, specialization, qualification, bm25({SEARCH_TABLE}) '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}) LIMIT %s',
+            [match_expression(query_grams), MAX_CANDIDATES]
+        )
+        rows = cursor.fetchall()
+
+    scored = []
+    for doctor_id, name, specialization, qualification, rank in rows:
+        score = similarity(query_grams, f'{name} {specialization} {qualification}')
+        if score >= MIN_SIMILARITY:
+            scored.append((-score, rank, doctor_id))
+    return [doctor_id for _, _, doctor_id in sorted(scored)]
+
+
+def search_doctors(queryset, query):
+    """
+    Search doctors by name, specialization and qualification
+
+    Args:
+        queryset: Doctor queryset to search within (e.g. verified doctors)
+        query: Free-text search string
+
+    Returns:
+        list: Matching doctors, most relevant first
+    """
+    query_grams = trigrams(query)
+    if search_index_enabled() and query_grams:
+        ids = _ranked_ids(query_grams)
+        doctors = queryset.in_bulk(ids)
+        return [doctors[doctor_id] for doctor_id in ids if doctor_id in doctors]
+
+    return list(queryset.filter(
+        Q(user__first_name__icontains=query) |
+        Q(user__last_name__icontains=query) |
+        Q(specialization__icontains=query) |
+        Q(qualification__icontains=query)
+    ))
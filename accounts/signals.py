@@ -0,0 +1,45 @@
+"""
+Signal handlers that keep the doctor search index and directory in sync
+"""
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from .models import User, Doctor
+from .search_utils import NAME_FIELDS, index_doctor, unindex_doctor, reset_search_index_cache
+from .directory_utils import invalidate_doctor_directory
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, **kwargs):
+    """Re-index a doctor whose profile changed"""
+    index_doctor(instance)
+    invalidate_doctor_directory()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Re-index a doctor whose name changed and refresh the directory"""
+    if created:
+        # The doctor profile is created (and indexed) afterwards
+        return
+    if update_fields is not None and not NAME_FIELDS & set(update_fields):
+        # e.g. the last_login update on every sign-in
+        return
+    doctor = Doctor.objects.filter(user=instance).first()
+    if doctor:
+        doctor.user = instance
+        index_doctor(doctor)
+        if doctor.verified:
+            invalidate_doctor_directory()
+
+
+@receiver(post_delete, sender=Doctor)
+def doctor_deleted(sender, instance, **kwargs):
+    """Drop a deleted doctor from the search index and directory"""
+    unindex_doctor(instance.id)
+    invalidate_doctor_directory()
+
+
+@receiver(post_migrate)
+def search_tables_migrated(sender, **kwargs):
+    """Look up the search tables again; migrations may have created or dropped them"""
+    reset_search_index_cache()
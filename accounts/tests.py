@@ -1,3 +1,242 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import runpy
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, time, timedelta
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, is_password_usable
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from appointments.models import Appointment, Invoice
+from appointments.counter_utils import get_counters
+from .models import User, Doctor, Patient
+from .directory_utils import CACHE_KEY, get_doctor_directory
+from .import_utils import setup_worker, hash_passwords
+from .search_utils import SEARCH_TABLE, search_doctors, search_index_enabled, reset_search_index_cache
 
-# Create your tests here.
+
+class DashboardQueryCountTests(TestCase):
+    """Dashboards must cost a fixed number of queries, whatever the appointment history"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('admin', password='secret', role='admin')
+        doctor_user = User.objects.create_user('doctor', password='secret', role='doctor', first_name='Asha')
+        cls.doctor = Doctor.objects.create(user=doctor_user, specialization='Cardiology', contact='1', verified=True)
+        patient_user = User.objects.create_user('patient', password='secret', role='patient', first_name='Ravi')
+        cls.patient = Patient.objects.create(user=patient_user, contact='2', age=30, verified=True)
+
+    def add_appointments(self, count):
+        start = date.today() + timedelta(days=1 + Appointment.objects.count())
+        for offset in range(count):
+            appointment = Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                appointment_date=start + timedelta(days=offset),
+                appointment_time=time(10),
+                symptoms='Headache',
+                status='completed' if offset % 2 else 'pending',
+            )
+            if appointment.status == 'completed':
+                Invoice.objects.create(appointment=appointment, amount=500)
+
+    def assertQueriesPinned(self, username, url, expected):
+        """Check the page query count with a short and a long history"""
+        self.client.login(username=username, password='secret')
+        self.add_appointments(2)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_appointments(10)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_patient_dashboard(self):
+        self.assertQueriesPinned('patient', reverse('patient_dashboard'), 5)
+
+    def test_doctor_dashboard(self):
+        self.assertQueriesPinned('doctor', reverse('doctor_dashboard'), 5)
+
+    def test_admin_dashboard(self):
+        self.assertQueriesPinned('admin', reverse('admin_dashboard'), 3)
+
+
+class DoctorDirectoryTests(TestCase):
+    """The cached doctor directory serves booking pages and follows doctor changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        doctor_user = User.objects.create_user('doctor', password='secret', role='doctor', first_name='Asha')
+        cls.doctor = Doctor.objects.create(user=doctor_user, specialization='Cardiology', contact='1', verified=True)
+        other_user = User.objects.create_user('pending', password='secret', role='doctor', first_name='Meera')
+        cls.pending = Doctor.objects.create(user=other_user, specialization='Dermatology', contact='1')
+        patient_user = User.objects.create_user('patient', password='secret', role='patient')
+        Patient.objects.create(user=patient_user, contact='2', verified=True)
+
+    def names(self):
+        return [doctor['full_name'] for doctor in get_doctor_directory()]
+
+    def test_booking_page_reads_the_cache(self):
+        get_doctor_directory()
+        self.client.login(username='patient', password='secret')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('book_appointment'))
+        self.assertContains(response, 'Dr. Asha')
+        self.assertFalse([query for query in queries if '"accounts_doctor"' in query['sql']])
+
+    def test_changes_invalidate_the_directory(self):
+        self.assertEqual(self.names(), ['Asha'])
+
+        self.pending.verified = True
+        self.pending.save()
+        self.assertEqual(self.names(), ['Asha', 'Meera'])
+
+        self.doctor.user.last_name = 'Rao'
+        self.doctor.user.save()
+        self.assertEqual(self.names(), ['Asha Rao', 'Meera'])
+
+        self.pending.user.delete()
+        self.assertEqual(self.names(), ['Asha Rao'])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'directory_cache'},
+    })
+    def test_shared_cache_invalidates_every_process(self):
+        call_command('createcachetable', verbosity=0)
+        self.assertEqual(self.names(), ['Asha'])
+        # Another server process has its own cache object on the same table
+        other_process = DatabaseCache('directory_cache', {})
+        self.assertEqual(len(other_process.get(CACHE_KEY)), 1)
+
+        self.pending.verified = True
+        self.pending.save()
+        self.assertIsNone(other_process.get(CACHE_KEY))
+
+
+class CacheSettingsTests(SimpleTestCase):
+    """CACHES is read from the environment and shared once several processes serve requests"""
+
+    def load_settings(self, **env):
+        """Evaluate settings.py with only the given cache environment variables set"""
+        names = ('CACHE_BACKEND', 'CACHE_LOCATION', 'WEB_CONCURRENCY', 'DOCTOR_DIRECTORY_CACHE_SECONDS')
+        saved = {name: os.environ.pop(name) for name in names if name in os.environ}
+        os.environ.update(env)
+        try:
+            return runpy.run_path(str(settings.BASE_DIR / 'vishubh_project' / 'settings.py'))
+        finally:
+            for name in env:
+                del os.environ[name]
+            os.environ.update(saved)
+
+    def backends(self, loaded):
+        return {alias: config['BACKEND'].rsplit('.', 1)[1] for alias, config in loaded['CACHES'].items()}
+
+    def test_single_process_keeps_the_directory_briefly(self):
+        loaded = self.load_settings()
+        self.assertEqual(self.backends(loaded), {'default': 'LocMemCache', 'template_fragments': 'LocMemCache'})
+        self.assertEqual(loaded['DOCTOR_DIRECTORY_CACHE_SECONDS'], 60)
+
+    def test_several_processes_share_the_database_cache(self):
+        loaded = self.load_settings(WEB_CONCURRENCY='4')
+        self.assertEqual(self.backends(loaded), {'default': 'DatabaseCache', 'template_fragments': 'DatabaseCache'})
+        self.assertEqual(loaded['DOCTOR_DIRECTORY_CACHE_SECONDS'], 3600)
+
+    def test_cache_server_from_environment(self):
+        loaded = self.load_settings(CACHE_BACKEND='redis', CACHE_LOCATION='redis://cache:6379')
+        self.assertEqual(self.backends(loaded), {'default': 'RedisCache', 'template_fragments': 'RedisCache'})
+        self.assertEqual(
+            {config['LOCATION'] for config in loaded['CACHES'].values()}, {'redis://cache:6379'}
+        )
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(CACHE_BACKEND='disk')
+
+
+class ImportUsersTests(TestCase):
+    """The bulk importer creates users and profiles in batches and reports the rows it rejects"""
+
+    def setUp(self):
+        User.objects.create_user('taken', password='secret', role='patient')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'roster.csv')
+        self.report = os.path.join(directory, 'report.csv')
+        rows = [
+            ['role', 'username', 'first_name', 'last_name', 'email', 'password', 'contact', 'specialization', 'age'],
+            ['doctor', 'asha', 'Asha', 'Rao', 'asha@example.com', 'Clinic-pass-2024', '1', 'Cardiology', ''],
+            ['patient', 'ravi', 'Ravi', 'Kumar', 'ravi@example.com', '', '2', '', '30'],
+            ['patient', 'bad', 'Bad', 'Email', 'not-an-email', '', '3', '', ''],
+            ['patient', 'taken', 'Taken', 'User', 'taken@example.com', '', '4', '', ''],
+            ['doctor', 'asha', 'Asha', 'Again', 'asha2@example.com', '', '5', 'Cardiology', ''],
+        ]
+        with open(self.path, 'w', newline='') as file:
+            csv.writer(file).writerows(rows)
+
+    def test_import_with_error_report(self):
+        call_command(
+            'import_users', self.path, '--verified', '--batch-size', '2', '--workers', '1',
+            '--report', self.report, stdout=io.StringIO()
+        )
+        self.assertTrue(User.objects.get(username='asha').check_password('Clinic-pass-2024'))
+        self.assertFalse(User.objects.get(username='ravi').has_usable_password())
+        self.assertEqual(Patient.objects.get(user__username='ravi').age, 30)
+        self.assertEqual([doctor['full_name'] for doctor in get_doctor_directory()], ['Asha Rao'])
+        self.assertEqual(get_counters('global')['doctors'], 1)
+        self.assertEqual([doctor.user.username for doctor in search_doctors(Doctor.objects.select_related('user'), 'cardio')], ['asha'])
+
+        with open(self.report, newline='') as file:
+            report = list(csv.DictReader(file))
+        self.assertEqual([row['username'] for row in report], ['bad', 'taken', 'asha'])
+        self.assertIn('email', report[0]['error'])
+
+    def test_passwords_hash_in_a_process_pool(self):
+        with ProcessPoolExecutor(2, initializer=setup_worker) as pool:
+            hashes = hash_passwords(['first-secret', '', 'second-secret'], pool, workers=2)
+        self.assertTrue(check_password('first-secret', hashes[0]))
+        self.assertFalse(is_password_usable(hashes[1]))
+        self.assertTrue(check_password('second-secret', hashes[2]))
+
+
+class DoctorSearchTests(TestCase):
+    """Doctor search ranks fuzzy matches from the FTS5 index and falls back to substring matching without it"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for username, first_name, specialization in [('asha', 'Asha', 'Cardiology'), ('meera', 'Meera', 'Dermatology')]:
+            user = User.objects.create_user(username, password='secret', role='doctor', first_name=first_name)
+            Doctor.objects.create(user=user, specialization=specialization, contact='1', verified=True)
+
+    def names(self, query):
+        return [doctor.user.first_name for doctor in search_doctors(Doctor.objects.select_related('user'), query)]
+
+    def test_index_matches_typos_and_follows_renames(self):
+        if not search_index_enabled():
+            self.skipTest('SQLite without FTS5 trigram support')
+        self.assertEqual(self.names('cardiolgy'), ['Asha'])
+        user = User.objects.get(username='meera')
+        user.first_name = 'Priya'
+        user.save()
+        self.assertEqual(self.names('priya'), ['Priya'])
+        self.assertEqual(self.names('meera'), [])
+
+    def test_falls_back_without_index(self):
+        # As on SQLite builds where migration 0003 could not create the table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+        reset_search_index_cache()
+        self.addCleanup(reset_search_index_cache)
+        self.assertFalse(search_index_enabled())
+
+        doctor = Doctor.objects.get(user__username='asha')
+        doctor.specialization = 'Cardiac Surgery'
+        doctor.save()
+        doctor.user.last_name = 'Rao'
+        doctor.user.save()
+        self.assertEqual(self.names('cardiac'), ['Asha'])
+        self.assertEqual(self.names('cardiolgy'), [])
@@ -6,6 +6,8 @@ from django.db.models import Q
 from .forms import DoctorSignUpForm, PatientSignUpForm, DoctorProfileForm, PatientProfileForm
 from .models import User, Doctor, Patient
 from appointments.models import Appointment
+from appointments.counter_utils import get_counters
+from appointments.database_utils import replica_reads
 
 
 def home(request):
@@ -84,33 +86,36 @@ def patient_signup(request):
 
 # Admin Views
 @login_required
+@replica_reads
 def admin_dashboard(request):
     """Admin dashboard view"""
     if request.user.role != 'admin':
         messages.error(request, 'Access denied. Admin only.')
         return redirect('home')
     
+    counters = get_counters('global')
     context = {
-        'total_patients': Patient.objects.count(),
-        'total_doctors': Doctor.objects.count(),
-        'total_appointments': Appointment.objects.count(),
-        'pending_appointments': Appointment.objects.filter(status='pending').count(),
-        'confirmed_appointments': Appointment.objects.filter(status='confirmed').count(),
-        'pending_doctors': Doctor.objects.filter(verified=False).count(),
-        'pending_patients': Patient.objects.filter(verified=False).count(),
+        'total_patients': counters['patients'],
+        'total_doctors': counters['doctors'],
+        'total_appointments': counters['appointments'],
+        'pending_appointments': counters['appointments_pending'],
+        'confirmed_appointments': counters['appointments_confirmed'],
+        'pending_doctors': counters['doctors_unverified'],
+        'pending_patients': counters['patients_unverified'],
     }
     return render(request, 'admin/dashboard.html', context)
 
 
 @login_required
+@replica_reads
 def admin_manage_users(request):
     """Admin user management view"""
     if request.user.role != 'admin':
         messages.error(request, 'Access denied. Admin only.')
         return redirect('home')
     
-    doctors = Doctor.objects.all()
-    patients = Patient.objects.all()
+    doctors = Doctor.objects.select_related('user')
+    patients = Patient.objects.select_related('user')
     
     # Handle verification
     if request.method == 'POST':
@@ -149,6 +154,7 @@ def admin_manage_users(request):
 
 # Doctor Views
 @login_required
+@replica_reads
 def doctor_dashboard(request):
     """Doctor dashboard view"""
     if request.user.role != 'doctor':
@@ -163,14 +169,15 @@ def doctor_dashboard(request):
         messages.error(request, 'Doctor profile not found.')
         return redirect('home')
     
-    appointments = Appointment.objects.filter(doctor=doctor).order_by('-appointment_date', '-appointment_time')
+    appointments = Appointment.objects.with_related().filter(doctor=doctor).order_by('-appointment_date', '-appointment_time')
+    counters = get_counters('doctor', doctor.id)
     
     context = {
         'doctor': doctor,
         'appointments': appointments,
-        'total_appointments': appointments.count(),
-        'pending_appointments': appointments.filter(status='pending').count(),
-        'confirmed_appointments': appointments.filter(status='confirmed').count(),
+        'total_appointments': counters['appointments'],
+        'pending_appointments': counters['appointments_pending'],
+        'confirmed_appointments': counters['appointments_confirmed'],
     }
     return render(request, 'doctor/dashboard.html', context)
 
@@ -203,6 +210,7 @@ def doctor_profile(request):
 
 # Patient Views
 @login_required
+@replica_reads
 def patient_dashboard(request):
     """Patient dashboard view"""
     if request.user.role != 'patient':
@@ -217,14 +225,15 @@ def patient_dashboard(request):
         messages.error(request, 'Patient profile not found.')
         return redirect('home')
     
-    appointments = Appointment.objects.filter(patient=patient).order_by('-appointment_date', '-appointment_time')
+    appointments = Appointment.objects.with_related().filter(patient=patient).order_by('-appointment_date', '-appointment_time')
+    counters = get_counters('patient', patient.id)
     
     context = {
         'patient': patient,
         'appointments': appointments,
-        'total_appointments': appointments.count(),
-        'pending_appointments': appointments.filter(status='pending').count(),
-        'confirmed_appointments': appointments.filter(status='confirmed').count(),
+        'total_appointments': counters['appointments'],
+        'pending_appointments': counters['appointments_pending'],
+        'confirmed_appointments': counters['appointments_confirmed'],
     }
     return render(request, 'patient/dashboard.html', context)
 
@@ -1,27 +1,91 @@
 from django.contrib import admin
-from .models import Appointment, Invoice
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR
+from django.db.models import Case, When, Value, IntegerField
+from .models import Appointment, Invoice, InvoiceJob, WaitlistEntry
+from .assignment_utils import auto_assign_appointments
+from .search_utils import ranked_appointment_ids
+
+
+class AppointmentChangeList(ChangeList):
+    """Changelist that shows search results by relevance unless a column is sorted"""
+    
+    def get_ordering(self, request, queryset):
+        if ORDER_VAR not in self.params and 'search_rank' in queryset.query.annotations:
+            return ['search_rank', '-pk']
+        return super().get_ordering(request, queryset)
 
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     """Appointment admin"""
     list_display = ('patient', 'doctor', 'appointment_date', 'appointment_time', 'status', 'created_at')
-    list_filter = ('status', 'appointment_date', 'created_at')
+    list_select_related = ('patient__user', 'doctor__user')
+    list_filter = ('status', 'payment_status', 'appointment_date', 'created_at', 'requested_specialization')
     search_fields = ('patient__user__username', 'doctor__user__username', 'symptoms')
-    actions = ['confirm_appointments', 'complete_appointments']
+    actions = ['confirm_appointments', 'complete_appointments', 'auto_assign_doctors']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Add full-text matches on symptoms and names to the search_fields lookup
+        
+        Index matches come first, most relevant first; rows matched only by
+        search_fields (e.g. a username) follow.
+        """
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        ranked = ranked_appointment_ids(search_term, queryset) if search_term else None
+        if not ranked:
+            return results, may_have_duplicates
+        
+        ranking = Case(
+            *[When(pk=pk, then=Value(position)) for position, pk in enumerate(ranked)],
+            default=Value(len(ranked)),
+            output_field=IntegerField()
+        )
+        return (results | queryset.filter(pk__in=ranked)).annotate(search_rank=ranking), may_have_duplicates
+    
+    def get_changelist(self, request, **kwargs):
+        return AppointmentChangeList
     
     def confirm_appointments(self, request, queryset):
-        queryset.update(status='confirmed')
+        queryset.synced_update(status='confirmed')
     confirm_appointments.short_description = "Confirm selected appointments"
     
     def complete_appointments(self, request, queryset):
-        queryset.update(status='completed')
+        queryset.synced_update(status='completed')
     complete_appointments.short_description = "Mark selected appointments as completed"
+    
+    def auto_assign_doctors(self, request, queryset):
+        result = auto_assign_appointments(queryset)
+        message = f"Assigned {result['assigned']} appointment(s); {result['unassigned']} could not be matched."
+        if result['next_cursor']:
+            message += ' More selected appointments are left; run the action again.'
+        self.message_user(request, message)
+    auto_assign_doctors.short_description = "Auto-assign doctors to selected unassigned appointments"
 
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
     """Invoice admin"""
     list_display = ('id', 'appointment', 'amount', 'generated_date')
+    list_select_related = ('appointment__patient__user', 'appointment__doctor__user')
     list_filter = ('generated_date',)
     search_fields = ('appointment__patient__user__username',)
+
+
+@admin.register(InvoiceJob)
+class InvoiceJobAdmin(admin.ModelAdmin):
+    """Invoice PDF job admin"""
+    list_display = ('invoice', 'status', 'attempts', 'created_at', 'updated_at')
+    list_select_related = ('invoice__appointment__patient__user',)
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    """Waitlist admin"""
+    list_display = ('patient', 'doctor', 'date', 'priority', 'status', 'created_at')
+    list_select_related = ('patient__user', 'doctor__user')
+    list_filter = ('status', 'date')
+    list_editable = ('priority',)
+    search_fields = ('patient__user__username', 'doctor__user__username')
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import api_views
+
+urlpatterns = [
+    path('appointments/', api_views.appointments, name='api_appointments'),
+    path('appointments/<int:appointment_id>/', api_views.appointment_detail, name='api_appointment_detail'),
+    path('doctors/', api_views.doctors, name='api_doctors'),
+    path('doctors/<int:doctor_id>/', api_views.doctor_detail, name='api_doctor_detail'),
+    path('invoices/', api_views.invoices, name='api_invoices'),
+    path('invoices/<int:invoice_id>/', api_views.invoice_detail, name='api_invoice_detail'),
+]
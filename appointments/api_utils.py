@@ -0,0 +1,173 @@
+"""
+Serialization helpers for the JSON API (see api_views)
+
+Rows are read with ``QuerySet.values()`` straight into dicts and handed to
+JsonResponse as they are: no model instances, no per-row serializer calls.
+Clients pick the fields they need with ``?fields=``; only those columns are
+selected and only the joins they need are made.
+"""
+import json
+from functools import wraps
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Concat, NullIf, Trim
+from django.http import JsonResponse
+
+
+def full_name(user_path):
+    """Database expression for '<first> <last>' of a related user, or None"""
+    return NullIf(
+        Trim(Concat(f'{user_path}__first_name', Value(' '), f'{user_path}__last_name')),
+        Value('')
+    )
+
+
+# API field name -> model field name (selected as is) or expression.
+# Expressions are evaluated by the database inside the same SELECT.
+APPOINTMENT_FIELDS = {
+    'id': 'id',
+    'patient_id': 'patient_id',
+    'patient_name': full_name('patient__user'),
+    'doctor_id': 'doctor_id',
+    'doctor_name': full_name('doctor__user'),
+    'specialization': F('doctor__specialization'),
+    'requested_specialization': 'requested_specialization',
+    'appointment_date': 'appointment_date',
+    'appointment_time': 'appointment_time',
+    'duration_minutes': 'duration_minutes',
+    'starts_at': 'starts_at',
+    'ends_at': 'ends_at',
+    'symptoms': 'symptoms',
+    'status': 'status',
+    'payment_status': 'payment_status',
+    'payment_amount': 'payment_amount',
+    'invoice_id': F('invoice__id'),
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+APPOINTMENT_DEFAULT_FIELDS = (
+    'id', 'patient_id', 'doctor_id', 'appointment_date', 'appointment_time',
+    'duration_minutes', 'status', 'payment_status',
+)
+
+DOCTOR_FIELDS = {
+    'id': 'id',
+    'first_name': F('user__first_name'),
+    'last_name': F('user__last_name'),
+    'full_name': full_name('user'),
+    'specialization': 'specialization',
+    'qualification': 'qualification',
+    'experience_years': 'experience_years',
+    'contact': 'contact',
+}
+
+DOCTOR_DEFAULT_FIELDS = ('id', 'full_name', 'specialization', 'experience_years')
+
+INVOICE_FIELDS = {
+    'id': 'id',
+    'appointment_id': 'appointment_id',
+    'patient_name': full_name('appointment__patient__user'),
+    'doctor_name': full_name('appointment__doctor__user'),
+    'appointment_date': F('appointment__appointment_date'),
+    'amount': 'amount',
+    'generated_date': 'generated_date',
+    'payment_status': 'payment_status',
+    'payment_date': 'payment_date',
+}
+
+INVOICE_DEFAULT_FIELDS = ('id', 'appointment_id', 'amount', 'generated_date', 'payment_status')
+
+
+def api_error(message, status=400):
+    """JSON error response in the shape used by every endpoint"""
+    return JsonResponse({'error': message}, status=status)
+
+
+def api_view(methods):
+    """
+    Decorator for API views: JSON 401/405 responses instead of redirects
+
+    Args:
+        methods: HTTP methods the view accepts
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return api_error('Authentication required', status=401)
+            if request.method not in methods:
+                response = api_error(f'Method {request.method} not allowed', status=405)
+                response['Allow'] = ', '.join(methods)
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def parse_fields(request, available, default):
+    """
+    Read the ``fields`` query parameter
+
+    Returns:
+        list: Requested API field names in order, or None if one is unknown
+    """
+    requested = request.GET.get('fields', '').strip()
+    if not requested:
+        return list(default)
+    fields = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    if not fields or any(name not in available for name in fields):
+        return None
+    return fields
+
+
+def parse_page_size(request):
+    """
+    Read the ``limit`` query parameter
+
+    Returns:
+        int: Page size, or None if out of range
+    """
+    limit = request.GET.get('limit', '')
+    if not limit:
+        return getattr(settings, 'API_PAGE_SIZE', 100)
+    if not limit.isdigit() or not 1 <= int(limit) <= getattr(settings, 'API_MAX_PAGE_SIZE', 5000):
+        return None
+    return int(limit)
+
+
+def select_values(queryset, spec, fields, extra=()):
+    """
+    Restrict a queryset to the chosen API fields as ``values()`` dicts
+
+    Args:
+        queryset: QuerySet to read from
+        spec: Field map such as APPOINTMENT_FIELDS
+        fields: API field names to select
+        extra: Model field names needed besides them (e.g. the ordering)
+    """
+    plain = [spec[name] for name in fields if isinstance(spec[name], str)]
+    plain += [name for name in extra if name not in plain]
+    expressions = {name: spec[name] for name in fields if not isinstance(spec[name], str)}
+    return queryset.values(*plain, **expressions)
+
+
+def trim_rows(rows, fields):
+    """Drop the helper columns select_values added for the ordering"""
+    if rows and set(rows[0]) != set(fields):
+        return [{name: row[name] for name in fields} for row in rows]
+    return rows
+
+
+def json_body(request):
+    """
+    Decode a JSON object request body
+
+    Returns:
+        dict: Decoded body, or None if it is not a JSON object
+    """
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return body if isinstance(body, dict) else None
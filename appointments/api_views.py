@@ -0,0 +1,238 @@
+"""
+JSON API (version 1) for appointments, doctors and invoices
+
+Every list is cursor paginated (``after`` / ``before``, see
+pagination_utils), takes ``limit`` and ``fields``, and is built from
+``values()`` rows (see api_utils). Requests are authenticated by the usual
+session; writes need the CSRF token like any other form post.
+"""
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.http import JsonResponse
+from accounts.models import Doctor, Patient
+from .models import Appointment, Invoice
+from .forms import AppointmentForm, AppointmentFilterForm
+from .booking_utils import book_appointment_slot, save_appointment
+from .invoice_utils import DEFAULT_INVOICE_AMOUNT, invoice_blocker, create_invoice, parse_invoice_amount
+from .pagination_utils import keyset_paginate
+from .database_utils import replica_reads
+from .api_utils import (
+    APPOINTMENT_FIELDS, APPOINTMENT_DEFAULT_FIELDS, DOCTOR_FIELDS, DOCTOR_DEFAULT_FIELDS,
+    INVOICE_FIELDS, INVOICE_DEFAULT_FIELDS, api_error, api_view, parse_fields,
+    parse_page_size, select_values, trim_rows, json_body
+)
+
+
+APPOINTMENT_ORDERING = ('-created_at', '-id')
+DOCTOR_ORDERING = ('id',)
+INVOICE_ORDERING = ('-generated_date', '-id')
+
+
+def _appointments_for(user):
+    """Appointments a user may see: all for admins, their own otherwise"""
+    if user.role == 'admin':
+        return Appointment.objects.all()
+    if user.role == 'doctor':
+        return Appointment.objects.filter(doctor__user=user)
+    if user.role == 'patient':
+        return Appointment.objects.filter(patient__user=user)
+    return Appointment.objects.none()
+
+
+def _invoices_for(user):
+    """Invoices a user may see: all for admins, their own otherwise"""
+    if user.role == 'admin':
+        return Invoice.objects.all()
+    if user.role == 'doctor':
+        return Invoice.objects.filter(appointment__doctor__user=user)
+    if user.role == 'patient':
+        return Invoice.objects.filter(appointment__patient__user=user)
+    return Invoice.objects.none()
+
+
+def _list(request, queryset, spec, default_fields, ordering):
+    """Serve one cursor page of a queryset as JSON"""
+    fields = parse_fields(request, spec, default_fields)
+    if fields is None:
+        return api_error(f"Unknown field; choose from {', '.join(spec)}")
+    page_size = parse_page_size(request)
+    if page_size is None:
+        return api_error('limit is out of range')
+
+    page = keyset_paginate(
+        select_values(queryset, spec, fields, extra=[field.lstrip('-') for field in ordering]),
+        ordering=ordering,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=page_size,
+    )
+    return JsonResponse({
+        'results': trim_rows(page['items'], fields),
+        'next': page['next_cursor'],
+        'previous': page['previous_cursor'],
+    })
+
+
+def _detail(request, queryset, spec, default_fields, pk, status=200):
+    """Serve one row of a queryset as JSON"""
+    fields = parse_fields(request, spec, default_fields)
+    if fields is None:
+        return api_error(f"Unknown field; choose from {', '.join(spec)}")
+    row = select_values(queryset.filter(pk=pk), spec, fields).first()
+    if row is None:
+        return api_error('Not found', status=404)
+    return JsonResponse(row, status=status)
+
+
+@api_view(['GET', 'POST'])
+@replica_reads
+def appointments(request):
+    """List visible appointments, or book one (patients)"""
+    if request.method == 'POST':
+        return _book_appointment(request)
+
+    filter_form = AppointmentFilterForm(request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse({'error': 'Invalid filters', 'fields': filter_form.errors.get_json_data()}, status=400)
+    return _list(
+        request, filter_form.filter(_appointments_for(request.user)),
+        APPOINTMENT_FIELDS, APPOINTMENT_DEFAULT_FIELDS, APPOINTMENT_ORDERING
+    )
+
+
+def _book_appointment(request):
+    """Book a single appointment from a JSON body shaped like AppointmentForm"""
+    if request.user.role != 'patient':
+        return api_error('Only patients can book appointments.', status=403)
+    try:
+        patient = request.user.patient_profile
+    except Patient.DoesNotExist:
+        return api_error('Patient profile not found.', status=403)
+    if not patient.verified:
+        return api_error('Your account must be verified by admin before booking appointments.', status=403)
+
+    body = json_body(request)
+    if body is None:
+        return api_error('Request body must be a JSON object')
+    # Recurring series are booked through the web form only
+    body = {key: value for key, value in body.items() if key not in ('repeat', 'occurrences')}
+
+    form = AppointmentForm(body)
+    if not form.is_valid():
+        return JsonResponse({'error': 'Invalid appointment', 'fields': form.errors.get_json_data()}, status=400)
+    appointment = form.save(commit=False)
+    appointment.patient = patient
+    try:
+        book_appointment_slot(appointment)
+    except ValidationError as e:
+        return api_error(' '.join(e.messages), status=409)
+    return _detail(request, Appointment.objects.all(), APPOINTMENT_FIELDS, APPOINTMENT_DEFAULT_FIELDS,
+                   appointment.pk, status=201)
+
+
+@api_view(['GET', 'PATCH'])
+@replica_reads
+def appointment_detail(request, appointment_id):
+    """Show a visible appointment, or change its status or doctor (doctors and admins)"""
+    visible = _appointments_for(request.user)
+    if request.method == 'GET':
+        return _detail(request, visible, APPOINTMENT_FIELDS, APPOINTMENT_DEFAULT_FIELDS, appointment_id)
+
+    if request.user.role not in ('doctor', 'admin'):
+        return api_error('Only doctors and admins can update appointments.', status=403)
+    appointment = visible.filter(pk=appointment_id).first()
+    if appointment is None:
+        return api_error('Not found', status=404)
+    body = json_body(request)
+    if body is None:
+        return api_error('Request body must be a JSON object')
+
+    if 'status' in body:
+        if body['status'] not in ('confirmed', 'completed', 'cancelled'):
+            return api_error('status must be confirmed, completed or cancelled')
+        appointment.status = body['status']
+    if 'doctor_id' in body:
+        if request.user.role != 'admin':
+            return api_error('Only admins can assign doctors.', status=403)
+        doctor = Doctor.objects.filter(pk=body['doctor_id'], verified=True).first() \
+            if str(body['doctor_id']).isdigit() else None
+        if doctor is None:
+            return api_error('doctor_id must be a verified doctor')
+        appointment.doctor = doctor
+
+    try:
+        save_appointment(appointment)
+    except ValidationError as e:
+        return api_error(' '.join(e.messages), status=409)
+    return _detail(request, visible, APPOINTMENT_FIELDS, APPOINTMENT_DEFAULT_FIELDS, appointment.pk)
+
+
+@api_view(['GET'])
+@replica_reads
+def doctors(request):
+    """List verified doctors, optionally of one specialization"""
+    queryset = Doctor.objects.filter(verified=True)
+    specialization = request.GET.get('specialization', '').strip()
+    if specialization:
+        queryset = queryset.filter(specialization__iexact=specialization)
+    return _list(request, queryset, DOCTOR_FIELDS, DOCTOR_DEFAULT_FIELDS, DOCTOR_ORDERING)
+
+
+@api_view(['GET'])
+@replica_reads
+def doctor_detail(request, doctor_id):
+    """Show a verified doctor"""
+    return _detail(request, Doctor.objects.filter(verified=True), DOCTOR_FIELDS, DOCTOR_DEFAULT_FIELDS, doctor_id)
+
+
+@api_view(['GET', 'POST'])
+@replica_reads
+def invoices(request):
+    """List visible invoices, or generate one for an appointment (admins)"""
+    if request.method == 'POST':
+        return _create_invoice(request)
+
+    queryset = _invoices_for(request.user)
+    payment_status = request.GET.get('payment_status', '')
+    if payment_status:
+        if payment_status not in dict(Invoice.PAYMENT_STATUS_CHOICES):
+            return api_error('Unknown payment_status')
+        queryset = queryset.filter(payment_status=payment_status)
+    return _list(request, queryset, INVOICE_FIELDS, INVOICE_DEFAULT_FIELDS, INVOICE_ORDERING)
+
+
+def _create_invoice(request):
+    """Generate an invoice from a JSON body with appointment_id and an optional amount"""
+    if request.user.role != 'admin':
+        return api_error('Access denied. Admin only.', status=403)
+    body = json_body(request)
+    if body is None:
+        return api_error('Request body must be a JSON object')
+
+    amount = parse_invoice_amount(body.get('amount', DEFAULT_INVOICE_AMOUNT))
+    if amount is None:
+        return api_error('amount must be a positive number below 100000000')
+
+    appointment_id = str(body.get('appointment_id', ''))
+    appointment = Appointment.objects.filter(pk=appointment_id).first() if appointment_id.isdigit() else None
+    if appointment is None:
+        return api_error('Appointment not found', status=404)
+    blocker = invoice_blocker(appointment)
+    if blocker:
+        return api_error(blocker)
+    if Invoice.objects.filter(appointment=appointment).exists():
+        return api_error('Invoice already exists for this appointment.', status=409)
+
+    try:
+        invoice = create_invoice(appointment, amount)
+    except IntegrityError:
+        # Another request invoiced it between the check and the insert
+        return api_error('Invoice already exists for this appointment.', status=409)
+    return _detail(request, Invoice.objects.all(), INVOICE_FIELDS, INVOICE_DEFAULT_FIELDS, invoice.pk, status=201)
+
+
+@api_view(['GET'])
+@replica_reads
+def invoice_detail(request, invoice_id):
+    """Show a visible invoice"""
+    return _detail(request, _invoices_for(request.user), INVOICE_FIELDS, INVOICE_DEFAULT_FIELDS, invoice_id)
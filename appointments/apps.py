@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .database_utils import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='appointments_configure_connection')
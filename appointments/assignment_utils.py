@@ -0,0 +1,176 @@
+"""
+Automatic doctor assignment for unassigned appointments
+
+Verified doctors are kept in min-heaps keyed by their current load (active
+upcoming appointments), one heap per specialization plus one for all
+doctors. Each appointment goes to the least loaded doctor who works and is
+free for its whole duration, and the whole batch is written with one bulk update.
+Batches are capped at AUTO_ASSIGN_BATCH_SIZE appointments and walked in
+starts_at order with a keyset cursor.
+"""
+import heapq
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from accounts.models import Doctor
+from .models import Appointment
+from .signals import appointments_bulk_changed
+from .availability_utils import load_day_masks, appointment_mask
+from .pagination_utils import keyset_paginate
+
+
+# Order in which unassigned appointments are served; also the batch cursor
+ASSIGNMENT_ORDERING = ('starts_at', 'id')
+
+
+def _pop_free_doctor(heap, loads, is_free):
+    """
+    Pop the least loaded doctor that passes ``is_free``
+    
+    Stale heap entries (whose load changed since they were pushed) are
+    dropped; busy doctors are pushed back untouched.
+    """
+    busy = []
+    chosen = None
+    while heap:
+        load, doctor_id = heapq.heappop(heap)
+        if load != loads[doctor_id]:
+            continue
+        if is_free(doctor_id):
+            chosen = doctor_id
+            break
+        busy.append((load, doctor_id))
+    for entry in busy:
+        heapq.heappush(heap, entry)
+    return chosen
+
+
+def _save_assignments(assigned, before):
+    """
+    Write assigned doctors with one bulk update
+    
+    If a slot was booked concurrently the unique slot constraint rejects the
+    batch; it is then retried row by row so only the clashing rows are left
+    unassigned.
+    
+    Returns:
+        list: Appointments whose assignment was saved
+    """
+    def write(appointments, rows):
+        with transaction.atomic():
+            Appointment.objects.bulk_update(appointments, ['doctor', 'updated_at'])
+            appointments_bulk_changed.send(
+                sender=Appointment,
+                before=rows,
+                after=[appointment.change_row() for appointment in appointments]
+            )
+    
+    try:
+        write(assigned, before)
+        return assigned
+    except IntegrityError:
+        pass
+    
+    saved = []
+    for appointment, row in zip(assigned, before):
+        try:
+            write([appointment], [row])
+        except IntegrityError:
+            continue
+        saved.append(appointment)
+    return saved
+
+
+def auto_assign_appointments(appointments=None, after=None, batch_size=None):
+    """
+    Assign a batch of unassigned appointments to verified doctors by load
+    
+    Appointments with a requested specialization only go to doctors of that
+    specialization. A doctor is only chosen when the slot is within their
+    working hours and not already booked.
+    
+    Args:
+        appointments: Appointment queryset to consider (default: all)
+        after: Cursor returned by the previous batch
+        batch_size: Most appointments considered (default: AUTO_ASSIGN_BATCH_SIZE)
+        
+    Returns:
+        dict: Counts of 'assigned' and 'unassigned' appointments, and
+            'next_cursor' for the following batch (None after the last)
+    """
+    now = timezone.now()
+    queryset = Appointment.objects.all() if appointments is None else appointments
+    page = keyset_paginate(
+        queryset.filter(
+            doctor__isnull=True,
+            status__in=Appointment.ACTIVE_STATUSES,
+            starts_at__gte=now
+        ),
+        ASSIGNMENT_ORDERING,
+        after=after,
+        page_size=batch_size or getattr(settings, 'AUTO_ASSIGN_BATCH_SIZE', 500)
+    )
+    batch = page['items']
+    if not batch:
+        return {'assigned': 0, 'unassigned': 0, 'next_cursor': None}
+    
+    doctors = Doctor.objects.filter(verified=True).annotate(
+        load=Count('appointments', filter=Q(
+            appointments__status__in=Appointment.ACTIVE_STATUSES,
+            appointments__starts_at__gte=now
+        ))
+    ).values_list('id', 'specialization', 'load')
+    
+    loads = {}
+    specializations = {}
+    heaps = defaultdict(list)
+    for doctor_id, specialization, load in doctors:
+        loads[doctor_id] = load
+        specializations[doctor_id] = specialization.strip().lower()
+        heaps[None].append((load, doctor_id))
+        heaps[specializations[doctor_id]].append((load, doctor_id))
+    for heap in heaps.values():
+        heapq.heapify(heap)
+    
+    masks = load_day_masks(loads, {appointment.appointment_date for appointment in batch})
+    
+    assigned = []
+    before = []
+    for appointment in batch:
+        key = appointment.requested_specialization.strip().lower() or None
+        heap = heaps.get(key)
+        if not heap:
+            continue
+        
+        needed = appointment_mask(appointment.appointment_time, appointment.duration_minutes)
+        day = appointment.appointment_date
+        
+        def is_free(doctor_id):
+            open_mask, booked_mask = masks[(doctor_id, day)]
+            return open_mask & needed == needed and not booked_mask & needed
+        
+        doctor_id = _pop_free_doctor(heap, loads, is_free)
+        if doctor_id is None:
+            continue
+        
+        before.append(appointment.change_row())
+        appointment.doctor_id = doctor_id
+        appointment.updated_at = now
+        assigned.append(appointment)
+        
+        open_mask, booked_mask = masks[(doctor_id, day)]
+        masks[(doctor_id, day)] = (open_mask, booked_mask | needed)
+        loads[doctor_id] += 1
+        heapq.heappush(heaps[None], (loads[doctor_id], doctor_id))
+        heapq.heappush(heaps[specializations[doctor_id]], (loads[doctor_id], doctor_id))
+    
+    if assigned:
+        assigned = _save_assignments(assigned, before)
+    
+    return {
+        'assigned': len(assigned),
+        'unassigned': len(batch) - len(assigned),
+        'next_cursor': page['next_cursor'],
+    }
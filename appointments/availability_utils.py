@@ -0,0 +1,477 @@
+"""
+Slot availability index utilities
+
+Every doctor/day pair is summarised by a DoctorAvailability row holding a
+bitmap of working slots (expanded from the doctor's working-hours template)
+and a bitmap of booked slots. Slot ``n`` starts ``n * APPOINTMENT_SLOT_MINUTES``
+minutes after midnight, so a whole day is answered with a single row read.
+
+Doctors without a template work clinic hours. For a doctor with a template,
+a day whose open slots were never generated (past SCHEDULE_HORIZON_WEEKS, or
+while the generate_slots job is not running) counts as closed.
+"""
+import heapq
+import threading
+from collections import defaultdict
+from datetime import time, timedelta
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import Doctor, DoctorWorkingHours, DoctorLeave
+from .models import Appointment, DoctorAvailability
+
+
+def get_slot_minutes():
+    """Length of a single appointment slot in minutes"""
+    return getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30)
+
+
+def slot_index(value):
+    """
+    Get the slot number a time falls into
+
+    Args:
+        value: datetime.time instance
+
+    Returns:
+        int: Slot number counted from midnight
+    """
+    return (value.hour * 60 + value.minute) // get_slot_minutes()
+
+
+def slot_time(index):
+    """Get the start time of a slot number"""
+    minutes = index * get_slot_minutes()
+    return time(minutes // 60, minutes % 60)
+
+
+def clinic_slots():
+    """Range of slot numbers that fall inside clinic opening hours"""
+    slot_minutes = get_slot_minutes()
+    opening = getattr(settings, 'CLINIC_OPENING_HOUR', 9) * 60 // slot_minutes
+    closing = getattr(settings, 'CLINIC_CLOSING_HOUR', 18) * 60 // slot_minutes
+    return range(opening, closing)
+
+
+def slots_per_day():
+    """Number of slots in a whole day"""
+    return 24 * 60 // get_slot_minutes()
+
+
+def appointment_mask(start, duration_minutes):
+    """Bitmap of the slots an appointment occupies for its whole duration"""
+    first = slot_index(start)
+    last = -(-(_minutes(start) + duration_minutes) // get_slot_minutes())
+    return range_mask(first, min(max(last, first + 1), slots_per_day()))
+
+
+def range_mask(first, last):
+    """Bitmap with slots ``first`` up to (not including) ``last`` set"""
+    if last <= first:
+        return 0
+    return ((1 << last) - 1) ^ ((1 << first) - 1)
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def working_mask(start_time, end_time):
+    """Bitmap of the slots that fit entirely between two times"""
+    slot_minutes = get_slot_minutes()
+    first = -(-_minutes(start_time) // slot_minutes)
+    return range_mask(first, _minutes(end_time) // slot_minutes)
+
+
+def blocked_mask(start_time, end_time):
+    """Bitmap of the slots that overlap two times at all"""
+    if start_time is None or end_time is None:
+        return range_mask(0, slots_per_day())
+    slot_minutes = get_slot_minutes()
+    last = -(-_minutes(end_time) // slot_minutes)
+    return range_mask(_minutes(start_time) // slot_minutes, last)
+
+
+def clinic_mask():
+    """Bitmap of the slots inside clinic opening hours"""
+    slots = clinic_slots()
+    return range_mask(slots.start, slots.stop)
+
+
+def mask_to_bytes(mask):
+    """Encode an integer bitmap for storage"""
+    return mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+
+
+def bytes_to_mask(data):
+    """Decode a stored bitmap into an integer"""
+    return int.from_bytes(bytes(data or b''), 'little')
+
+
+def refresh_availability(keys):
+    """
+    Recompute the bitmap rows for a set of doctor/day pairs
+
+    Args:
+        keys: Iterable of (doctor_id, date) tuples; entries without a
+            doctor are ignored
+    """
+    masks = {(doctor_id, day): 0 for doctor_id, day in keys if doctor_id and day}
+    if not masks:
+        return
+
+    booked = Appointment.objects.filter(
+        doctor_id__in={doctor_id for doctor_id, _ in masks},
+        appointment_date__in={day for _, day in masks},
+        status__in=Appointment.ACTIVE_STATUSES
+    ).values_list('doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+
+    for doctor_id, day, start, duration_minutes in booked:
+        if (doctor_id, day) in masks:
+            masks[(doctor_id, day)] |= appointment_mask(start, duration_minutes)
+
+    DoctorAvailability.objects.bulk_create(
+        [
+            DoctorAvailability(doctor_id=doctor_id, date=day, booked_slots=mask_to_bytes(mask))
+            for (doctor_id, day), mask in masks.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['doctor', 'date'],
+        update_fields=['booked_slots'],
+    )
+
+
+def rebuild_availability(batch_size=1000):
+    """
+    Rebuild the whole availability index from the appointments table
+
+    Returns:
+        int: Number of doctor/day rows written
+    """
+    DoctorAvailability.objects.update(booked_slots=b'')
+
+    keys = Appointment.objects.filter(
+        doctor__isnull=False,
+        status__in=Appointment.ACTIVE_STATUSES
+    ).values_list('doctor_id', 'appointment_date').distinct().order_by()
+
+    batch = []
+    written = 0
+    for key in keys.iterator(chunk_size=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            refresh_availability(batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        refresh_availability(batch)
+        written += len(batch)
+
+    return written
+
+
+def booking_horizon():
+    """Last day open slots are generated for, and so the last bookable day"""
+    weeks = getattr(settings, 'SCHEDULE_HORIZON_WEEKS', 8)
+    return timezone.localdate() + timedelta(weeks=weeks) - timedelta(days=1)
+
+
+def generate_slots(doctor_ids=None, start_date=None, weeks=None, batch_size=1000):
+    """
+    Expand working-hour templates and leave into per-day open slot bitmaps
+
+    A weekday template is turned into one bitmap per weekday, leave into one
+    bitmap per day, and each day's open slots are their difference; no work is
+    done per slot. Doctors without a template get NULL (clinic hours).
+
+    Args:
+        doctor_ids: Doctors to generate for (default: all doctors)
+        start_date: First day to generate (default: today)
+        weeks: Number of weeks to generate (default: SCHEDULE_HORIZON_WEEKS)
+
+    Returns:
+        int: Number of doctor/day rows written
+    """
+    if doctor_ids is None:
+        doctor_ids = Doctor.objects.values_list('id', flat=True)
+    doctor_ids = list(doctor_ids)
+    start_date = start_date or timezone.localdate()
+    weeks = weeks or getattr(settings, 'SCHEDULE_HORIZON_WEEKS', 8)
+    end_date = start_date + timedelta(weeks=weeks) - timedelta(days=1)
+    days = [start_date + timedelta(days=offset) for offset in range(weeks * 7)]
+
+    weekday_masks = defaultdict(lambda: [0] * 7)
+    hours = DoctorWorkingHours.objects.filter(doctor_id__in=doctor_ids).values_list(
+        'doctor_id', 'weekday', 'start_time', 'end_time'
+    )
+    for doctor_id, weekday, start_time, end_time in hours:
+        weekday_masks[doctor_id][weekday] |= working_mask(start_time, end_time)
+
+    leave_masks = defaultdict(int)
+    leaves = DoctorLeave.objects.filter(
+        doctor_id__in=doctor_ids, start_date__lte=end_date, end_date__gte=start_date
+    ).values_list('doctor_id', 'start_date', 'end_date', 'start_time', 'end_time')
+    for doctor_id, first, last, start_time, end_time in leaves:
+        mask = blocked_mask(start_time, end_time)
+        day = max(first, start_date)
+        while day <= min(last, end_date):
+            leave_masks[(doctor_id, day)] |= mask
+            day += timedelta(days=1)
+
+    rows = []
+    for doctor_id in doctor_ids:
+        template = weekday_masks.get(doctor_id)
+        for day in days:
+            if template is None:
+                open_slots = None
+            else:
+                leave = leave_masks.get((doctor_id, day), 0)
+                open_slots = mask_to_bytes(template[day.weekday()] & ~leave)
+            rows.append(DoctorAvailability(doctor_id=doctor_id, date=day, open_slots=open_slots))
+
+    DoctorAvailability.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['doctor', 'date'],
+        update_fields=['open_slots'],
+    )
+    return len(rows)
+
+
+_pending_schedules = threading.local()
+
+
+def regenerate_slots_on_commit(doctor_id):
+    """
+    Regenerate a doctor's open slots once the current transaction commits
+
+    Schedule rows saved together (a week of working hours edited on the
+    admin page) share a single generate_slots call: the first callback to
+    run generates every pending doctor and the rest find nothing to do.
+    """
+    if not hasattr(_pending_schedules, 'doctor_ids'):
+        _pending_schedules.doctor_ids = set()
+    _pending_schedules.doctor_ids.add(doctor_id)
+    transaction.on_commit(_generate_pending_slots)
+
+
+def _generate_pending_slots():
+    doctor_ids = list(_pending_schedules.doctor_ids)
+    _pending_schedules.doctor_ids.clear()
+    if doctor_ids:
+        generate_slots(doctor_ids=doctor_ids)
+
+
+def templated_doctors(doctor_ids):
+    """
+    Doctors with a working-hours template
+
+    Returns:
+        set: Ids of the given doctors whose ungenerated days are closed
+    """
+    return set(
+        DoctorWorkingHours.objects.filter(doctor_id__in=set(doctor_ids))
+        .values_list('doctor_id', flat=True).distinct()
+    )
+
+
+def _open_mask(open_slots, templated):
+    """Working slots of a day; days never generated are closed for templated doctors"""
+    if open_slots is None:
+        return 0 if templated else clinic_mask()
+    return bytes_to_mask(open_slots)
+
+
+def slot_status(doctor_id, day, start):
+    """
+    Check a single slot against the index
+
+    Returns:
+        str: 'free', 'booked' (held by a pending or confirmed appointment)
+            or 'closed' (outside the doctor's working hours)
+    """
+    row = DoctorAvailability.objects.filter(
+        doctor_id=doctor_id, date=day
+    ).values_list('open_slots', 'booked_slots').first()
+    open_slots, booked_slots = row or (None, b'')
+
+    index = slot_index(start)
+    if bytes_to_mask(booked_slots) >> index & 1:
+        return 'booked'
+    # Only a day without generated slots depends on whether there is a template
+    templated = open_slots is None and bool(templated_doctors([doctor_id]))
+    if not _open_mask(open_slots, templated) >> index & 1:
+        return 'closed'
+    return 'free'
+
+
+def load_day_masks(doctor_ids, dates):
+    """
+    Read the open and booked bitmaps for many doctors and days at once
+
+    Args:
+        doctor_ids: Iterable of doctor primary keys
+        dates: Iterable of dates
+
+    Returns:
+        dict: Maps every (doctor_id, date) pair to an (open_mask, booked_mask)
+            tuple
+    """
+    doctor_ids, dates = set(doctor_ids), set(dates)
+    rows = {
+        (doctor_id, day): (open_slots, booked_slots)
+        for doctor_id, day, open_slots, booked_slots in DoctorAvailability.objects.filter(
+            doctor_id__in=doctor_ids, date__in=dates
+        ).values_list('doctor_id', 'date', 'open_slots', 'booked_slots')
+    }
+    templated = templated_doctors(doctor_ids)
+    masks = {}
+    for doctor_id in doctor_ids:
+        for day in dates:
+            open_slots, booked_slots = rows.get((doctor_id, day), (None, b''))
+            masks[(doctor_id, day)] = (
+                _open_mask(open_slots, doctor_id in templated), bytes_to_mask(booked_slots)
+            )
+    return masks
+
+
+def closed_dates(doctor_id, dates, start):
+    """
+    Find the dates on which a doctor does not work a given slot
+
+    Args:
+        doctor_id: Doctor primary key
+        dates: Iterable of dates to check
+        start: Slot start time
+
+    Returns:
+        set: Dates whose slot is outside the doctor's working hours
+    """
+    dates = list(dates)
+    open_slots = dict(
+        DoctorAvailability.objects.filter(
+            doctor_id=doctor_id, date__in=dates
+        ).values_list('date', 'open_slots')
+    )
+    templated = bool(templated_doctors([doctor_id]))
+    index = slot_index(start)
+    return {day for day in dates if not _open_mask(open_slots.get(day), templated) >> index & 1}
+
+
+def is_slot_free(doctor_id, day, start):
+    """Check whether a doctor works and is unbooked in a given slot"""
+    return slot_status(doctor_id, day, start) == 'free'
+
+
+def _set_bits(mask):
+    """Yield the set bit numbers of a bitmap, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _day_free_mask(open_slots, booked_slots, day, now, templated):
+    """Free slots of a day that have not started yet"""
+    if day < now.date():
+        return 0
+    mask = _open_mask(open_slots, templated) & ~bytes_to_mask(booked_slots)
+    if day == now.date():
+        # Drop slots starting at or before the current time
+        mask &= ~range_mask(0, slot_index(now.time()) + 1)
+    return mask
+
+
+def get_free_slots(doctor_id, start_date, end_date):
+    """
+    Get every free clinic slot for a doctor across a date range
+
+    Args:
+        doctor_id: Doctor primary key
+        start_date: First day (inclusive)
+        end_date: Last day (inclusive)
+
+    Returns:
+        dict: Maps each date to a list of free datetime.time slot starts
+    """
+    rows = {
+        day: (open_slots, booked_slots)
+        for day, open_slots, booked_slots in DoctorAvailability.objects.filter(
+            doctor_id=doctor_id, date__range=(start_date, end_date)
+        ).values_list('date', 'open_slots', 'booked_slots')
+    }
+
+    templated = bool(templated_doctors([doctor_id]))
+    now = timezone.localtime()
+    free_slots = {}
+    day = start_date
+    while day <= end_date:
+        open_slots, booked_slots = rows.get(day, (None, b''))
+        mask = _day_free_mask(open_slots, booked_slots, day, now, templated)
+        free_slots[day] = [slot_time(index) for index in _set_bits(mask)]
+        day += timedelta(days=1)
+
+    return free_slots
+
+
+def _free_slot_stream(doctor_id, mask):
+    """
+    Lazily yield a doctor's free slots of one day in time order
+
+    Yields:
+        tuple: (slot number, doctor_id)
+    """
+    for index in _set_bits(mask):
+        yield index, doctor_id
+
+
+def earliest_free_slots(doctor_ids, start_date, end_date, limit):
+    """
+    Find the earliest free slots across many doctors
+
+    Days are read one query at a time in date order and the walk stops as
+    soon as enough openings are found, so a busy horizon costs no more than
+    the days it actually has to look at. Within a day each doctor's free
+    slots form a sorted stream; heapq.merge keeps one pending slot per
+    doctor in a heap and pops the earliest, so only the slots actually
+    returned are ever decoded from the bitmaps. Ties at the same time go to
+    the lowest doctor id.
+
+    Args:
+        doctor_ids: Iterable of doctor primary keys
+        start_date: First day (inclusive)
+        end_date: Last day (inclusive)
+        limit: Number of openings to return
+
+    Returns:
+        list: (doctor_id, date, datetime.time) tuples, earliest first
+    """
+    doctor_ids = sorted(set(doctor_ids))
+    if not doctor_ids or limit <= 0:
+        return []
+
+    templated = templated_doctors(doctor_ids)
+    now = timezone.localtime()
+    openings = []
+    day = max(start_date, now.date())
+    while day <= end_date and len(openings) < limit:
+        rows = {
+            doctor_id: (open_slots, booked_slots)
+            for doctor_id, open_slots, booked_slots in DoctorAvailability.objects.filter(
+                doctor_id__in=doctor_ids, date=day
+            ).values_list('doctor_id', 'open_slots', 'booked_slots')
+        }
+        streams = [
+            _free_slot_stream(doctor_id, _day_free_mask(
+                *rows.get(doctor_id, (None, b'')), day, now, doctor_id in templated
+            ))
+            for doctor_id in doctor_ids
+        ]
+        openings += [
+            (doctor_id, day, slot_time(index))
+            for index, doctor_id in islice(heapq.merge(*streams), limit - len(openings))
+        ]
+        day += timedelta(days=1)
+    return openings
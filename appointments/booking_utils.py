@@ -0,0 +1,252 @@
+"""
+Appointment booking service
+
+Bookings are checked for overlaps with one indexed range query and written
+with a single atomic insert. The ``unique_doctor_appointment_slot`` constraint
+decides races: when two patients submit the same slot at once, the loser gets
+the usual "slot already booked" error instead of an unhandled IntegrityError.
+
+A new booking holds its slot for SLOT_HOLD_MINUTES while the patient pays;
+abandoned checkouts are cancelled by release_expired_holds.
+"""
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.db.models import Q
+from .models import Appointment, max_duration_minutes
+from .signals import appointments_bulk_changed
+from .availability_utils import closed_dates
+import calendar
+
+
+RECURRENCE_CHOICES = (
+    ('weekly', 'Weekly'),
+    ('biweekly', 'Every 2 weeks'),
+    ('monthly', 'Monthly'),
+)
+
+RECURRENCE_WEEKS = {'weekly': 1, 'biweekly': 2}
+
+
+def save_appointment(appointment, check_conflicts=True):
+    """
+    Save an appointment atomically, reporting slot clashes as ValidationError
+    
+    Args:
+        appointment: Appointment instance
+        check_conflicts: Run the overlap query first when the slot changed;
+            pass False to let the unique constraint alone decide
+        
+    Raises:
+        ValidationError: If the slot is already booked
+    """
+    try:
+        with transaction.atomic():
+            appointment.save(check_conflicts=check_conflicts)
+    except IntegrityError:
+        if appointment.doctor_id and Appointment.objects.filter(
+            doctor_id=appointment.doctor_id,
+            appointment_date=appointment.appointment_date,
+            appointment_time=appointment.appointment_time,
+            status__in=Appointment.ACTIVE_STATUSES
+        ).exists():
+            raise appointment.slot_conflict_error()
+        raise
+    return appointment
+
+
+def hold_deadline():
+    """Expiry time for a checkout hold starting now"""
+    return timezone.now() + timedelta(minutes=getattr(settings, 'SLOT_HOLD_MINUTES', 15))
+
+
+def extend_hold(appointment):
+    """
+    Restart the checkout hold of an unpaid booking
+    
+    Only a hold that is still running is extended, and never past
+    SLOT_HOLD_MAX_MINUTES after the booking, so a checkout page left open
+    cannot keep a slot forever. Appointments without a hold (already paid,
+    or booked before holds existed) are left alone.
+    
+    Returns:
+        bool: True if the hold was extended
+    """
+    if appointment.hold_expires_at is None:
+        return False
+    now = timezone.now()
+    deadline = min(
+        hold_deadline(),
+        appointment.created_at + timedelta(minutes=getattr(settings, 'SLOT_HOLD_MAX_MINUTES', 45))
+    )
+    extended = Appointment.objects.filter(
+        pk=appointment.pk, status='pending', hold_expires_at__gt=now, hold_expires_at__lt=deadline
+    ).update(hold_expires_at=deadline, updated_at=now)
+    if extended:
+        appointment.hold_expires_at = deadline
+        appointment.updated_at = now
+    return bool(extended)
+
+
+def release_expired_holds(backfill=True, **filters):
+    """
+    Cancel unpaid bookings whose checkout hold has expired
+    
+    Args:
+        backfill: Offer the released slots to the waitlist
+        **filters: Extra Appointment filters, e.g. to release a single slot
+        
+    Returns:
+        int: Number of appointments released
+    """
+    return Appointment.objects.filter(
+        status='pending',
+        hold_expires_at__lte=timezone.now(),
+        **filters
+    ).exclude(payment_status='paid').synced_update(
+        backfill=backfill, status='cancelled', hold_expires_at=None
+    )
+
+
+def book_appointment_slot(appointment):
+    """
+    Book a new appointment with a single atomic insert
+    
+    Overlapping appointments are rejected up front; a booking racing another
+    one for the same start is rejected by the unique constraint. The booking
+    holds its slot until checkout completes or the hold expires.
+    A slot blocked only by an expired hold is released and retried once;
+    the released slot is not offered to the waitlist, since this booking
+    takes it.
+    
+    Args:
+        appointment: Unsaved Appointment instance
+        
+    Returns:
+        Appointment: The saved appointment
+        
+    Raises:
+        ValidationError: If the slot is already booked
+    """
+    appointment.hold_expires_at = hold_deadline()
+    try:
+        return save_appointment(appointment)
+    except ValidationError:
+        released = release_expired_holds(
+            backfill=False,
+            doctor_id=appointment.doctor_id,
+            appointment_date=appointment.appointment_date,
+            appointment_time=appointment.appointment_time,
+        )
+        if not released:
+            raise
+        return save_appointment(appointment)
+
+
+def recurrence_dates(first_date, frequency, occurrences):
+    """
+    Expand a recurrence rule into appointment dates
+    
+    Args:
+        first_date: Date of the first appointment
+        frequency: One of the keys of RECURRENCE_CHOICES
+        occurrences: Number of appointments in the series
+        
+    Returns:
+        list: Dates of the series, starting with first_date
+    """
+    if frequency == 'monthly':
+        dates = []
+        for offset in range(occurrences):
+            month_index = first_date.month - 1 + offset
+            year, month = first_date.year + month_index // 12, month_index % 12 + 1
+            day = min(first_date.day, calendar.monthrange(year, month)[1])
+            dates.append(date(year, month, day))
+        return dates
+    
+    step = timedelta(weeks=RECURRENCE_WEEKS[frequency])
+    return [first_date + step * offset for offset in range(occurrences)]
+
+
+def book_recurring_appointments(appointment, frequency, occurrences):
+    """
+    Book a series of appointments copying ``appointment`` on every recurrence
+    
+    The whole series is checked against existing appointments with one query,
+    and every accepted occurrence is inserted with one bulk_create. Only the
+    first occurrence goes through checkout, so only it gets a slot hold;
+    follow-ups are paid per visit.
+    
+    Args:
+        appointment: Unsaved Appointment holding the first occurrence
+        frequency: One of the keys of RECURRENCE_CHOICES
+        occurrences: Number of appointments in the series
+        
+    Returns:
+        tuple: (list of booked appointments, dict mapping skipped dates to the reason)
+        
+    Raises:
+        ValidationError: If no date of the series can be booked
+    """
+    dates = recurrence_dates(appointment.appointment_date, frequency, occurrences)
+    
+    series = {}
+    for day in dates:
+        occurrence = Appointment(
+            patient=appointment.patient,
+            doctor=appointment.doctor,
+            appointment_date=day,
+            appointment_time=appointment.appointment_time,
+            duration_minutes=appointment.duration_minutes,
+            symptoms=appointment.symptoms,
+            requested_specialization=appointment.requested_specialization,
+            payment_amount=appointment.payment_amount,
+        )
+        # bulk_create skips save(), so derive starts_at and ends_at here
+        occurrence.update_schedule()
+        series[day] = occurrence
+    
+    skipped = {}
+    if appointment.doctor_id:
+        overlaps = Q()
+        for occurrence in series.values():
+            overlaps |= Q(starts_at__range=(
+                occurrence.starts_at - timedelta(minutes=max_duration_minutes()), occurrence.ends_at
+            ))
+        booked = list(
+            Appointment.objects.filter(
+                overlaps,
+                doctor_id=appointment.doctor_id,
+                status__in=Appointment.ACTIVE_STATUSES
+            ).values_list('starts_at', 'ends_at')
+        )
+        closed = closed_dates(appointment.doctor_id, dates, appointment.appointment_time)
+        for day, occurrence in series.items():
+            if any(start < occurrence.ends_at and end > occurrence.starts_at for start, end in booked):
+                skipped[day] = 'already booked'
+            elif day in closed:
+                skipped[day] = 'doctor not available'
+    
+    accepted = [occurrence for day, occurrence in series.items() if day not in skipped]
+    if not accepted:
+        raise ValidationError(
+            'None of the dates in this series are available: '
+            + '; '.join(f'{day:%d %b %Y} ({reason})' for day, reason in skipped.items())
+        )
+    accepted[0].hold_expires_at = hold_deadline()
+    
+    # bulk_create sends no post_save; announce the rows in the same
+    # transaction so the availability index and counters commit with them
+    with transaction.atomic():
+        try:
+            created = Appointment.objects.bulk_create(accepted)
+        except IntegrityError:
+            raise ValidationError(
+                'Some dates in this series were booked by someone else just now. Please try again.'
+            )
+        appointments_bulk_changed.send(
+            sender=Appointment, before=[], after=[occurrence.change_row() for occurrence in created]
+        )
+    return created, skipped
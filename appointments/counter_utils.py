@@ -0,0 +1,143 @@
+"""
+Dashboard counter utilities
+
+Dashboards read pre-aggregated counts from DashboardCounter rows instead of
+running COUNT(*) queries. Every write works out which counters it moves
+(see signals.py) and applies the difference; rebuild_counters() recomputes
+the whole table from the source tables.
+"""
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from accounts.models import Doctor, Patient
+from .models import Appointment, DashboardCounter
+
+
+# Global counter name for each profile model
+PROFILE_COUNTERS = {Doctor: 'doctors', Patient: 'patients'}
+
+
+def appointment_keys(row):
+    """
+    Counters an appointment row contributes one to
+
+    Args:
+        row: Dict with patient_id, doctor_id and status (see change_row)
+
+    Returns:
+        list: (scope, scope_id, name) tuples
+    """
+    scopes = [('global', 0)]
+    if row.get('doctor_id'):
+        scopes.append(('doctor', row['doctor_id']))
+    if row.get('patient_id'):
+        scopes.append(('patient', row['patient_id']))
+
+    keys = []
+    for scope, scope_id in scopes:
+        keys.append((scope, scope_id, 'appointments'))
+        keys.append((scope, scope_id, f"appointments_{row.get('status')}"))
+    return keys
+
+
+def profile_keys(model, verified):
+    """Counters a doctor or patient profile contributes one to"""
+    name = PROFILE_COUNTERS[model]
+    keys = [('global', 0, name)]
+    if not verified:
+        keys.append(('global', 0, f'{name}_unverified'))
+    return keys
+
+
+def counter_deltas(removed, added):
+    """
+    Net change to each counter when some contributions go away and others appear
+
+    Args:
+        removed: Iterable of counter keys to decrement
+        added: Iterable of counter keys to increment
+
+    Returns:
+        dict: Maps counter keys to non-zero deltas
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def apply_counter_deltas(deltas):
+    """
+    Add deltas to the counters table
+
+    Each counter is bumped with a single ``UPDATE ... SET value = value + n``;
+    counters seen for the first time are inserted.
+    """
+    if not deltas:
+        return
+    with transaction.atomic():
+        for (scope, scope_id, name), delta in sorted(deltas.items()):
+            counter = DashboardCounter.objects.filter(scope=scope, scope_id=scope_id, name=name)
+            if counter.update(value=F('value') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    DashboardCounter.objects.create(scope=scope, scope_id=scope_id, name=name, value=delta)
+            except IntegrityError:
+                # Another request created it first
+                counter.update(value=F('value') + delta)
+
+
+def get_counters(scope, scope_id=0):
+    """
+    Read every counter of a scope with one indexed lookup
+
+    Returns:
+        Counter: Maps counter names to values; missing counters read as 0
+    """
+    return Counter(dict(
+        DashboardCounter.objects.filter(scope=scope, scope_id=scope_id).values_list('name', 'value')
+    ))
+
+
+def rebuild_counters():
+    """
+    Recompute the whole counters table from appointments, doctors and patients
+
+    Returns:
+        int: Number of counters written
+    """
+    totals = Counter()
+
+    grouped = Appointment.objects.values('patient_id', 'doctor_id', 'status').annotate(
+        total=Count('id')
+    ).order_by()
+    for row in grouped:
+        for key in appointment_keys(row):
+            totals[key] += row['total']
+
+    for model in PROFILE_COUNTERS:
+        for row in model.objects.values('verified').annotate(total=Count('id')).order_by():
+            for key in profile_keys(model, row['verified']):
+                totals[key] += row['total']
+
+    with transaction.atomic():
+        DashboardCounter.objects.all().delete()
+        DashboardCounter.objects.bulk_create([
+            DashboardCounter(scope=scope, scope_id=scope_id, name=name, value=value)
+            for (scope, scope_id, name), value in totals.items()
+        ])
+    return len(totals)
+
+
+def verify_profiles(queryset):
+    """
+    Verify doctor or patient profiles in bulk, keeping the counters in sync
+
+    Returns:
+        int: Number of profiles that were newly verified
+    """
+    name = PROFILE_COUNTERS[queryset.model]
+    with transaction.atomic():
+        verified = queryset.filter(verified=False).update(verified=True)
+        apply_counter_deltas({('global', 0, f'{name}_unverified'): -verified} if verified else {})
+    return verified
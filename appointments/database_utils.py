@@ -0,0 +1,135 @@
+"""
+Database connection tuning and routing
+
+SQLite connections are tuned with the SQLITE_PRAGMAS setting as soon as
+Django opens them (see apps.py). Other backends are left alone; their
+persistent connections are configured in DATABASES.
+
+When a ``replica`` database is configured, views wrapped in replica_reads()
+read from it while every write goes to the primary. A browser that has just
+sent a POST is pinned to the primary for REPLICA_PIN_SECONDS, so the page it
+is redirected to already shows its own change (see PrimaryPinMiddleware).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB = 'replica'
+
+# Cookie marking a browser that wrote recently
+PIN_COOKIE = 'primary_pin'
+
+# Unsafe HTTP methods never read from the replica and pin the browser afterwards
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned = ContextVar('primary_pinned', default=False)
+
+
+def sqlite_pragmas():
+    """Pragmas to apply to new SQLite connections, as a name -> value dict"""
+    return getattr(settings, 'SQLITE_PRAGMAS', {})
+
+
+def pragma_statements(pragmas):
+    """
+    Turn a pragma dict into SQL statements
+
+    Args:
+        pragmas: Dict mapping pragma names to values
+
+    Returns:
+        list: ``PRAGMA name = value`` statements
+    """
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying SQLITE_PRAGMAS to SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(sqlite_pragmas()):
+            cursor.execute(statement)
+
+
+def replica_configured():
+    """Whether a replica database alias is defined"""
+    return REPLICA_DB in connections
+
+
+@contextmanager
+def reading_from_replica():
+    """Send reads made inside the block to the replica, unless pinned to the primary"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """
+    Decorator for read-only views: serve their GET requests from the replica
+
+    Other methods keep reading from the primary, so a view that also handles
+    form posts validates against current data.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with reading_from_replica():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class PrimaryPinMiddleware:
+    """
+    Read-your-writes for replica routing
+
+    After a POST (or any unsafe method), the browser gets a short-lived
+    cookie; requests carrying it read from the primary, which covers the
+    redirect that follows a booking.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax'
+            )
+        return response
+
+
+class PrimaryReplicaRouter:
+    """Route replica_reads() reads to the replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _pinned.get() and replica_configured():
+            return REPLICA_DB
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Also covers saving an instance that was read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema through replication
+        return db != REPLICA_DB
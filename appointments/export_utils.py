@@ -0,0 +1,226 @@
+"""
+Streaming CSV and XLSX exports
+
+Rows are read with ``values_list().iterator()`` in chunks of
+EXPORT_CHUNK_SIZE and written out as they arrive, so an export holds one
+chunk in memory however many rows it has. XLSX files are zip archives;
+``zipfile`` writes them to a stream without seeking back, and each
+worksheet row uses inline strings so nothing has to be collected first.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .api_utils import full_name
+
+
+# (column header, model field name or expression)
+APPOINTMENT_COLUMNS = [
+    ('ID', 'id'),
+    ('Patient', full_name('patient__user')),
+    ('Patient Contact', F('patient__contact')),
+    ('Doctor', full_name('doctor__user')),
+    ('Specialization', F('doctor__specialization')),
+    ('Date', 'appointment_date'),
+    ('Time', 'appointment_time'),
+    ('Duration (min)', 'duration_minutes'),
+    ('Status', 'status'),
+    ('Payment Status', 'payment_status'),
+    ('Amount', 'payment_amount'),
+    ('Symptoms', 'symptoms'),
+    ('Invoice ID', F('invoice__id')),
+    ('Created', 'created_at'),
+]
+
+INVOICE_COLUMNS = [
+    ('Invoice ID', 'id'),
+    ('Appointment ID', 'appointment_id'),
+    ('Patient', full_name('appointment__patient__user')),
+    ('Doctor', full_name('appointment__doctor__user')),
+    ('Appointment Date', F('appointment__appointment_date')),
+    ('Amount', 'amount'),
+    ('Payment Status', 'payment_status'),
+    ('Payment ID', 'payment_id'),
+    ('Payment Date', 'payment_date'),
+    ('Generated', 'generated_date'),
+]
+
+# Characters XML 1.0 does not allow, even escaped
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Leading characters that make spreadsheet apps run a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_rows(queryset, columns):
+    """
+    Stream a queryset as tuples in column order
+
+    Args:
+        queryset: QuerySet to export; its ordering is kept
+        columns: Column list such as APPOINTMENT_COLUMNS
+
+    Yields:
+        tuple: One row of values per record
+    """
+    names = []
+    expressions = {}
+    for position, (header, source) in enumerate(columns):
+        if isinstance(source, str):
+            names.append(source)
+        else:
+            names.append(f'export_{position}')
+            expressions[f'export_{position}'] = source
+    rows = queryset.annotate(**expressions).values_list(*names)
+    yield from rows.iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+
+
+def format_value(value, escape_formulas=True):
+    """
+    Plain text for a cell: local time for timestamps, '' for missing values
+
+    Text starting like a formula (e.g. symptoms typed as "=HYPERLINK(...)")
+    gets a leading apostrophe so spreadsheets show it as text. XLSX inline
+    strings are never evaluated and pass escape_formulas=False.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    if escape_formulas and isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return str(value)
+
+
+class _Pipe:
+    """Write-only file object that hands its contents to a generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(chunk if isinstance(chunk, bytes) else chunk.encode() for chunk in self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_csv(queryset, columns):
+    """
+    Generate a CSV export in chunks
+
+    Yields:
+        bytes: UTF-8 CSV text (with a BOM so spreadsheet apps detect UTF-8)
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    pipe = _Pipe()
+    writer = csv.writer(pipe)
+    pipe.write('\ufeff')
+    writer.writerow([header for header, source in columns])
+    for count, row in enumerate(export_rows(queryset, columns), start=1):
+        writer.writerow([format_value(value) for value in row])
+        if count % chunk_size == 0:
+            yield pipe.drain()
+    yield pipe.drain()
+
+
+def _column_letter(index):
+    """Spreadsheet column name of a zero-based index: 0 -> A, 26 -> AA"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _xlsx_row(number, values):
+    """One <row> of a worksheet; numbers stay numeric, everything else is an inline string"""
+    cells = []
+    for index, value in enumerate(values):
+        reference = f'{_column_letter(index)}{number}'
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+        elif value is not None:
+            text = escape(INVALID_XML_CHARS.sub('', format_value(value, escape_formulas=False)))
+            cells.append(f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return f'<row r="{number}">{"".join(cells)}</row>'
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def stream_xlsx(queryset, columns, sheet_name):
+    """
+    Generate a single-sheet XLSX export in chunks
+
+    Yields:
+        bytes: Pieces of the zip archive, in order
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name={quoteattr(sheet_name)} sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield pipe.drain()
+
+        # Size unknown up front: force ZIP64 so sheets past 4 GB stay valid
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row(1, [header for header, source in columns])
+            ).encode())
+            lines = []
+            for number, row in enumerate(export_rows(queryset, columns), start=2):
+                lines.append(_xlsx_row(number, row))
+                if len(lines) == chunk_size:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    yield pipe.drain()
+            sheet.write((''.join(lines) + '</sheetData></worksheet>').encode())
+    yield pipe.drain()
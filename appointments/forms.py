@@ -1,16 +1,25 @@
 from django import forms
-from .models import Appointment
+from .models import Appointment, Invoice, local_start
+from .availability_utils import get_slot_minutes, slot_index, slot_status, clinic_mask, booking_horizon
+from .booking_utils import RECURRENCE_CHOICES
 from accounts.models import Doctor
+from accounts.directory_utils import doctor_choices, specialization_choices
+from django.conf import settings
 import datetime
 
 
 class AppointmentForm(forms.ModelForm):
     """Appointment booking form"""
     doctor = forms.ModelChoiceField(
-        queryset=Doctor.objects.filter(verified=True),
+        queryset=Doctor.objects.filter(verified=True).select_related('user'),
         required=False,
         empty_label="Select a doctor (optional)"
     )
+    requested_specialization = forms.ChoiceField(
+        required=False,
+        label="Specialization",
+        help_text="If you do not pick a doctor, we will assign one with this specialization"
+    )
     appointment_date = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date', 'min': datetime.date.today().isoformat()}),
         help_text="Select appointment date"
@@ -19,10 +28,22 @@ class AppointmentForm(forms.ModelForm):
         widget=forms.TimeInput(attrs={'type': 'time'}),
         help_text="Select appointment time"
     )
+    repeat = forms.ChoiceField(
+        choices=(('', 'Does not repeat'),) + RECURRENCE_CHOICES,
+        required=False,
+        help_text="Book a series of follow-up appointments"
+    )
+    occurrences = forms.IntegerField(
+        min_value=1,
+        max_value=getattr(settings, 'RECURRING_MAX_OCCURRENCES', 12),
+        initial=1,
+        required=False,
+        help_text="Number of appointments in the series"
+    )
     
     class Meta:
         model = Appointment
-        fields = ('doctor', 'appointment_date', 'appointment_time', 'symptoms')
+        fields = ('doctor', 'requested_specialization', 'appointment_date', 'appointment_time', 'symptoms')
         widgets = {
             'doctor': forms.Select(attrs={'class': 'form-control'}),
             'symptoms': forms.Textarea(attrs={'class': 'form-control', 'rows': 4, 'placeholder': 'Describe your symptoms...'}),
@@ -31,15 +52,59 @@ class AppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['doctor'].widget.attrs.update({'class': 'form-control'})
-        self.fields['appointment_date'].widget.attrs.update({'class': 'form-control'})
-        self.fields['appointment_time'].widget.attrs.update({'class': 'form-control'})
+        self.fields['appointment_date'].widget.attrs.update({
+            'class': 'form-control',
+            'max': booking_horizon().isoformat(),
+        })
+        self.fields['appointment_time'].widget.attrs.update({
+            'class': 'form-control',
+            'step': get_slot_minutes() * 60,
+        })
+        # Choices come from the cached directory; only a submitted doctor is
+        # looked up, to validate it
+        self.fields['doctor'].choices = [('', self.fields['doctor'].empty_label)] + doctor_choices()
+        self.fields['requested_specialization'].choices = [('', 'Any specialization')] + [
+            (specialization, specialization) for specialization in specialization_choices()
+        ]
+        self.fields['requested_specialization'].widget.attrs.update({'class': 'form-control'})
+        self.fields['repeat'].widget.attrs.update({'class': 'form-control'})
+        self.fields['occurrences'].widget.attrs.update({'class': 'form-control'})
+        # The booking service checks the slot when it saves (book_appointment_slot)
+        self.instance.defer_conflict_check = True
 
     def clean_appointment_date(self):
         date = self.cleaned_data.get('appointment_date')
         if date and date < datetime.date.today():
             raise forms.ValidationError("Appointment date cannot be in the past.")
+        # Doctors' working hours are only generated this far ahead
+        if date and date > booking_horizon():
+            raise forms.ValidationError(f"Appointments can only be booked up to {booking_horizon():%d %b %Y}.")
         return date
 
+    def clean_appointment_time(self):
+        time = self.cleaned_data.get('appointment_time')
+        slot_minutes = get_slot_minutes()
+        if time and (time.second or (time.hour * 60 + time.minute) % slot_minutes):
+            raise forms.ValidationError(f"Please choose a time on a {slot_minutes}-minute slot boundary.")
+        return time
+
+    def clean(self):
+        cleaned_data = super().clean()
+        doctor = cleaned_data.get('doctor')
+        date = cleaned_data.get('appointment_date')
+        time = cleaned_data.get('appointment_time')
+        
+        # Only offer slots the doctor (or, unassigned, the clinic) actually works
+        if date and time:
+            if doctor and slot_status(doctor.id, date, time) == 'closed':
+                self.add_error(
+                    'appointment_time',
+                    f'Dr. {doctor.user.get_full_name()} is not available at this time. Please choose another slot.'
+                )
+            elif not doctor and not clinic_mask() >> slot_index(time) & 1:
+                self.add_error('appointment_time', 'Please choose a time within clinic hours.')
+        return cleaned_data
+
 
 class AppointmentUpdateForm(forms.ModelForm):
     """Form for admin to update appointment"""
@@ -57,3 +122,98 @@ class AppointmentUpdateForm(forms.ModelForm):
             'status': forms.Select(attrs={'class': 'form-control'}),
             'doctor': forms.Select(attrs={'class': 'form-control'}),
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctor'].choices = [('', self.fields['doctor'].empty_label)] + doctor_choices()
+
+
+class WaitlistForm(forms.Form):
+    """Form for patients to wait for a cancellation on a fully booked day"""
+    doctor = forms.ModelChoiceField(queryset=Doctor.objects.filter(verified=True).select_related('user'))
+    appointment_date = forms.DateField()
+    symptoms = forms.CharField(widget=forms.Textarea)
+
+    def clean_appointment_date(self):
+        date = self.cleaned_data.get('appointment_date')
+        if date and date < datetime.date.today():
+            raise forms.ValidationError("Appointment date cannot be in the past.")
+        # Doctors' working hours are only generated this far ahead
+        if date and date > booking_horizon():
+            raise forms.ValidationError(f"Appointments can only be booked up to {booking_horizon():%d %b %Y}.")
+        return date
+
+
+class AppointmentFilterForm(forms.Form):
+    """Filters for the admin appointment manager"""
+    search = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Symptoms, patient or doctor...'})
+    )
+    status = forms.ChoiceField(
+        choices=(('', 'Any status'),) + Appointment.STATUS_CHOICES,
+        required=False
+    )
+    doctor = forms.ModelChoiceField(
+        queryset=Doctor.objects.select_related('user'),
+        required=False,
+        empty_label="Any doctor"
+    )
+    date_from = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    payment_status = forms.ChoiceField(
+        choices=(('', 'Any payment status'),) + Appointment.PAYMENT_STATUS_CHOICES,
+        required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            if isinstance(field.widget, forms.Select):
+                field.widget.attrs.update({'class': 'form-select form-select-sm'})
+            else:
+                field.widget.attrs.update({'class': 'form-control form-control-sm'})
+
+    def filter(self, queryset):
+        """
+        Apply the submitted filters to an appointment queryset
+
+        Invalid filters are ignored so a bad query string never hides the list.
+        """
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['status']:
+            queryset = queryset.filter(status=data['status'])
+        if data['doctor']:
+            queryset = queryset.filter(doctor=data['doctor'])
+        if data['date_from']:
+            queryset = queryset.filter(appointment_date__gte=data['date_from'])
+        if data['date_to']:
+            queryset = queryset.filter(appointment_date__lte=data['date_to'])
+        if data['payment_status']:
+            queryset = queryset.filter(payment_status=data['payment_status'])
+        return queryset
+
+
+class InvoiceFilterForm(forms.Form):
+    """Filters for invoice exports"""
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    payment_status = forms.ChoiceField(
+        choices=(('', 'Any payment status'),) + Invoice.PAYMENT_STATUS_CHOICES,
+        required=False
+    )
+
+    def filter(self, queryset):
+        """Apply the submitted filters (on the generation date) to an invoice queryset"""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['date_from']:
+            queryset = queryset.filter(generated_date__gte=local_start(data['date_from']))
+        if data['date_to']:
+            queryset = queryset.filter(generated_date__lt=local_start(data['date_to'] + datetime.timedelta(days=1)))
+        if data['payment_status']:
+            queryset = queryset.filter(payment_status=data['payment_status'])
+        return queryset
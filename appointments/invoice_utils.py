@@ -0,0 +1,256 @@
+"""
+Invoice creation shared by the admin pages, the JSON API and the
+generate_invoices batch command
+
+PDFs requested from the web are not rendered in the request. They are
+queued as InvoiceJob rows and rendered by the process_invoice_jobs worker;
+a partial unique index keeps at most one active job per invoice, so
+concurrent downloads share a single render.
+"""
+from decimal import Decimal, InvalidOperation
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import Appointment, Invoice, InvoiceJob
+from .utils import generate_invoice_pdf
+
+
+# Consultation fee used when no amount is given
+DEFAULT_INVOICE_AMOUNT = Decimal('500')
+
+# Amounts must stay below this to fit Invoice.amount (10 digits, 2 decimal places)
+MAX_INVOICE_AMOUNT = Decimal(10 ** 8)
+
+
+def parse_invoice_amount(value):
+    """
+    Validate an invoice amount given by an admin
+
+    Args:
+        value: Amount as submitted (string or number)
+
+    Returns:
+        Decimal: The amount rounded to cents, or None unless it is a
+            positive number below MAX_INVOICE_AMOUNT
+    """
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or not 0 < amount < MAX_INVOICE_AMOUNT:
+        return None
+    return amount
+
+
+def invoice_blocker(appointment):
+    """
+    Explain why an appointment cannot be invoiced yet
+
+    Returns:
+        str: User-facing reason, or None if an invoice can be generated
+    """
+    if appointment.status not in ('confirmed', 'completed'):
+        return 'Can only generate invoice for confirmed or completed appointments.'
+    if not appointment.doctor_id:
+        return 'Please assign a doctor before generating invoice.'
+    return None
+
+
+def create_invoice(appointment, amount=DEFAULT_INVOICE_AMOUNT):
+    """
+    Create an appointment's invoice and queue its PDF
+
+    Args:
+        appointment: Appointment without an invoice (see invoice_blocker)
+        amount: Decimal amount billed
+
+    Returns:
+        Invoice: The saved invoice
+
+    Raises:
+        IntegrityError: If the appointment was invoiced in the meantime;
+            the caller's transaction is left usable
+    """
+    with transaction.atomic():
+        invoice = Invoice.objects.create(appointment=appointment, amount=amount)
+    request_invoice_pdf(invoice)
+    return invoice
+
+
+def request_invoice_pdf(invoice):
+    """
+    Queue an invoice's PDF, or join the job already rendering it
+
+    Returns:
+        InvoiceJob: The invoice's queued or running job (or, if that job
+            finished in the meantime, its latest job)
+    """
+    job = invoice.jobs.filter(status__in=InvoiceJob.ACTIVE_STATUSES).first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return InvoiceJob.objects.create(invoice=invoice)
+    except IntegrityError:
+        # Another request queued it between our check and insert
+        return invoice.jobs.latest('id')
+
+
+def invoice_pdf_status(invoice):
+    """
+    Where an invoice's PDF stands, for the download page and its polling
+
+    Returns:
+        str: 'ready', 'queued', 'running', 'failed' or 'missing' (never queued)
+    """
+    if invoice.pdf_file:
+        return 'ready'
+    job = invoice.jobs.order_by('-id').first()
+    if job is None:
+        return 'missing'
+    # A done job means the PDF was stored after this invoice was loaded
+    return 'ready' if job.status == 'done' else job.status
+
+
+def claim_invoice_job():
+    """
+    Take the oldest queued job for this worker
+
+    The claim is a conditional UPDATE, so when several workers race for the
+    same row only one of them gets it. A job that has already been tried
+    waits INVOICE_JOB_RETRY_SECONDS after its last attempt.
+
+    Returns:
+        InvoiceJob: The running job, or None if no job is ready
+    """
+    retry_seconds = getattr(settings, 'INVOICE_JOB_RETRY_SECONDS', 30)
+    while True:
+        job = InvoiceJob.objects.filter(status='queued').filter(
+            Q(attempts=0) | Q(updated_at__lte=timezone.now() - timedelta(seconds=retry_seconds))
+        ).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        claimed = InvoiceJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running', attempts=F('attempts') + 1, updated_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_invoice_job(job):
+    """
+    Render and store a claimed job's PDF
+
+    A failed render is queued again (see claim_invoice_job for the retry
+    delay) until it has been tried INVOICE_JOB_MAX_ATTEMPTS times, then
+    marked failed.
+
+    Returns:
+        bool: True if the invoice now has its PDF
+    """
+    try:
+        invoice = Invoice.objects.select_related(
+            'appointment__patient__user', 'appointment__doctor__user'
+        ).get(pk=job.invoice_id)
+        if not invoice.pdf_file:
+            pdf_content = generate_invoice_pdf(invoice)
+            invoice.pdf_file.save(f'invoice_{invoice.id}.pdf', ContentFile(pdf_content), save=False)
+            Invoice.objects.filter(pk=invoice.pk).update(pdf_file=invoice.pdf_file.name)
+    except Exception as error:
+        max_attempts = getattr(settings, 'INVOICE_JOB_MAX_ATTEMPTS', 3)
+        InvoiceJob.objects.filter(pk=job.pk).update(
+            status='queued' if job.attempts < max_attempts else 'failed',
+            error=f'{type(error).__name__}: {error}',
+            updated_at=timezone.now(),
+        )
+        return False
+    InvoiceJob.objects.filter(pk=job.pk).update(status='done', error='', updated_at=timezone.now())
+    return True
+
+
+def requeue_stale_invoice_jobs():
+    """
+    Queue again the running jobs whose worker died mid-render
+
+    Jobs that have already used INVOICE_JOB_MAX_ATTEMPTS are marked failed.
+
+    Returns:
+        int: Number of jobs requeued
+    """
+    timeout = getattr(settings, 'INVOICE_JOB_TIMEOUT_SECONDS', 300)
+    max_attempts = getattr(settings, 'INVOICE_JOB_MAX_ATTEMPTS', 3)
+    now = timezone.now()
+    stale = InvoiceJob.objects.filter(status='running', updated_at__lt=now - timedelta(seconds=timeout))
+    stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='Worker stopped before finishing', updated_at=now
+    )
+    return stale.update(status='queued', updated_at=now)
+
+
+def uninvoiced_appointments(statuses=('completed',), date_from=None, date_to=None):
+    """
+    Appointments that could be invoiced but have no invoice yet
+
+    Args:
+        statuses: Appointment statuses to include
+        date_from: Optional first appointment date
+        date_to: Optional last appointment date
+    """
+    queryset = Appointment.objects.filter(
+        status__in=statuses, doctor__isnull=False, invoice__isnull=True
+    )
+    if date_from:
+        queryset = queryset.filter(appointment_date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(appointment_date__lte=date_to)
+    return queryset
+
+
+def create_invoice_batch(appointments):
+    """
+    Create invoices (without PDFs yet) for a batch of appointments
+
+    Each invoice bills the appointment's payment_amount. Appointments
+    invoiced in the meantime, e.g. from the admin page, are skipped.
+
+    Args:
+        appointments: Appointments loaded with patient, doctor and users
+
+    Returns:
+        list: Saved invoices with their appointment attached
+    """
+    with transaction.atomic():
+        taken = set(Invoice.objects.filter(
+            appointment__in=appointments
+        ).values_list('appointment_id', flat=True))
+        invoices = [
+            Invoice(appointment=appointment, amount=appointment.payment_amount)
+            for appointment in appointments if appointment.id not in taken
+        ]
+        Invoice.objects.bulk_create(invoices)
+        if invoices and invoices[0].pk is None:
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(Invoice.objects.filter(
+                appointment__in=[invoice.appointment for invoice in invoices]
+            ).values_list('appointment_id', 'id'))
+            for invoice in invoices:
+                invoice.pk = ids[invoice.appointment_id]
+    return invoices
+
+
+def attach_pdfs(invoices, pdfs):
+    """
+    Store rendered PDFs and record them on their invoices with one UPDATE
+
+    Args:
+        invoices: Invoices from create_invoice_batch
+        pdfs: PDF bytes in the same order
+    """
+    for invoice, pdf in zip(invoices, pdfs):
+        invoice.pdf_file.save(f'invoice_{invoice.id}.pdf', ContentFile(pdf), save=False)
+    Invoice.objects.bulk_update(invoices, ['pdf_file'])
+
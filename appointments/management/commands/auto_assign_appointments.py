@@ -0,0 +1,43 @@
+"""
+Django management command to assign doctors to unassigned appointments
+Usage: python manage.py auto_assign_appointments [--batch-size N]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from appointments.assignment_utils import auto_assign_appointments
+
+
+class Command(BaseCommand):
+    help = 'Assign verified doctors to unassigned upcoming appointments by load, specialization and availability'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'AUTO_ASSIGN_BATCH_SIZE', 500),
+                            help='Appointments assigned per bulk update')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.stdout.write(self.style.SUCCESS('Assigning doctors to unassigned appointments...'))
+        
+        assigned = unassigned = 0
+        cursor = None
+        while True:
+            result = auto_assign_appointments(after=cursor, batch_size=options['batch_size'])
+            assigned += result['assigned']
+            unassigned += result['unassigned']
+            cursor = result['next_cursor']
+            if cursor is None:
+                break
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"Assigned {assigned} appointment(s)")
+        )
+        
+        if unassigned > 0:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{unassigned} appointment(s) could not be matched to a free doctor"
+                )
+            )
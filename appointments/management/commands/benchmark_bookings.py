@@ -0,0 +1,159 @@
+"""
+Django management command to measure concurrent booking throughput on SQLite
+Usage: python manage.py benchmark_bookings [--workers N] [--bookings N]
+
+Books appointments from several threads through the booking service
+(book_appointment_slot, so the overlap query, the unique slot constraint,
+the availability index and every signal receiver all run) against two
+scratch database files: one with SQLite's defaults (rollback journal,
+synchronous=FULL) and one with SQLITE_PRAGMAS. Each scratch file is
+migrated and seeded first; the project database is not touched. Bookings
+that lose the write lock are retried and counted.
+"""
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from accounts.models import User, Doctor, Patient
+from appointments.availability_utils import clinic_slots, slot_time
+from appointments.booking_utils import book_appointment_slot
+from appointments.database_utils import sqlite_pragmas
+from appointments.models import Appointment
+
+
+@contextmanager
+def scratch_database(path):
+    """
+    Point the default connection at a fresh, migrated SQLite file
+
+    Threads started inside the block open their own connections to the
+    same file. The original database settings are restored on exit.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    original_name = connection.settings_dict['NAME']
+    connections.close_all()
+    connection.settings_dict['NAME'] = str(path)
+    try:
+        call_command('migrate', verbosity=0, interactive=False)
+        yield
+    finally:
+        connections.close_all()
+        connection.settings_dict['NAME'] = original_name
+
+
+def seed(workers):
+    """
+    Create one doctor and one patient per worker
+
+    Returns:
+        list: (doctor, patient) pairs
+    """
+    pairs = []
+    for number in range(workers):
+        doctor_user = User.objects.create(username=f'benchmark-doctor{number}', role='doctor')
+        patient_user = User.objects.create(username=f'benchmark-patient{number}', role='patient')
+        pairs.append((
+            Doctor.objects.create(user=doctor_user, specialization='Benchmark', contact='0', verified=True),
+            Patient.objects.create(user=patient_user, contact='0', verified=True),
+        ))
+    return pairs
+
+
+def book(doctor, patient, day, start):
+    """
+    Book one slot through the booking service, retrying lock timeouts
+
+    SQLite reports a writer that could not get the lock as "database is
+    locked"; the booking's transaction has rolled back, so it is simply
+    tried again.
+
+    Returns:
+        int: Number of retries needed
+    """
+    retries = 0
+    while True:
+        try:
+            book_appointment_slot(Appointment(
+                doctor=doctor, patient=patient, symptoms='Benchmark',
+                appointment_date=day, appointment_time=start,
+            ))
+            return retries
+        except OperationalError as error:
+            if 'locked' not in str(error):
+                raise
+            retries += 1
+
+
+def run(pairs, bookings):
+    """
+    Book from several threads at once
+
+    Returns:
+        tuple: (bookings per second, lock retries)
+    """
+    slots = list(clinic_slots())
+    first_day = timezone.localdate() + timedelta(days=1)
+    retries, errors = [], []
+
+    def worker(doctor, patient):
+        try:
+            for offset in range(bookings):
+                # Each worker books its own doctor's clinic slots, day after day
+                day, index = divmod(offset, len(slots))
+                retries.append(book(doctor, patient, first_day + timedelta(days=day), slot_time(slots[index])))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=pair) for pair in pairs]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise CommandError(f'Booking failed: {errors[0]}')
+    return len(pairs) * bookings / elapsed, sum(retries)
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent booking throughput with SQLite defaults and with SQLITE_PRAGMAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Number of concurrent booking threads (default: 8)')
+        parser.add_argument('--bookings', type=int, default=200,
+                            help='Bookings made by each thread (default: 200)')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('benchmark_bookings compares SQLite settings; the default database is not SQLite.')
+
+        workers, bookings = options['workers'], options['bookings']
+        self.stdout.write(self.style.SUCCESS(
+            f'Benchmarking {workers} worker(s) x {bookings} booking(s)...'
+        ))
+
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for label, pragmas in [('SQLite defaults', {}), ('SQLITE_PRAGMAS', sqlite_pragmas())]:
+                path = Path(directory) / f'{len(results)}.sqlite3'
+                with override_settings(SQLITE_PRAGMAS=pragmas), scratch_database(path):
+                    pairs = seed(workers)
+                    results[label], retries = run(pairs, bookings)
+                self.stdout.write(f'{label}: {results[label]:.0f} bookings/s ({retries} lock retries)')
+
+        baseline, tuned = results.values()
+        self.stdout.write(
+            self.style.SUCCESS(f'Tuned connections booked {tuned / baseline:.1f}x as fast')
+        )
@@ -0,0 +1,85 @@
+"""
+Django management command to measure invoice PDF rendering speed
+Usage: python manage.py benchmark_invoices [--count N]
+
+Renders a sample invoice (no database access) three ways and reports PDFs
+per second and peak traced memory for each:
+  - cold: a new InvoiceRenderer per PDF, i.e. styles rebuilt every time
+  - single: one cached renderer, one PDF per call
+  - batched: one cached renderer, all PDFs through render_many()
+"""
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from appointments.utils import InvoiceRenderer
+
+
+SAMPLE_INVOICE = {
+    'number': '#1024',
+    'date': '31 January 2024',
+    'status': 'PAID',
+    'patient_name': 'Ravi Kumar',
+    'patient_contact': '9876543210',
+    'patient_age': '34',
+    'patient_blood_group': 'B+',
+    'doctor_name': 'Dr. Asha Rao',
+    'doctor_specialization': 'Cardiology',
+    'doctor_contact': '9123456780',
+    'appointment_date': '30 January 2024',
+    'appointment_time': '10:30 AM',
+    'symptoms': 'Chest discomfort after exercise, occasional shortness of breath.',
+    'amount': '₹500.00',
+}
+
+
+def measure(render, count):
+    """
+    Time a rendering strategy, then run it again under tracemalloc
+
+    Tracing slows allocation-heavy code several times over, so speed and
+    memory come from separate runs.
+
+    Returns:
+        tuple: (PDFs per second, peak memory in MB)
+    """
+    started = time.perf_counter()
+    render(count)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    render(count)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count / elapsed, peak / 1024 / 1024
+
+
+class Command(BaseCommand):
+    help = 'Compare invoice PDF rendering with and without a reused InvoiceRenderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200,
+                            help='PDFs rendered per strategy (default: 200)')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        count = options['count']
+        self.stdout.write(self.style.SUCCESS(f'Rendering {count} invoice(s) per strategy...'))
+
+        renderer = InvoiceRenderer()
+        # Warm up font and module caches so the first strategy is not penalised
+        renderer.render(SAMPLE_INVOICE)
+
+        strategies = [
+            ('cold', lambda n: [InvoiceRenderer().render(SAMPLE_INVOICE) for _ in range(n)]),
+            ('single', lambda n: [renderer.render(SAMPLE_INVOICE) for _ in range(n)]),
+            ('batched', lambda n: renderer.render_many([SAMPLE_INVOICE] * n)),
+        ]
+        results = {}
+        for label, render in strategies:
+            results[label] = measure(render, count)
+            rate, peak = results[label]
+            self.stdout.write(f'{label}: {rate:.1f} PDFs/s, peak {peak:.1f} MB')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reusing the renderer rendered {results['single'][0] / results['cold'][0]:.2f}x as fast"
+        ))
@@ -0,0 +1,90 @@
+"""
+Django management command to invoice every appointment that has no invoice yet
+Usage: python manage.py generate_invoices [--status STATUS] [--from DATE] [--to DATE]
+       [--batch-size N] [--workers N] [--dry-run]
+
+Appointments are loaded a batch at a time with their patient, doctor and
+users, their invoices are inserted with one bulk_create, and the PDFs are
+rendered from plain dicts across a process pool. Invoices whose PDF could
+not be stored are queued for process_invoice_jobs on first download instead.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from appointments.invoice_utils import uninvoiced_appointments, create_invoice_batch, attach_pdfs
+from appointments.utils import invoice_data, render_invoice_pdf
+
+
+class Command(BaseCommand):
+    help = 'Generate invoices and their PDFs for appointments that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', dest='statuses',
+                            choices=['confirmed', 'completed'],
+                            help='Appointment status to invoice (repeatable; default: completed)')
+        parser.add_argument('--from', type=date.fromisoformat, dest='date_from',
+                            help='First appointment date, YYYY-MM-DD')
+        parser.add_argument('--to', type=date.fromisoformat, dest='date_to',
+                            help='Last appointment date, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Appointments loaded and invoiced per batch (default: 200)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processes rendering PDFs (default: one per CPU)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the appointments that would be invoiced')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        if options['batch_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--batch-size and --workers must be at least 1')
+        workers = options['workers']
+        pending = uninvoiced_appointments(
+            options['statuses'] or ['completed'], options['date_from'], options['date_to']
+        )
+        total = pending.count()
+        if options['dry_run'] or not total:
+            self.stdout.write(self.style.SUCCESS(f'{total} appointment(s) need an invoice'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Invoicing {total} appointment(s) with {workers} worker(s)...'
+        ))
+        pending = pending.select_related('patient__user', 'doctor__user').order_by('id')
+
+        done = 0
+        last_id = 0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            pool = None
+            if workers > 1:
+                # Forked workers must not share the parent's database connections
+                connections.close_all()
+                pool = stack.enter_context(ProcessPoolExecutor(workers))
+
+            while True:
+                # Keyset over ids: each batch is one indexed range query
+                batch = list(pending.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                invoices = create_invoice_batch(batch)
+                data = [invoice_data(invoice) for invoice in invoices]
+                if pool is not None:
+                    pdfs = list(pool.map(render_invoice_pdf, data, chunksize=max(1, len(data) // (4 * workers))))
+                else:
+                    pdfs = [render_invoice_pdf(item) for item in data]
+                attach_pdfs(invoices, pdfs)
+
+                done += len(invoices)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{done}/{total} invoice(s) ({done / elapsed:.1f}/s)')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {done} invoice(s) in {elapsed:.1f}s ({done / elapsed:.1f} invoices/s)'
+        ))
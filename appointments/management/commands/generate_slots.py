@@ -0,0 +1,26 @@
+"""
+Django management command to expand doctor working hours into bookable slots
+Usage: python manage.py generate_slots [--weeks N] [--doctor ID]
+"""
+from django.core.management.base import BaseCommand
+from appointments.availability_utils import generate_slots
+
+
+class Command(BaseCommand):
+    help = 'Expand doctor working-hour templates and leave into open slots for the coming weeks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--weeks', type=int, default=None,
+                            help='Number of weeks to generate (default: SCHEDULE_HORIZON_WEEKS)')
+        parser.add_argument('--doctor', type=int, action='append', dest='doctor_ids',
+                            help='Only generate for this doctor id (repeatable)')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        self.stdout.write(self.style.SUCCESS('Generating doctor slots...'))
+        
+        written = generate_slots(doctor_ids=options['doctor_ids'], weeks=options['weeks'])
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated {written} doctor/day slot bitmap(s)")
+        )
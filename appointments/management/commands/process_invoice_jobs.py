@@ -0,0 +1,58 @@
+"""
+Django management command to render queued invoice PDFs
+Usage: python manage.py process_invoice_jobs [--once] [--sleep SECONDS]
+
+Downloads and the admin's generate button only queue an InvoiceJob; this
+worker renders the PDFs. Run one or more workers alongside the web server.
+Jobs left running by a worker that died are requeued after
+INVOICE_JOB_TIMEOUT_SECONDS; failed renders are retried after
+INVOICE_JOB_RETRY_SECONDS.
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from appointments.invoice_utils import claim_invoice_job, run_invoice_job, requeue_stale_invoice_jobs
+
+
+class Command(BaseCommand):
+    help = 'Render queued invoice PDFs in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of waiting for new jobs')
+        parser.add_argument('--sleep', type=float,
+                            default=getattr(settings, 'INVOICE_WORKER_POLL_SECONDS', 2),
+                            help='Seconds to wait between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        if options['sleep'] <= 0:
+            raise CommandError('--sleep must be positive')
+        self.stdout.write(self.style.SUCCESS('Processing invoice PDF jobs...'))
+
+        done = failed = 0
+        try:
+            while True:
+                requeued = requeue_stale_invoice_jobs()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f'Requeued {requeued} stalled job(s)'))
+
+                job = claim_invoice_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                if run_invoice_job(job):
+                    done += 1
+                    self.stdout.write(f'Invoice #{job.invoice_id}: PDF stored')
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'Invoice #{job.invoice_id}: attempt {job.attempts} failed'
+                    ))
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered {done} PDF(s); {failed} attempt(s) failed'))
@@ -0,0 +1,20 @@
+"""
+Django management command to rebuild the slot availability index
+Usage: python manage.py rebuild_availability
+"""
+from django.core.management.base import BaseCommand
+from appointments.availability_utils import rebuild_availability
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-doctor slot availability index from existing appointments'
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        self.stdout.write(self.style.SUCCESS('Rebuilding slot availability index...'))
+        
+        written = rebuild_availability()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"Indexed {written} doctor/day slot bitmap(s)")
+        )
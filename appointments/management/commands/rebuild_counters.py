@@ -0,0 +1,20 @@
+"""
+Django management command to rebuild the dashboard counters
+Usage: python manage.py rebuild_counters
+"""
+from django.core.management.base import BaseCommand
+from appointments.counter_utils import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters from appointments, doctors and patients'
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        self.stdout.write(self.style.SUCCESS('Rebuilding dashboard counters...'))
+        
+        written = rebuild_counters()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {written} dashboard counter(s)")
+        )
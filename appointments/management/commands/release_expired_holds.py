@@ -0,0 +1,23 @@
+"""
+Django management command to release slots held by abandoned checkouts
+Usage: python manage.py release_expired_holds
+"""
+from django.core.management.base import BaseCommand
+from appointments.booking_utils import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid bookings whose checkout hold has expired and free their slots'
+
+    def handle(self, *args, **options):
+        """Execute the command"""
+        released = release_expired_holds()
+        
+        if released:
+            self.stdout.write(
+                self.style.SUCCESS(f"Released {released} expired slot hold(s)")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING('No expired slot holds found')
+            )
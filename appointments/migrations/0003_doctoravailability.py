@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('appointments', '0002_appointment_payment_amount_appointment_payment_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked_slots', models.BinaryField(default=b'')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='accounts.doctor')),
+            ],
+            options={
+                'verbose_name_plural': 'doctor availability',
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='doctoravailability',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_availability_day'),
+        ),
+    ]
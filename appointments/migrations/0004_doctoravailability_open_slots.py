@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_doctoravailability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctoravailability',
+            name='open_slots',
+            field=models.BinaryField(blank=True, default=None, null=True),
+        ),
+    ]
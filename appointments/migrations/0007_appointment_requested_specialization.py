@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='requested_specialization',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
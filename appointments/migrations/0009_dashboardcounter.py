@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_appointment_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Global'), ('doctor', 'Doctor'), ('patient', 'Patient')], max_length=10)),
+                ('scope_id', models.PositiveIntegerField(default=0)),
+                ('name', models.CharField(max_length=30)),
+                ('value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dashboardcounter',
+            constraint=models.UniqueConstraint(fields=('scope', 'scope_id', 'name'), name='unique_dashboard_counter'),
+        ),
+    ]
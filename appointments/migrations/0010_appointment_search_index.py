@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+SEARCH_TABLE = 'appointments_appointment_search'
+
+
+def create_search_index(apps, schema_editor):
+    """Create and fill the FTS5 appointment index (SQLite only, see search_utils)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or connection.Database.sqlite_version_info < (3, 34):
+        # The trigram tokenizer needs SQLite 3.34+
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if not cursor.fetchone()[0]:
+            return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5(symptoms, patient_name, doctor_name, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, symptoms, patient_name, doctor_name) "
+        f"SELECT a.id, a.symptoms, TRIM(pu.first_name || ' ' || pu.last_name), "
+        f"COALESCE(TRIM(du.first_name || ' ' || du.last_name), '') "
+        f"FROM appointments_appointment a "
+        f"JOIN accounts_patient p ON p.id = a.patient_id "
+        f"JOIN accounts_user pu ON pu.id = p.user_id "
+        f"LEFT JOIN accounts_doctor d ON d.id = a.doctor_id "
+        f"LEFT JOIN accounts_user du ON du.id = d.user_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
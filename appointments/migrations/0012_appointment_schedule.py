@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:40
+
+import appointments.models
+from datetime import datetime, timedelta
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_schedule(apps, schema_editor):
+    """Derive starts_at and ends_at for existing appointments"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    zone = timezone.get_default_timezone()
+    batch = []
+    for appointment in Appointment.objects.only(
+        'appointment_date', 'appointment_time', 'duration_minutes'
+    ).iterator(chunk_size=1000):
+        appointment.starts_at = timezone.make_aware(
+            datetime.combine(appointment.appointment_date, appointment.appointment_time), zone
+        )
+        appointment.ends_at = appointment.starts_at + timedelta(minutes=appointment.duration_minutes)
+        batch.append(appointment)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+            batch = []
+    Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_appointment_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='duration_minutes',
+            field=models.PositiveSmallIntegerField(default=appointments.models.default_duration),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='starts_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_schedule, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='appointment',
+            name='starts_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_reminder_due_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'starts_at'], name='appointment_doctor_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_sent', False)), fields=['starts_at', 'status'], name='appointment_reminder_due_idx'),
+        ),
+    ]
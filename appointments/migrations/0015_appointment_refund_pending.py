@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0014_invoicejob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appointment',
+            name='payment_status',
+            field=models.CharField(choices=[('pending', 'Payment Pending'), ('paid', 'Paid'), ('failed', 'Payment Failed'), ('refunded', 'Refunded'), ('refund_pending', 'Refund Pending')], default='pending', max_length=15),
+        ),
+    ]
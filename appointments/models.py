@@ -1,7 +1,121 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from accounts.models import User, Doctor, Patient
-from datetime import datetime, timedelta
+from django.conf import settings
+from datetime import datetime, time, timedelta
+
+
+def default_duration():
+    """Length of a new appointment in minutes: one slot"""
+    return getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30)
+
+
+def max_duration_minutes():
+    """Longest allowed appointment; bounds the overlap range scan"""
+    return getattr(settings, 'APPOINTMENT_MAX_DURATION_MINUTES', 120)
+
+
+def local_start(day, start=time.min):
+    """Aware datetime for a wall-clock date and time in the clinic's time zone"""
+    return timezone.make_aware(datetime.combine(day, start), timezone.get_default_timezone())
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """Custom queryset for appointments"""
+
+    def with_related(self):
+        """
+        Preload everything appointment lists render
+
+        Joins the patient, doctor, both of their users and the invoice, so a
+        page of appointments costs one query instead of several per row.
+        """
+        return self.select_related('patient__user', 'doctor__user', 'invoice')
+
+    def starting_on(self, day):
+        """Appointments starting on a local calendar day, as a starts_at range"""
+        return self.filter(
+            starts_at__gte=local_start(day),
+            starts_at__lt=local_start(day + timedelta(days=1))
+        )
+
+    def upcoming(self, within=None):
+        """
+        Appointments that have not started yet
+
+        Args:
+            within: Optional timedelta; only appointments starting within it
+        """
+        now = timezone.now()
+        queryset = self.filter(starts_at__gt=now)
+        if within is not None:
+            queryset = queryset.filter(starts_at__lte=now + within)
+        return queryset
+
+    def overlapping(self, doctor_id, starts_at, ends_at):
+        """
+        Active appointments of a doctor that overlap a time range
+
+        Two appointments overlap when each starts before the other ends. The
+        extra lower bound on starts_at (nothing lasts longer than
+        APPOINTMENT_MAX_DURATION_MINUTES) turns this into a short range scan
+        of the (doctor, starts_at) index.
+        """
+        return self.filter(
+            doctor_id=doctor_id,
+            status__in=Appointment.ACTIVE_STATUSES,
+            starts_at__gt=starts_at - timedelta(minutes=max_duration_minutes()),
+            starts_at__lt=ends_at,
+            ends_at__gt=starts_at
+        )
+
+    def touch(self):
+        """
+        Bump updated_at without changing anything else
+        
+        Used when something an appointment row displays (a name, a contact
+        number) changes elsewhere, so its cached template fragments expire.
+        
+        Returns:
+            int: Number of rows updated
+        """
+        return self.update(updated_at=timezone.now())
+
+    def synced_update(self, backfill=True, **kwargs):
+        """
+        Bulk update that keeps derived appointment data in sync
+
+        ``QuerySet.update`` does not send ``post_save``, so the affected rows
+        are captured before and after the update and announced through the
+        ``appointments_bulk_changed`` signal in the same transaction.
+
+        Args:
+            backfill: Offer slots freed by cancellations to the waitlist;
+                False when the caller is about to take the slot itself
+            **kwargs: Field values to update
+
+        Returns:
+            int: Number of rows updated
+        """
+        from .signals import appointments_bulk_changed
+
+        if Appointment.SCHEDULE_FIELDS & set(kwargs):
+            raise ValueError('Appointment times must be changed with save() so starts_at and ends_at follow')
+
+        fields = Appointment.CHANGE_FIELDS
+        before = list(self.values(*fields))
+        if not before:
+            return 0
+
+        # update() skips auto_now; bump it so cached rows re-render
+        kwargs.setdefault('updated_at', timezone.now())
+        ids = [row['id'] for row in before]
+        with transaction.atomic():
+            updated = Appointment.objects.filter(pk__in=ids).update(**kwargs)
+            after = list(Appointment.objects.filter(pk__in=ids).values(*fields))
+            appointments_bulk_changed.send(sender=Appointment, before=before, after=after, backfill=backfill)
+        return updated
 
 
 class Appointment(models.Model):
@@ -18,13 +132,40 @@ class Appointment(models.Model):
         ('paid', 'Paid'),
         ('failed', 'Payment Failed'),
         ('refunded', 'Refunded'),
+        # Paid after the booking was released, and the automatic refund failed
+        ('refund_pending', 'Refund Pending'),
     )
     
+    # Statuses that occupy a doctor's time slot
+    ACTIVE_STATUSES = ('pending', 'confirmed')
+    
+    # Fields that decide which slot an appointment occupies
+    SLOT_FIELDS = ('doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes', 'status')
+    
+    # Fields starts_at and ends_at are derived from (see update_schedule)
+    SCHEDULE_FIELDS = {'appointment_date', 'appointment_time', 'duration_minutes'}
+    
+    # Row fields announced by appointments_bulk_changed
+    CHANGE_FIELDS = ('id', 'patient_id') + SLOT_FIELDS
+    
+    # Fields the search index is built from (see search_utils)
+    SEARCH_FIELDS = ('symptoms', 'patient_id', 'doctor_id')
+    
+    # Skip the overlap query in clean(); save() still runs it
+    defer_conflict_check = False
+    
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointments')
     doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name='appointments')
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
+    duration_minutes = models.PositiveSmallIntegerField(default=default_duration)
+    # Date and time as one aware timestamp, plus the end, for indexed range
+    # queries; kept in sync with the fields above by update_schedule()
+    starts_at = models.DateTimeField(editable=False)
+    ends_at = models.DateTimeField(editable=False)
     symptoms = models.TextField()
+    # Used to auto-assign a doctor when the patient did not pick one
+    requested_specialization = models.CharField(max_length=100, blank=True)
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='pending')
     
     # Payment fields
@@ -35,44 +176,163 @@ class Appointment(models.Model):
     # Reminder tracking
     reminder_sent = models.BooleanField(default=False)
     
+    # Unpaid bookings hold their slot until this time (see booking_utils)
+    hold_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AppointmentQuerySet.as_manager()
+    
     def __str__(self):
         doctor_name = f"Dr. {self.doctor.user.get_full_name()}" if self.doctor else "Unassigned"
         return f"{self.patient.user.get_full_name()} - {doctor_name} on {self.appointment_date}"
     
     def clean(self):
-        """Validate appointment to prevent conflicts"""
-        if self.doctor and self.appointment_date and self.appointment_time:
-            # Check for conflicting appointments
-            conflicting = Appointment.objects.filter(
-                doctor=self.doctor,
-                appointment_date=self.appointment_date,
-                appointment_time=self.appointment_time,
-                status__in=['pending', 'confirmed']
-            ).exclude(pk=self.pk)
-            
-            if conflicting.exists():
-                raise ValidationError(
-                    f'This time slot is already booked. Dr. {self.doctor.user.get_full_name()} '
-                    f'has another appointment at {self.appointment_time} on {self.appointment_date}.'
-                )
-    
-    def save(self, *args, **kwargs):
-        """Override save to run validation"""
-        self.clean()
+        """
+        Validate appointment to prevent conflicts
+        
+        With ``defer_conflict_check`` set (forms whose instance is saved right
+        away, see AppointmentForm), the overlap query is left to save() so
+        it runs once per booking.
+        """
+        self.check_duration()
+        if not self.defer_conflict_check:
+            self.check_slot()
+    
+    def check_duration(self):
+        """Reject appointments longer than APPOINTMENT_MAX_DURATION_MINUTES"""
+        if self.duration_minutes and self.duration_minutes > max_duration_minutes():
+            raise ValidationError(f'Appointments cannot be longer than {max_duration_minutes()} minutes.')
+    
+    def check_slot(self):
+        """Reject a slot overlapping another active appointment of the doctor"""
+        if self.update_schedule() and self.needs_conflict_check():
+            if self.conflicting_appointments().exists():
+                raise self.slot_conflict_error()
+    
+    def save(self, *args, check_conflicts=True, **kwargs):
+        """
+        Override save to run validation
+        
+        Pass ``check_conflicts=False`` to skip the conflict query and rely on
+        the unique slot constraint instead (see booking_utils).
+        """
+        self.update_schedule()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.SCHEDULE_FIELDS & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'starts_at', 'ends_at'}
+        if check_conflicts:
+            self.check_duration()
+            self.check_slot()
         super().save(*args, **kwargs)
+        self._loaded_row = self.change_row()
+        self._loaded_search = self.search_state()
+    
+    def update_schedule(self):
+        """
+        Derive starts_at and ends_at from the date, time and duration
+        
+        The date and time are wall-clock values in the clinic's time zone
+        (TIME_ZONE); starts_at and ends_at are the matching aware instants.
+        
+        Returns:
+            bool: False if the date or time is not set yet
+        """
+        if not self.appointment_date or not self.appointment_time:
+            return False
+        if not self.duration_minutes:
+            self.duration_minutes = default_duration()
+        self.starts_at = local_start(self.appointment_date, self.appointment_time)
+        self.ends_at = self.starts_at + timedelta(minutes=self.duration_minutes)
+        return True
+    
+    def needs_conflict_check(self):
+        """
+        Check whether saving could move this appointment onto a taken slot
+        
+        Only new bookings, reactivated appointments and changes of doctor, date,
+        time or duration can clash; status flips between active states and
+        updates to payment or reminder fields cannot.
+        """
+        if not self.doctor_id or self.status not in self.ACTIVE_STATUSES:
+            return False
+        previous = getattr(self, '_loaded_row', None)
+        if previous is None or previous['status'] not in self.ACTIVE_STATUSES:
+            return True
+        return any(
+            previous[field] != getattr(self, field)
+            for field in ('doctor_id', 'appointment_date', 'appointment_time', 'duration_minutes')
+        )
+    
+    def conflicting_appointments(self):
+        """
+        Active appointments of the same doctor overlapping this one
+        
+        Unpaid bookings whose checkout hold has expired are ignored; the
+        booking service releases them before taking the slot.
+        """
+        return Appointment.objects.overlapping(
+            self.doctor_id, self.starts_at, self.ends_at
+        ).exclude(pk=self.pk).exclude(status='pending', hold_expires_at__lte=timezone.now())
+    
+    def slot_conflict_error(self):
+        """The user-facing error raised when the slot is already booked"""
+        return ValidationError(
+            f'This time slot is already booked. Dr. {self.doctor.user.get_full_name()} '
+            f'has another appointment overlapping {self.appointment_time} on {self.appointment_date}.'
+        )
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the row this appointment was loaded with (see change_row)"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_row = instance.change_row()
+        instance._loaded_search = instance.search_state()
+        return instance
+    
+    def slot_state(self):
+        """Return the current values of the slot-defining fields"""
+        return {field: self.__dict__.get(field) for field in self.SLOT_FIELDS}
+    
+    def change_row(self):
+        """Return this appointment as an appointments_bulk_changed row"""
+        return {field: self.__dict__.get(field) for field in self.CHANGE_FIELDS}
+    
+    def search_state(self):
+        """Return the current values of the indexed fields"""
+        return tuple(self.__dict__.get(field) for field in self.SEARCH_FIELDS)
     
     def is_upcoming(self):
         """Check if appointment is upcoming (within next 24 hours)"""
-        appointment_datetime = datetime.combine(self.appointment_date, self.appointment_time)
-        now = datetime.now()
-        time_until = appointment_datetime - now
+        time_until = self.starts_at - timezone.now()
         return timedelta(hours=0) < time_until <= timedelta(hours=24)
     
     class Meta:
         ordering = ['-appointment_date', '-appointment_time']
+        indexes = [
+            # Keyset pagination of the admin manager: ORDER BY -created_at, -id
+            models.Index(fields=['-created_at', '-id'], name='appointment_created_idx'),
+            # Patient and doctor lists: WHERE patient/doctor ORDER BY -date, -time
+            models.Index(
+                fields=['patient', '-appointment_date', '-appointment_time'],
+                name='appointment_patient_date_idx'
+            ),
+            models.Index(
+                fields=['doctor', '-appointment_date', '-appointment_time'],
+                name='appointment_doctor_date_idx'
+            ),
+            # Overlap check in clean(): WHERE doctor AND starts_at in a range
+            models.Index(fields=['doctor', 'starts_at'], name='appointment_doctor_start_idx'),
+            # Reminder sweep: only appointments still owed a reminder. The
+            # status filter is a column, not part of the condition, because
+            # SQLite cannot match a bound IN (...) against a partial index.
+            models.Index(
+                fields=['starts_at', 'status'],
+                condition=models.Q(reminder_sent=False),
+                name='appointment_reminder_due_idx'
+            ),
+        ]
         # Prevent double booking at database level
         constraints = [
             models.UniqueConstraint(
@@ -83,6 +343,107 @@ class Appointment(models.Model):
         ]
 
 
+class WaitlistEntry(models.Model):
+    """Patient waiting for a cancellation with a doctor on a given day"""
+    STATUS_CHOICES = (
+        ('waiting', 'Waiting'),
+        ('promoted', 'Promoted'),
+        ('cancelled', 'Cancelled'),
+    )
+    
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='waitlist_entries')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='waitlist_entries')
+    date = models.DateField()
+    symptoms = models.TextField()
+    # Higher priority is served first; ties go to whoever joined first
+    priority = models.PositiveSmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting')
+    appointment = models.OneToOneField(
+        Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='waitlist_entry'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.patient.user.get_full_name()} waiting for Dr. {self.doctor.user.get_full_name()} on {self.date}"
+    
+    class Meta:
+        ordering = ['-priority', 'created_at']
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            # Queue head lookup: WHERE doctor, date, status ORDER BY -priority, created_at
+            models.Index(fields=['doctor', 'date', 'status', '-priority', 'created_at'], name='waitlist_queue_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient', 'doctor', 'date'],
+                condition=models.Q(status='waiting'),
+                name='unique_waiting_patient_doctor_day'
+            )
+        ]
+
+
+class DoctorAvailability(models.Model):
+    """Per-doctor, per-day slot occupancy bitmap used for fast availability lookups"""
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='availability')
+    date = models.DateField()
+    # Bit n is set when slot n of the day (see availability_utils) is booked
+    booked_slots = models.BinaryField(default=b'')
+    # Bit n is set when the doctor works during slot n; NULL until generated
+    open_slots = models.BinaryField(null=True, blank=True, default=None)
+    
+    def __str__(self):
+        return f"Dr. {self.doctor.user.get_full_name()} - {self.date}"
+    
+    @property
+    def booked_mask(self):
+        """Booked slots as an integer bitmap"""
+        return int.from_bytes(bytes(self.booked_slots), 'little')
+    
+    @property
+    def open_mask(self):
+        """Working slots as an integer bitmap, or None if not generated"""
+        if self.open_slots is None:
+            return None
+        return int.from_bytes(bytes(self.open_slots), 'little')
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name_plural = 'doctor availability'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doctor', 'date'],
+                name='unique_doctor_availability_day'
+            )
+        ]
+
+
+
+class DashboardCounter(models.Model):
+    """Pre-aggregated dashboard count, kept current by signal handlers (see counter_utils)"""
+    SCOPE_CHOICES = (
+        ('global', 'Global'),
+        ('doctor', 'Doctor'),
+        ('patient', 'Patient'),
+    )
+    
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    # Doctor or patient primary key; 0 for the global scope
+    scope_id = models.PositiveIntegerField(default=0)
+    name = models.CharField(max_length=30)
+    value = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.scope}:{self.scope_id} {self.name} = {self.value}"
+    
+    class Meta:
+        constraints = [
+            # Also serves the dashboard lookup: WHERE scope, scope_id
+            models.UniqueConstraint(
+                fields=['scope', 'scope_id', 'name'],
+                name='unique_dashboard_counter'
+            )
+        ]
+
 class Invoice(models.Model):
     """Invoice model for appointment billing"""
     PAYMENT_STATUS_CHOICES = (
@@ -107,3 +468,48 @@ class Invoice(models.Model):
     
     class Meta:
         ordering = ['-generated_date']
+        indexes = [
+            # Keyset pagination of the invoice API: ORDER BY -generated_date, -id
+            models.Index(fields=['-generated_date', '-id'], name='invoice_generated_idx'),
+        ]
+
+
+class InvoiceJob(models.Model):
+    """Queued PDF rendering for an invoice, run by the process_invoice_jobs worker"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    
+    # Statuses of a job that will still produce the PDF
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped when a worker claims or requeues the job; running jobs left
+    # untouched for INVOICE_JOB_TIMEOUT_SECONDS are assumed abandoned and
+    # requeued, and requeued jobs wait INVOICE_JOB_RETRY_SECONDS
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Invoice #{self.invoice_id} PDF job ({self.status})"
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Worker claim: WHERE status = 'queued' ORDER BY created_at
+            models.Index(fields=['status', 'created_at'], name='invoice_job_queue_idx'),
+        ]
+        constraints = [
+            # Single flight: at most one job per invoice is queued or running
+            models.UniqueConstraint(
+                fields=['invoice'],
+                condition=models.Q(status__in=['queued', 'running']),
+                name='unique_active_invoice_job'
+            )
+        ]
@@ -0,0 +1,140 @@
+"""
+Keyset (cursor) pagination utilities
+
+Pages are addressed by the ordering values of their boundary rows instead of
+an OFFSET, so fetching page 1000 costs the same index seek as page 1.
+"""
+import base64
+import json
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    """
+    Encode the ordering values of a row as an opaque URL-safe cursor
+
+    Args:
+        values: List of ordering values (datetimes, dates and numbers)
+
+    Returns:
+        str: Cursor string
+    """
+    payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """
+    Decode a cursor back into ordering values
+
+    Returns:
+        list: Ordering values converted to Python types, or None if the
+            cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(raw_values, list) or len(raw_values) != len(ordering):
+            return None
+        return [
+            model._meta.get_field(field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, raw_values)
+        ]
+    except Exception:
+        return None
+
+
+def _keyset_filter(ordering, values, forward):
+    """
+    Build the "rows after this cursor" condition for a compound ordering
+
+    For ordering (-created_at, -id) walking forward this is:
+    created_at <= c AND (created_at < c OR (created_at = c AND id < i))
+
+    The redundant bound on the leading column lets the database seek into
+    the index instead of scanning it.
+    """
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        term = Q(**{f'{name}__{lookup}': values[position]})
+        for previous_field, previous_value in zip(ordering[:position], values[:position]):
+            term &= Q(**{previous_field.lstrip('-'): previous_value})
+        condition |= term
+
+    leading = ordering[0]
+    bound = 'lte' if leading.startswith('-') == forward else 'gte'
+    return Q(**{f'{leading.lstrip("-")}__{bound}': values[0]}) & condition
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def seek(queryset, ordering, cursor, forward=True):
+    """
+    Restrict a queryset to the rows after (or, walking back, before) a cursor
+
+    Returns:
+        QuerySet: Filtered queryset, or None if the cursor is malformed
+    """
+    values = decode_cursor(cursor, queryset.model, ordering)
+    if values is None:
+        return None
+    return queryset.filter(_keyset_filter(ordering, values, forward))
+
+
+def keyset_paginate(queryset, ordering, after=None, before=None, page_size=25):
+    """
+    Fetch one page of a queryset using keyset pagination
+
+    The ordering must be unique (end it with the primary key) and should be
+    backed by an index so every page is a single index range scan.
+
+    Args:
+        queryset: QuerySet to paginate
+        ordering: Tuple of field names, e.g. ('-created_at', '-id')
+        after: Cursor of the last row of the previous page
+        before: Cursor of the first row of the next page
+        page_size: Number of rows per page
+
+    Returns:
+        dict: 'items', 'next_cursor' and 'previous_cursor' (None when there
+            is no such page)
+    """
+    model = queryset.model
+    ordering = tuple(ordering)
+    attnames = [model._meta.get_field(field.lstrip('-')).attname for field in ordering]
+
+    cursor = before or after
+    sought = seek(queryset, ordering, cursor, forward=not before) if cursor else None
+    backwards = bool(before) and sought is not None
+    if sought is not None:
+        queryset = sought
+
+    if backwards:
+        rows = list(queryset.order_by(*[_reverse(field) for field in ordering])[:page_size + 1])
+        has_more = len(rows) > page_size
+        items = rows[:page_size][::-1]
+    else:
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(rows) > page_size
+        items = rows[:page_size]
+
+    def cursor_for(row):
+        if isinstance(row, dict):
+            return encode_cursor([row[attname] for attname in attnames])
+        return encode_cursor([getattr(row, attname) for attname in attnames])
+
+    if backwards:
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, sought is not None
+
+    return {
+        'items': items,
+        'next_cursor': cursor_for(items[-1]) if items and has_next else None,
+        'previous_cursor': cursor_for(items[0]) if items and has_previous else None,
+    }
@@ -1,9 +1,14 @@
 """
 Payment gateway integration utilities for Razorpay
 """
+import logging
 import razorpay
 from django.conf import settings
 from decimal import Decimal
+from .booking_utils import extend_hold
+
+
+logger = logging.getLogger(__name__)
 
 
 class PaymentGateway:
@@ -137,6 +142,9 @@ def create_payment_order(appointment):
     Returns:
         dict: Order creation result
     """
+    # Keep the slot reserved for the whole checkout
+    extend_hold(appointment)
+    
     gateway = PaymentGateway()
     receipt = f"APT_{appointment.id}_{appointment.patient.id}"
     
@@ -160,3 +168,51 @@ def verify_payment_signature(order_id, payment_id, signature):
     """
     gateway = PaymentGateway()
     return gateway.verify_payment(order_id, payment_id, signature)
+
+
+def refund_payment(payment_id, amount=None):
+    """
+    Refund a Razorpay payment
+    
+    Args:
+        payment_id: Razorpay payment ID
+        amount: Amount to refund in rupees, None for full refund
+        
+    Returns:
+        dict: Refund result
+    """
+    gateway = PaymentGateway()
+    return gateway.refund_payment(payment_id, amount)
+
+
+def settle_lapsed_payment(appointment, payment_id, refund):
+    """
+    Record a payment that arrived after its booking's hold was released
+    
+    A refunded payment is marked 'refunded'. A refund the gateway rejected is
+    marked 'refund_pending' (filterable in the admin) and logged, so staff
+    can refund it by hand.
+    
+    Args:
+        appointment: The cancelled appointment
+        payment_id: Razorpay payment ID
+        refund: Result of refund_payment for the payment
+        
+    Returns:
+        str: Message telling the patient what happened to their money
+    """
+    appointment.payment_id = payment_id
+    appointment.hold_expires_at = None
+    if refund['success']:
+        appointment.payment_status = 'refunded'
+        appointment.save()
+        return ('Your slot reservation expired before the payment completed. '
+                'The payment has been refunded; please book a new slot.')
+    
+    appointment.payment_status = 'refund_pending'
+    appointment.save()
+    logger.error('Refund of payment %s for cancelled appointment #%s failed: %s',
+                 payment_id, appointment.id, refund.get('error'))
+    return ('Your slot reservation expired before the payment completed. We could not refund the '
+            'payment automatically; it is marked for a manual refund. Please contact support '
+            f'quoting payment {payment_id} if you have not received it within a week.')
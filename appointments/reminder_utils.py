@@ -4,7 +4,8 @@ Email reminder utilities for appointment notifications
 from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
-from datetime import datetime, timedelta
+from django.utils import timezone
+from datetime import timedelta
 from .models import Appointment
 
 
@@ -120,6 +121,41 @@ Vishubh Healthcare Team
         return False
 
 
+def send_waitlist_promotion(appointment):
+    """Tell a waitlisted patient that a slot opened up and was booked for them"""
+    patient = appointment.patient
+    subject = f'Appointment Available - {appointment.appointment_date}'
+    
+    message = f"""
+Dear {patient.user.get_full_name()},
+
+Good news! A slot opened up and you have been booked from the waitlist:
+
+Doctor: Dr. {appointment.doctor.user.get_full_name()}
+Date: {appointment.appointment_date.strftime('%B %d, %Y')}
+Time: {appointment.appointment_time.strftime('%I:%M %p')}
+
+Please log in to complete payment for this appointment, or cancel it if you
+no longer need it.
+
+Thank you,
+Vishubh Healthcare Team
+"""
+    
+    try:
+        send_mail(
+            subject,
+            message,
+            settings.DEFAULT_FROM_EMAIL,
+            [patient.user.email],
+            fail_silently=False,
+        )
+        return True
+    except Exception as e:
+        print(f"✗ Failed to send waitlist notification to patient: {e}")
+        return False
+
+
 def get_appointments_needing_reminders():
     """
     Get appointments that need reminders
@@ -127,10 +163,9 @@ def get_appointments_needing_reminders():
     Returns:
         QuerySet: Appointments scheduled for tomorrow that haven't received reminders
     """
-    tomorrow = datetime.now().date() + timedelta(days=1)
+    tomorrow = timezone.localdate() + timedelta(days=1)
     
-    appointments = Appointment.objects.filter(
-        appointment_date=tomorrow,
+    appointments = Appointment.objects.starting_on(tomorrow).filter(
         reminder_sent=False,
         status__in=['pending', 'confirmed']
     ).select_related('patient__user', 'doctor__user')
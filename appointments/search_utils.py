@@ -0,0 +1,148 @@
+"""
+Appointment full-text search utilities
+
+Appointments are indexed by symptoms and patient and doctor names in an FTS5
+trigram table (created by migration 0010 and kept in sync by signals.py).
+Queries are matched and ranked the same way as doctor searches (see
+accounts.search_utils); without the index, search falls back to
+case-insensitive substring matching.
+
+The caller's filters (status, dates, doctor) are applied inside the index
+query, so the MAX_CANDIDATES best matches are taken from the rows the caller
+can actually show.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+from accounts.search_utils import (
+    MIN_SIMILARITY, search_index_enabled, trigrams, match_expression, similarity
+)
+
+
+SEARCH_TABLE = 'appointments_appointment_search'
+
+# Most candidates read from the index for one search
+MAX_CANDIDATES = 500
+
+# Builds index rows for the appointments selected by a WHERE clause on ``a``
+_INSERT_SQL = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, symptoms, patient_name, doctor_name)
+    SELECT a.id, a.symptoms,
+           TRIM(pu.first_name || ' ' || pu.last_name),
+           COALESCE(TRIM(du.first_name || ' ' || du.last_name), '')
+    FROM appointments_appointment a
+    JOIN accounts_patient p ON p.id = a.patient_id
+    JOIN accounts_user pu ON pu.id = p.user_id
+    LEFT JOIN accounts_doctor d ON d.id = a.doctor_id
+    LEFT JOIN accounts_user du ON du.id = d.user_id
+"""
+
+
+def _reindex(where, params):
+    """Replace the index rows of the appointments matching a WHERE clause"""
+    if not search_index_enabled(SEARCH_TABLE):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT a.id FROM appointments_appointment a WHERE {where})',
+            params
+        )
+        cursor.execute(f'{_INSERT_SQL} WHERE {where}', params)
+
+
+def index_appointments(ids):
+    """Add or replace appointments in the search index"""
+    ids = list(ids)
+    if ids:
+        _reindex(f"a.id IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+def index_user_appointments(user_id):
+    """Re-index every appointment of a patient or doctor after a name change"""
+    _reindex(
+        'a.patient_id IN (SELECT id FROM accounts_patient WHERE user_id = %s) '
+        'OR a.doctor_id IN (SELECT id FROM accounts_doctor WHERE user_id = %s)',
+        [user_id, user_id]
+    )
+
+
+def unindex_appointment(appointment_id):
+    """Remove an appointment from the search index"""
+    if not search_index_enabled(SEARCH_TABLE):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [appointment_id])
+
+
+def rebuild_search_index():
+    """
+    Re-index every appointment
+
+    Returns:
+        int: Number of appointments indexed
+    """
+    if not search_index_enabled(SEARCH_TABLE):
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(_INSERT_SQL)
+        return cursor.rowcount
+
+
+def ranked_appointment_ids(query, queryset=None):
+    """
+    Search the index for appointments matching a query
+
+    Args:
+        query: Free-text search string
+        queryset: Optional Appointment queryset the matches must belong to
+
+    Returns:
+        list: Appointment ids, most relevant first, or None if the index
+            cannot answer this query (see search_appointment_ids)
+    """
+    query_grams = trigrams(query)
+    if not search_index_enabled(SEARCH_TABLE) or not query_grams:
+        return None
+
+    sql = f'SELECT rowid, symptoms, patient_name, doctor_name, bm25({SEARCH_TABLE}) ' \
+          f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    params = [match_expression(query_grams)]
+    if queryset is not None:
+        subquery, subquery_params = queryset.order_by().values('pk').query.sql_with_params()
+        sql += f' AND rowid IN ({subquery})'
+        params += subquery_params
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} ORDER BY bm25({SEARCH_TABLE}) LIMIT %s', params + [MAX_CANDIDATES])
+        rows = cursor.fetchall()
+
+    scored = []
+    for appointment_id, symptoms, patient_name, doctor_name, rank in rows:
+        score = similarity(query_grams, f'{symptoms} {patient_name} {doctor_name}')
+        if score >= MIN_SIMILARITY:
+            scored.append((-score, rank, appointment_id))
+    return [appointment_id for _, _, appointment_id in sorted(scored)]
+
+
+def search_appointment_ids(queryset, query):
+    """
+    Search appointments by symptoms and patient and doctor names
+
+    Args:
+        queryset: Appointment queryset to search within (e.g. filtered list)
+        query: Free-text search string
+
+    Returns:
+        list: Ids of matching appointments in the queryset, most relevant
+            first (newest first without the index)
+    """
+    ranked = ranked_appointment_ids(query, queryset)
+    if ranked is not None:
+        return ranked
+
+    return list(queryset.filter(
+        Q(symptoms__icontains=query) |
+        Q(patient__user__first_name__icontains=query) |
+        Q(patient__user__last_name__icontains=query) |
+        Q(doctor__user__first_name__icontains=query) |
+        Q(doctor__user__last_name__icontains=query)
+    ).order_by('-created_at', '-id').values_list('pk', flat=True)[:MAX_CANDIDATES])
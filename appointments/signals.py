@@ -0,0 +1,210 @@
+"""
+Signal handlers that keep derived appointment data in sync
+"""
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from accounts.models import User, Doctor, Patient, DoctorWorkingHours, DoctorLeave
+from accounts.search_utils import NAME_FIELDS
+from .models import Appointment, DashboardCounter, local_start
+from .availability_utils import refresh_availability, regenerate_slots_on_commit
+from .counter_utils import (
+    appointment_keys, profile_keys, counter_deltas, apply_counter_deltas
+)
+from .search_utils import index_appointments, index_user_appointments, unindex_appointment
+
+
+# Sent by queryset-level writes (update, bulk_create) that bypass post_save.
+# Receivers get ``before`` and ``after``: lists of row dicts with the slot fields,
+# and optionally ``backfill=False`` when freed slots must not go to the waitlist.
+appointments_bulk_changed = Signal()
+
+# Profile fields shown in cached appointment rows
+PROFILE_FIELDS = {'age', 'contact', 'specialization'}
+
+
+def _slot_key(state):
+    return (state.get('doctor_id'), state.get('appointment_date'))
+
+
+def _occupancy(state):
+    return (
+        _slot_key(state),
+        state.get('appointment_time'),
+        state.get('duration_minutes'),
+        state.get('status') in Appointment.ACTIVE_STATUSES,
+    )
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, **kwargs):
+    """Refresh the availability index for the old and new slot"""
+    current = instance.slot_state()
+    previous = getattr(instance, '_loaded_row', None)
+    if previous and _occupancy(previous) == _occupancy(current):
+        return
+    keys = {_slot_key(current)}
+    if previous:
+        keys.add(_slot_key(previous))
+    refresh_availability(keys)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_cancelled(sender, instance, created, **kwargs):
+    """Backfill a cancelled slot from the waitlist"""
+    from .waitlist_utils import is_cancellation, promote_waitlist
+
+    previous = getattr(instance, '_loaded_row', None)
+    if not created and previous and is_cancellation(previous, instance.slot_state()):
+        promote_waitlist(previous['doctor_id'], previous['appointment_date'], previous['appointment_time'])
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    """Free the slot held by a deleted appointment"""
+    refresh_availability({_slot_key(instance.slot_state())})
+
+
+@receiver(appointments_bulk_changed, sender=Appointment)
+def appointments_bulk_changed_availability(sender, before, after, **kwargs):
+    """Refresh the availability index after a bulk write"""
+    refresh_availability({_slot_key(row) for row in before + after})
+
+
+@receiver(post_save, sender=DoctorWorkingHours)
+@receiver(post_delete, sender=DoctorWorkingHours)
+@receiver(post_save, sender=DoctorLeave)
+@receiver(post_delete, sender=DoctorLeave)
+def doctor_schedule_changed(sender, instance, **kwargs):
+    """Regenerate a doctor's open slots, once per transaction, when their schedule changes"""
+    regenerate_slots_on_commit(instance.doctor_id)
+
+
+@receiver(appointments_bulk_changed, sender=Appointment)
+def appointments_bulk_cancelled(sender, before, after, backfill=True, **kwargs):
+    """Backfill slots freed by a bulk cancellation from the waitlist"""
+    from .waitlist_utils import is_cancellation, promote_waitlist
+
+    if not backfill:
+        return
+    previous = {row['id']: row for row in before}
+    for row in after:
+        old = previous.get(row['id'])
+        if old and is_cancellation(old, row):
+            promote_waitlist(old['doctor_id'], old['appointment_date'], old['appointment_time'])
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_counters_saved(sender, instance, created, **kwargs):
+    """Move the dashboard counters an appointment write affects"""
+    previous = getattr(instance, '_loaded_row', None)
+    if not created and previous is None:
+        # Saved from an instance that was never loaded; its old row is unknown
+        return
+    removed = appointment_keys(previous) if previous else []
+    apply_counter_deltas(counter_deltas(removed, appointment_keys(instance.change_row())))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_counters_deleted(sender, instance, **kwargs):
+    """Drop a deleted appointment from the dashboard counters"""
+    row = getattr(instance, '_loaded_row', None) or instance.change_row()
+    apply_counter_deltas(counter_deltas(appointment_keys(row), []))
+
+
+@receiver(appointments_bulk_changed, sender=Appointment)
+def appointments_bulk_changed_counters(sender, before, after, **kwargs):
+    """Move the dashboard counters after a bulk write"""
+    removed = [key for row in before for key in appointment_keys(row)]
+    added = [key for row in after for key in appointment_keys(row)]
+    apply_counter_deltas(counter_deltas(removed, added))
+
+
+@receiver(pre_save, sender=Doctor)
+@receiver(pre_save, sender=Patient)
+def profile_verification_loaded(sender, instance, **kwargs):
+    """Remember whether a profile was verified before this save"""
+    instance._stored_verified = None
+    if instance.pk:
+        instance._stored_verified = sender.objects.filter(pk=instance.pk).values_list(
+            'verified', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def profile_counters_saved(sender, instance, created, **kwargs):
+    """Count new profiles and verification changes"""
+    stored = getattr(instance, '_stored_verified', None)
+    removed = profile_keys(sender, stored) if stored is not None else []
+    apply_counter_deltas(counter_deltas(removed, profile_keys(sender, instance.verified)))
+
+
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+def profile_counters_deleted(sender, instance, **kwargs):
+    """Drop a deleted profile and its own counters"""
+    apply_counter_deltas(counter_deltas(profile_keys(sender, instance.verified), []))
+    DashboardCounter.objects.filter(scope=sender._meta.model_name, scope_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_search_saved(sender, instance, created, **kwargs):
+    """Re-index an appointment whose symptoms, patient or doctor changed"""
+    # Status, payment and reminder updates leave the index alone
+    if created or getattr(instance, '_loaded_search', None) != instance.search_state():
+        index_appointments([instance.pk])
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_search_deleted(sender, instance, **kwargs):
+    """Drop a deleted appointment from the search index"""
+    unindex_appointment(instance.pk)
+
+
+@receiver(appointments_bulk_changed, sender=Appointment)
+def appointments_bulk_changed_search(sender, before, after, **kwargs):
+    """Index new appointments and those that changed patient or doctor"""
+    previous = {row['id']: row for row in before}
+    changed = []
+    for row in after:
+        old = previous.get(row['id'])
+        if old is None or (old['patient_id'], old['doctor_id']) != (row['patient_id'], row['doctor_id']):
+            changed.append(row['id'])
+    index_appointments(changed)
+
+
+@receiver(post_save, sender=User)
+def user_search_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Re-index a patient's or doctor's appointments after a name change"""
+    if created or (update_fields is not None and not NAME_FIELDS & set(update_fields)):
+        return
+    index_user_appointments(instance.pk)
+
+
+def _touch_current(appointments):
+    """
+    Expire the cached rows of appointments from today onwards
+
+    Rows of past days are left to expire with the fragment cache (one day),
+    so editing a long-standing patient does not rewrite their whole history.
+    """
+    appointments.filter(starts_at__gte=local_start(timezone.localdate())).touch()
+
+
+@receiver(post_save, sender=User)
+def user_appointments_touched(sender, instance, created, update_fields=None, **kwargs):
+    """Expire cached appointment rows showing a renamed patient or doctor"""
+    if created or (update_fields is not None and not NAME_FIELDS & set(update_fields)):
+        return
+    _touch_current(Appointment.objects.filter(Q(patient__user=instance) | Q(doctor__user=instance)))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def profile_appointments_touched(sender, instance, created, update_fields=None, **kwargs):
+    """Expire cached appointment rows showing a changed profile (contact, age, specialization)"""
+    if created or (update_fields is not None and not PROFILE_FIELDS & set(update_fields)):
+        return
+    _touch_current(instance.appointments.all())
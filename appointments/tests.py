@@ -1,3 +1,1245 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import re
+import runpy
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from datetime import date, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipIf, skipUnless
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.core.cache import caches
+from django.db.models.signals import post_save, pre_save
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User, Doctor, DoctorWorkingHours, Patient
+from accounts.directory_utils import get_doctor_directory
+from accounts.search_utils import search_index_enabled, reset_search_index_cache
+from .models import Appointment, Invoice, InvoiceJob, DashboardCounter
+from .counter_utils import get_counters, rebuild_counters
+from .availability_utils import earliest_free_slots, refresh_availability, slot_status
+from .booking_utils import (
+    save_appointment, book_appointment_slot, book_recurring_appointments, release_expired_holds, extend_hold
+)
+from .payment_utils import settle_lapsed_payment
+from .forms import AppointmentForm
+from .pagination_utils import keyset_paginate, seek
+from .search_utils import (
+    MAX_CANDIDATES, SEARCH_TABLE, rebuild_search_index, search_appointment_ids
+)
+from .reminder_utils import get_appointments_needing_reminders
+from .database_utils import REPLICA_DB
+from .assignment_utils import auto_assign_appointments
+from .signals import appointments_bulk_changed
+from .waitlist_utils import add_to_waitlist, promote_waitlist
+from .utils import InvoiceRenderer
+from .invoice_utils import claim_invoice_job, request_invoice_pdf, run_invoice_job
+from .models import DoctorAvailability, WaitlistEntry
 
-# Create your tests here.
+
+def make_doctor(username='doctor', first_name='', specialization='Cardiology'):
+    """A verified doctor whose login is the username with password 'secret'"""
+    user = User.objects.create_user(username, password='secret', role='doctor', first_name=first_name)
+    return Doctor.objects.create(user=user, specialization=specialization, contact='1', verified=True)
+
+
+def make_patient(username='patient', first_name='', verified=True, **profile):
+    """A patient whose login is the username with password 'secret'"""
+    user = User.objects.create_user(username, password='secret', role='patient', first_name=first_name)
+    return Patient.objects.create(user=user, contact='2', verified=verified, **profile)
+
+
+def booking_day():
+    """Tomorrow: bookable, within the schedule horizon and not yet started"""
+    return date.today() + timedelta(days=1)
+
+
+def book(patient, doctor, start, day=None, symptoms='Checkup', **fields):
+    """Create an appointment at ``start`` on ``day`` (default booking_day())"""
+    return Appointment.objects.create(
+        patient=patient, doctor=doctor, appointment_date=day or booking_day(),
+        appointment_time=start, symptoms=symptoms, **fields
+    )
+
+
+class AppointmentListQueryCountTests(TestCase):
+    """Appointment lists must cost a fixed number of queries, whatever their length"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='secret', role='admin')
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.patient = make_patient(first_name='Ravi', age=30)
+
+    def add_appointments(self, count):
+        """Create appointments that exercise every related lookup the templates make"""
+        start = date.today() + timedelta(days=1 + Appointment.objects.count())
+        for offset in range(count):
+            appointment = book(
+                self.patient, None if offset % 2 else self.doctor, time(10),
+                day=start + timedelta(days=offset), symptoms='Headache',
+                status='completed' if offset % 3 == 0 else 'pending'
+            )
+            if appointment.status == 'completed':
+                Invoice.objects.create(appointment=appointment, amount=500)
+
+    def assertQueriesPinned(self, username, url, expected):
+        """Check the page query count with a short and a long list"""
+        self.client.login(username=username, password='secret')
+        get_doctor_directory()
+        self.add_appointments(2)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_appointments(10)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_patient_appointments(self):
+        self.assertQueriesPinned('patient', reverse('patient_appointments'), 4)
+
+    def test_doctor_appointments(self):
+        self.assertQueriesPinned('doctor', reverse('doctor_appointments'), 4)
+
+    def test_admin_manage_appointments(self):
+        self.assertQueriesPinned('admin', reverse('admin_manage_appointments'), 4)
+
+
+class DashboardCounterTests(TestCase):
+    """Incrementally maintained counters must match a full rebuild"""
+
+    def snapshot(self):
+        return sorted(DashboardCounter.objects.exclude(value=0).values_list('scope', 'scope_id', 'name', 'value'))
+
+    def test_counters_follow_writes(self):
+        doctor = make_doctor()
+        patient = make_patient(verified=False)
+        day = booking_day()
+
+        first = book(patient, doctor, time(10), day=day, symptoms='Cough')
+        book(patient, None, time(11), day=day, symptoms='Cough')
+        first.status = 'confirmed'
+        first.save()
+        Appointment.objects.filter(doctor__isnull=True).synced_update(status='cancelled')
+
+        counters = get_counters('patient', patient.id)
+        self.assertEqual(counters['appointments'], 2)
+        self.assertEqual(counters['appointments_confirmed'], 1)
+        self.assertEqual(counters['appointments_pending'], 0)
+        self.assertEqual(get_counters('doctor', doctor.id)['appointments'], 1)
+        self.assertEqual(get_counters('global')['patients_unverified'], 1)
+
+        first.delete()
+        incremental = self.snapshot()
+        rebuild_counters()
+        self.assertEqual(incremental, self.snapshot())
+
+
+class AppointmentOverlapTests(TestCase):
+    """Conflicts are decided by overlapping time ranges, not identical start times"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        cls.day = booking_day()
+        cls.booked = book(cls.patient, cls.doctor, time(10), day=cls.day, duration_minutes=60)
+
+    def book(self, start, **kwargs):
+        return Appointment(
+            patient=self.patient, doctor=self.doctor, appointment_date=self.day,
+            appointment_time=start, symptoms='Checkup', **kwargs
+        )
+
+    def test_overlapping_start_conflicts(self):
+        with self.assertRaises(ValidationError):
+            self.book(time(10, 45)).save()
+        with self.assertRaises(ValidationError):
+            self.book(time(9, 45)).save()
+
+    def test_adjacent_appointments_do_not_conflict(self):
+        self.book(time(11)).save()
+        self.book(time(9, 30)).save()
+        self.assertEqual(Appointment.objects.starting_on(self.day).count(), 3)
+
+    def test_schedule_is_timezone_aware(self):
+        self.assertEqual(timezone.localtime(self.booked.starts_at).time(), time(10))
+        self.assertEqual(self.booked.ends_at - self.booked.starts_at, timedelta(minutes=60))
+
+    def test_availability_marks_whole_duration(self):
+        booked = DoctorAvailability.objects.get(doctor=self.doctor, date=self.day).booked_mask
+        self.assertEqual(booked, 0b11 << 20)
+
+
+class SlotAvailabilityTests(TestCase):
+    """The availability index follows bookings, cancellations and deletions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor()
+        cls.patient = make_patient()
+        cls.day = booking_day()
+
+    def setUp(self):
+        self.client.login(username='patient', password='secret')
+
+    def free_times(self):
+        response = self.client.get(reverse('free_slots'), {
+            'doctor_id': self.doctor.id, 'start': self.day.isoformat(), 'end': self.day.isoformat()
+        })
+        return response.json()['slots'][self.day.isoformat()]
+
+    def available(self, start):
+        return self.client.get(reverse('check_availability'), {
+            'doctor_id': self.doctor.id, 'date': self.day.isoformat(), 'time': start
+        }).json()['available']
+
+    def test_index_follows_appointment_writes(self):
+        self.assertEqual(len(self.free_times()), 18)  # 09:00 to 17:30
+        appointment = book(self.patient, self.doctor, time(10), day=self.day)
+        self.assertNotIn('10:00', self.free_times())
+        self.assertFalse(self.available('10:00'))
+        self.assertTrue(self.available('10:30'))
+
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertIn('10:00', self.free_times())
+
+        appointment.status = 'pending'
+        appointment.appointment_time = time(11)
+        appointment.save()
+        self.assertIn('10:00', self.free_times())
+        self.assertNotIn('11:00', self.free_times())
+
+        appointment.delete()
+        self.assertEqual(len(self.free_times()), 18)
+
+    def test_index_follows_duration_changes(self):
+        appointment = book(self.patient, self.doctor, time(10), day=self.day)
+        appointment.duration_minutes = 60
+        appointment.save()
+        self.assertFalse(self.available('10:30'))
+
+        appointment.duration_minutes = 30
+        appointment.save()
+        self.assertTrue(self.available('10:30'))
+
+    def test_range_is_bounded(self):
+        response = self.client.get(reverse('free_slots'), {
+            'doctor_id': self.doctor.id, 'start': self.day.isoformat(),
+            'end': (self.day + timedelta(days=40)).isoformat()
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(SCHEDULE_HORIZON_WEEKS=1)
+class DoctorScheduleTests(TestCase):
+    """Doctors with working hours are only bookable on generated days inside them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        make_patient()
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for weekday in range(7):
+                DoctorWorkingHours.objects.create(
+                    doctor=self.doctor, weekday=weekday, start_time=time(9), end_time=time(12)
+                )
+        # Seven saved rows, one regeneration: working hours, leave, one upsert
+        with self.assertNumQueries(3):
+            for callback in callbacks:
+                callback()
+        self.client.login(username='patient', password='secret')
+
+    def test_free_slots_stop_at_horizon(self):
+        tomorrow = booking_day()
+        beyond = date.today() + timedelta(days=10)
+        slots = self.client.get(reverse('free_slots'), {
+            'doctor_id': self.doctor.id, 'start': tomorrow.isoformat(), 'end': beyond.isoformat()
+        }).json()['slots']
+        self.assertEqual(slots[tomorrow.isoformat()], ['09:00', '09:30', '10:00', '10:30', '11:00', '11:30'])
+        self.assertEqual(slots[beyond.isoformat()], [])
+        self.assertEqual(slot_status(self.doctor.id, beyond, time(10)), 'closed')
+
+    def test_form_rejects_dates_past_horizon(self):
+        form = AppointmentForm({
+            'doctor': self.doctor.id, 'appointment_date': date.today() + timedelta(days=10),
+            'appointment_time': '10:00', 'symptoms': 'Checkup'
+        })
+        self.assertIn('appointment_date', form.errors)
+        form = AppointmentForm({
+            'doctor': self.doctor.id, 'appointment_date': booking_day(),
+            'appointment_time': '14:00', 'symptoms': 'Checkup'
+        })
+        self.assertIn('not available', form.errors['appointment_time'][0])
+
+
+class BookingServiceTests(TestCase):
+    """A slot lost to a concurrent booking surfaces as the usual form error"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.patient = make_patient()
+        cls.day = booking_day()
+        cls.booked = book(cls.patient, cls.doctor, time(10), day=cls.day)
+
+    def duplicate(self):
+        return Appointment(
+            patient=self.patient, doctor=self.doctor, appointment_date=self.day,
+            appointment_time=time(10), symptoms='Checkup'
+        )
+
+    def test_unique_constraint_is_translated(self):
+        # What a booking that passed the overlap check just before the other insert hits
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.duplicate().save(check_conflicts=False)
+        with self.assertRaisesMessage(ValidationError, 'This time slot is already booked'):
+            save_appointment(self.duplicate(), check_conflicts=False)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_booking_post_checks_overlaps_once(self):
+        self.client.login(username='patient', password='secret')
+        get_doctor_directory()  # Warm, as on a busy server
+        data = {'doctor': self.doctor.id, 'appointment_date': self.day.isoformat(), 'symptoms': 'Checkup'}
+        with self.assertNumQueries(23) as queries:
+            response = self.client.post(reverse('book_appointment'), {**data, 'appointment_time': '11:00'})
+        self.assertEqual(response.status_code, 302)
+        overlap_checks = [query for query in queries if '"ends_at" >' in query['sql']]
+        self.assertEqual(len(overlap_checks), 1)
+
+        response = self.client.post(reverse('book_appointment'), {**data, 'appointment_time': '10:00'})
+        self.assertContains(response, 'This time slot is already booked')
+
+    def test_status_change_skips_conflict_check(self):
+        appointment = Appointment.objects.get(pk=self.booked.pk)
+        appointment.status = 'confirmed'
+        self.assertFalse(appointment.needs_conflict_check())
+        appointment.appointment_time = time(11)
+        self.assertTrue(appointment.needs_conflict_check())
+
+
+class RecurringBookingTests(TestCase):
+    """A series is checked with one query and inserted together with its derived data"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.patient = make_patient()
+        cls.day = booking_day()
+        book(cls.patient, cls.doctor, time(10), day=cls.day + timedelta(weeks=1))
+
+    def first(self):
+        return Appointment(
+            patient=self.patient, doctor=self.doctor, appointment_date=self.day,
+            appointment_time=time(10), symptoms='Follow-up'
+        )
+
+    def test_series_skips_taken_dates(self):
+        created, skipped = book_recurring_appointments(self.first(), 'weekly', 3)
+        self.assertEqual([appointment.appointment_date for appointment in created],
+                         [self.day, self.day + timedelta(weeks=2)])
+        self.assertEqual(skipped, {self.day + timedelta(weeks=1): 'already booked'})
+        self.assertEqual(slot_status(self.doctor.id, self.day + timedelta(weeks=2), time(10)), 'booked')
+        self.assertEqual(get_counters('patient', self.patient.id)['appointments'], 3)
+
+    def test_derived_data_commits_with_insert(self):
+        def fail(**kwargs):
+            raise RuntimeError('receiver failed')
+
+        appointments_bulk_changed.connect(fail, sender=Appointment)
+        self.addCleanup(appointments_bulk_changed.disconnect, fail, sender=Appointment)
+        with self.assertRaises(RuntimeError):
+            book_recurring_appointments(self.first(), 'weekly', 3)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(slot_status(self.doctor.id, self.day, time(10)), 'free')
+        self.assertEqual(get_counters('patient', self.patient.id)['appointments'], 1)
+
+
+class SlotHoldTests(TestCase):
+    """Unpaid bookings hold their slot only until the checkout hold expires"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.patients = []
+        for number in range(2):
+            cls.patients.append(make_patient(f'patient{number}'))
+        cls.day = booking_day()
+
+    def book(self, patient, start=time(10)):
+        return book_appointment_slot(Appointment(
+            patient=patient, doctor=self.doctor, appointment_date=self.day,
+            appointment_time=start, symptoms='Checkup'
+        ))
+
+    def expire(self, appointment):
+        Appointment.objects.filter(pk=appointment.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+
+    def test_live_hold_blocks_slot(self):
+        held = self.book(self.patients[0])
+        self.assertAlmostEqual(held.hold_expires_at, timezone.now() + timedelta(minutes=15), delta=timedelta(minutes=1))
+        with self.assertRaises(ValidationError):
+            self.book(self.patients[1])
+
+    def test_expired_hold_is_released_for_new_booking(self):
+        abandoned = self.book(self.patients[0])
+        self.expire(abandoned)
+        taken = self.book(self.patients[1])
+        self.assertEqual(Appointment.objects.get(pk=abandoned.pk).status, 'cancelled')
+        self.assertEqual(Appointment.objects.get(pk=taken.pk).status, 'pending')
+
+    def test_sweeper_releases_only_expired_unpaid_holds(self):
+        abandoned = self.book(self.patients[0], time(10))
+        paid = self.book(self.patients[0], time(11))
+        live = self.book(self.patients[1], time(12))
+        self.expire(abandoned)
+        self.expire(paid)
+        Appointment.objects.filter(pk=paid.pk).update(payment_status='paid')
+
+        call_command('release_expired_holds', stdout=io.StringIO())
+        statuses = dict(Appointment.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {abandoned.pk: 'cancelled', paid.pk: 'pending', live.pk: 'pending'})
+        self.assertEqual(slot_status(self.doctor.id, self.day, time(10)), 'free')
+        self.assertEqual(slot_status(self.doctor.id, self.day, time(12)), 'booked')
+
+    def test_checkout_extends_only_running_holds_up_to_the_cap(self):
+        held = self.book(self.patients[0])
+        self.assertTrue(extend_hold(held))
+
+        # Booked 35 minutes ago: the hold may only run to 45 minutes after booking
+        booked_at = timezone.now() - timedelta(minutes=35)
+        Appointment.objects.filter(pk=held.pk).update(
+            created_at=booked_at, hold_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        held.refresh_from_db()
+        self.assertTrue(extend_hold(held))
+        self.assertEqual(held.hold_expires_at, booked_at + timedelta(minutes=45))
+        self.assertFalse(extend_hold(held))
+
+        self.expire(held)
+        held.refresh_from_db()
+        self.assertFalse(extend_hold(held))
+        self.assertLess(Appointment.objects.get(pk=held.pk).hold_expires_at, timezone.now())
+
+    def test_reopened_checkout_releases_expired_hold(self):
+        held = self.book(self.patients[0])
+        self.expire(held)
+        self.client.login(username='patient0', password='secret')
+        response = self.client.get(reverse('initiate_payment', args=[held.id]))
+        self.assertRedirects(response, reverse('patient_appointments'), fetch_redirect_response=False)
+        self.assertEqual(Appointment.objects.get(pk=held.pk).status, 'cancelled')
+        self.assertEqual(slot_status(self.doctor.id, self.day, time(10)), 'free')
+
+    def test_lapsed_payment_is_refunded(self):
+        lapsed = self.book(self.patients[0])
+        lapsed.status = 'cancelled'
+        lapsed.save()
+        message = settle_lapsed_payment(lapsed, 'pay_1', {'success': True, 'refund': {}})
+        self.assertIn('has been refunded', message)
+        self.assertEqual(Appointment.objects.get(pk=lapsed.pk).payment_status, 'refunded')
+
+    def test_failed_refund_is_flagged_for_staff(self):
+        lapsed = self.book(self.patients[0])
+        lapsed.status = 'cancelled'
+        lapsed.save()
+        with self.assertLogs('appointments.payment_utils', 'ERROR'):
+            message = settle_lapsed_payment(lapsed, 'pay_1', {'success': False, 'error': 'Gateway timeout'})
+        self.assertNotIn('has been refunded', message)
+        self.assertIn('contact support', message)
+        lapsed = Appointment.objects.get(pk=lapsed.pk)
+        self.assertEqual((lapsed.status, lapsed.payment_status, lapsed.payment_id), ('cancelled', 'refund_pending', 'pay_1'))
+
+
+class WaitlistTests(TestCase):
+    """Cancelled slots go to the head of the waitlist, never onto a taken slot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.patients = []
+        for number in range(4):
+            cls.patients.append(make_patient(f'patient{number}'))
+        cls.day = booking_day()
+
+    def book(self, patient, start=time(10), **kwargs):
+        return book(patient, self.doctor, start, day=self.day, **kwargs)
+
+    def wait(self, patient, priority=0):
+        return add_to_waitlist(patient, self.doctor, self.day, 'Waiting', priority)[0]
+
+    def test_cancellation_promotes_highest_priority(self):
+        booked = self.book(self.patients[0])
+        first = self.wait(self.patients[1])
+        urgent = self.wait(self.patients[2], priority=5)
+
+        booked.status = 'cancelled'
+        booked.save()
+        urgent.refresh_from_db()
+        self.assertEqual(urgent.status, 'promoted')
+        self.assertEqual((urgent.appointment.appointment_time, urgent.appointment.status), (time(10), 'pending'))
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'waiting')
+
+    def test_promotion_respects_overlapping_bookings(self):
+        self.book(self.patients[0], time(9, 30), duration_minutes=60)
+        entry = self.wait(self.patients[1])
+        self.assertIsNone(promote_waitlist(self.doctor.id, self.day, time(10)))
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'waiting')
+
+    def test_retried_booking_keeps_released_hold(self):
+        abandoned = self.book(self.patients[0], hold_expires_at=timezone.now() - timedelta(minutes=1))
+        entry = self.wait(self.patients[1])
+        taken = book_appointment_slot(Appointment(
+            patient=self.patients[2], doctor=self.doctor, appointment_date=self.day,
+            appointment_time=time(10), symptoms='Checkup'
+        ))
+        self.assertEqual(Appointment.objects.get(pk=abandoned.pk).status, 'cancelled')
+        self.assertEqual(taken.patient, self.patients[2])
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'waiting')
+
+        # The sweeper, by contrast, hands released slots to the waitlist
+        Appointment.objects.filter(pk=taken.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        release_expired_holds()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'promoted')
+
+
+class WaitlistAutocommitTests(TransactionTestCase):
+    """A cancellation saved outside any transaction still promotes inside one"""
+
+    def test_bare_save_promotes_atomically(self):
+        doctor = make_doctor(first_name='Asha')
+        booked = book(make_patient('patient0'), doctor, time(10))
+        entry = add_to_waitlist(make_patient('patient1'), doctor, booked.appointment_date, 'Waiting')[0]
+        in_transaction = []
+
+        def entry_saved(sender, **kwargs):
+            in_transaction.append(connection.in_atomic_block)
+        post_save.connect(entry_saved, sender=WaitlistEntry)
+        self.addCleanup(post_save.disconnect, entry_saved, sender=WaitlistEntry)
+
+        booked.status = 'cancelled'
+        booked.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, 'promoted')
+        self.assertEqual(in_transaction, [True])
+
+
+class AutoAssignTests(TestCase):
+    """Unassigned appointments go to the least loaded free doctor of the right specialization"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = []
+        for number in range(2):
+            cls.doctors.append(make_doctor(f'doctor{number}'))
+        cls.patient = make_patient()
+        cls.day = booking_day()
+
+    def book(self, start, doctor=None, specialization='Cardiology'):
+        return book(self.patient, doctor, start, day=self.day, requested_specialization=specialization)
+
+    def test_assigns_by_load_and_specialization(self):
+        self.book(time(9), doctor=self.doctors[0])
+        first = self.book(time(10))
+        second = self.book(time(11))
+        unmatched = self.book(time(12), specialization='Dermatology')
+
+        result = auto_assign_appointments()
+        self.assertEqual((result['assigned'], result['unassigned'], result['next_cursor']), (2, 1, None))
+        doctors = dict(Appointment.objects.values_list('pk', 'doctor_id'))
+        self.assertEqual(doctors[first.pk], self.doctors[1].id)
+        self.assertEqual(doctors[second.pk], self.doctors[0].id)
+        self.assertIsNone(doctors[unmatched.pk])
+        self.assertEqual(slot_status(self.doctors[1].id, self.day, time(10)), 'booked')
+
+    def test_batches_are_capped(self):
+        for hour in (10, 11, 12):
+            self.book(time(hour))
+        result = auto_assign_appointments(batch_size=2)
+        self.assertEqual(result['assigned'], 2)
+        result = auto_assign_appointments(after=result['next_cursor'], batch_size=2)
+        self.assertEqual((result['assigned'], result['next_cursor']), (1, None))
+
+    def test_slot_taken_meanwhile_is_skipped(self):
+        Doctor.objects.filter(pk=self.doctors[1].pk).update(verified=False)
+        self.book(time(10), doctor=self.doctors[0])
+        # A booking the availability index has not caught up with yet
+        DoctorAvailability.objects.update(booked_slots=b'')
+        clashing = self.book(time(10))
+        free = self.book(time(11))
+
+        result = auto_assign_appointments()
+        self.assertEqual((result['assigned'], result['unassigned']), (1, 1))
+        doctors = dict(Appointment.objects.values_list('pk', 'doctor_id'))
+        self.assertIsNone(doctors[clashing.pk])
+        self.assertEqual(doctors[free.pk], self.doctors[0].id)
+
+
+@override_settings(ADMIN_APPOINTMENTS_PAGE_SIZE=2)
+class KeysetPaginationTests(TestCase):
+    """Cursor pages of the admin manager neither skip nor repeat rows, even on timestamp ties"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('admin', password='secret', role='admin')
+        patient = make_patient()
+        day = booking_day()
+        cls.appointments = [
+            book(patient, None, time(9 + offset), day=day, status='cancelled' if offset == 2 else 'pending')
+            for offset in range(6)
+        ]
+        # Three rows share a created_at, so only the id tells them apart
+        created = timezone.now() - timedelta(days=1)
+        Appointment.objects.filter(pk__in=[a.pk for a in cls.appointments[1:4]]).update(created_at=created)
+        Appointment.objects.filter(pk=cls.appointments[0].pk).update(created_at=created - timedelta(hours=1))
+        cls.expected = list(Appointment.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def test_pages_cover_rows_exactly_once(self):
+        ordering = ('-created_at', '-id')
+        pages = []
+        cursor = None
+        while True:
+            page = keyset_paginate(Appointment.objects.all(), ordering, after=cursor, page_size=2)
+            pages.append([appointment.pk for appointment in page['items']])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual([pk for items in pages for pk in items], self.expected)
+        self.assertEqual(len(pages), 3)
+
+        # Walking back from the last page returns the page before it
+        back = keyset_paginate(Appointment.objects.all(), ordering, before=page['previous_cursor'], page_size=2)
+        self.assertEqual([appointment.pk for appointment in back['items']], pages[1])
+        self.assertIsNotNone(back['previous_cursor'])
+
+    def test_manager_pages_keep_filters(self):
+        self.client.login(username='admin', password='secret')
+        seen = []
+        query = 'status=pending'
+        while query:
+            response = self.client.get(f"{reverse('admin_manage_appointments')}?{query}")
+            seen += [appointment.pk for appointment in response.context['appointments']]
+            query = response.context['next_query']
+        self.assertEqual(seen, [pk for pk in self.expected if pk != self.appointments[2].pk])
+
+
+class AppointmentSearchTests(TestCase):
+    """Appointment search applies filters inside the FTS5 index, keeps search_fields and survives without the index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_superuser('root', password='secret', role='admin')
+        cls.ravi = make_patient('ravi', first_name='Ravi')
+        cls.anil = make_patient('fevers', first_name='Anil')
+        cls.day = booking_day()
+        cls.fever = book(cls.ravi, None, time(9), day=cls.day, symptoms='Fever')
+        cls.headache = book(cls.anil, None, time(10), day=cls.day, symptoms='Headache')
+
+    def setUp(self):
+        if not search_index_enabled(SEARCH_TABLE):
+            self.skipTest('SQLite without FTS5 trigram support')
+
+    def indexed_symptoms(self, appointment):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT symptoms FROM {SEARCH_TABLE} WHERE rowid = %s', [appointment.pk])
+            return cursor.fetchone()[0]
+
+    def test_filters_apply_before_candidate_cap(self):
+        # More better-ranked cancelled matches than the index returns
+        cancelled = [
+            Appointment(patient=self.ravi, appointment_date=self.day, appointment_time=time(11),
+                        symptoms='Fever, fever', status='cancelled')
+            for _ in range(MAX_CANDIDATES)
+        ]
+        for appointment in cancelled:
+            appointment.update_schedule()
+        Appointment.objects.bulk_create(cancelled)
+        rebuild_search_index()
+        pending = Appointment.objects.filter(status='pending')
+        self.assertEqual(search_appointment_ids(pending, 'fever'), [self.fever.pk])
+
+    def test_admin_search_keeps_search_fields(self):
+        self.client.login(username='root', password='secret')
+        url = reverse('admin:appointments_appointment_changelist')
+        # Symptoms match through the index and the username 'fevers' through search_fields
+        response = self.client.get(url, {'q': 'fever'})
+        self.assertEqual([a.pk for a in response.context['cl'].result_list], [self.fever.pk, self.headache.pk])
+        response = self.client.get(url, {'q': 'fevers'})
+        self.assertIn(self.headache.pk, [a.pk for a in response.context['cl'].result_list])
+
+    def test_reindexes_only_when_indexed_fields_change(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {SEARCH_TABLE} SET symptoms = 'stale' WHERE rowid = %s", [self.fever.pk])
+        appointment = Appointment.objects.get(pk=self.fever.pk)
+        appointment.status = 'confirmed'
+        appointment.save()
+        self.assertEqual(self.indexed_symptoms(appointment), 'stale')
+
+        appointment.symptoms = 'Fever and cough'
+        appointment.save()
+        self.assertEqual(self.indexed_symptoms(appointment), 'Fever and cough')
+
+    def test_falls_back_without_index(self):
+        # As on SQLite builds where migration 0010 could not create the table
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {SEARCH_TABLE}')
+        reset_search_index_cache()
+        self.addCleanup(reset_search_index_cache)
+        self.assertFalse(search_index_enabled(SEARCH_TABLE))
+
+        self.headache.symptoms = 'Migraine'
+        self.headache.save()
+        book(self.ravi, None, time(12), day=self.day, symptoms='Rash')
+        self.assertEqual(search_appointment_ids(Appointment.objects.all(), 'migraine'), [self.headache.pk])
+
+
+class EarliestSlotsTests(TestCase):
+    """Openings across doctors of a specialization come back merged in time order"""
+
+    def test_earliest_openings_across_doctors(self):
+        patient = make_patient()
+        doctors = []
+        for number, specialization in enumerate(['Cardiology', 'cardiology', 'Dermatology']):
+            doctors.append(make_doctor(f'doctor{number}', specialization=specialization))
+        day = booking_day()
+        for doctor, start in [(doctors[0], time(9)), (doctors[1], time(9)), (doctors[1], time(9, 30))]:
+            book(patient, doctor, start, day=day)
+
+        self.client.login(username='patient', password='secret')
+        response = self.client.get(reverse('earliest_slots'), {
+            'specialization': 'Cardiology', 'start': day.isoformat(), 'limit': 3
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(slot['doctor_id'], slot['time']) for slot in response.json()['slots']],
+            [(doctors[0].id, '09:30'), (doctors[0].id, '10:00'), (doctors[1].id, '10:00')]
+        )
+
+    def test_stops_at_the_first_day_with_enough_openings(self):
+        doctors = [make_doctor(f'doctor{number}') for number in range(2)]
+        day = booking_day()
+        # Working-hours lookup and the first day's bitmaps; later days are never read
+        with self.assertNumQueries(2):
+            openings = earliest_free_slots([doctor.id for doctor in doctors], day, day + timedelta(days=60), 3)
+        self.assertEqual(
+            [(doctor_id, opening_day) for doctor_id, opening_day, _ in openings],
+            [(doctors[0].id, day), (doctors[1].id, day), (doctors[0].id, day)]
+        )
+
+
+class APITests(TestCase):
+    """The JSON API pages with cursors, selects only the asked-for fields and scopes rows by role"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = make_doctor(first_name='Asha')
+        cls.day = booking_day()
+        cls.patients = []
+        for number in range(2):
+            cls.patients.append(make_patient(f'patient{number}'))
+        for hour in (9, 10, 11):
+            book(cls.patients[0], cls.doctor, time(hour), day=cls.day)
+        book(cls.patients[1], cls.doctor, time(12), day=cls.day)
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get(reverse('api_appointments')).status_code, 401)
+
+    def test_cursor_pages_with_sparse_fields(self):
+        self.client.login(username='patient0', password='secret')
+        seen = []
+        params = {'fields': 'id,doctor_name,appointment_time', 'limit': 2}
+        while True:
+            with self.assertNumQueries(3):  # session, user, page
+                body = self.client.get(reverse('api_appointments'), params).json()
+            seen += body['results']
+            if not body['next']:
+                break
+            params['after'] = body['next']
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(set(seen[0]), {'id', 'doctor_name', 'appointment_time'})
+        self.assertEqual(seen[0]['doctor_name'], 'Asha')
+
+        response = self.client.get(reverse('api_appointments'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_book_and_update_status(self):
+        self.client.login(username='patient1', password='secret')
+        payload = {'doctor': self.doctor.id, 'appointment_date': self.day.isoformat(),
+                   'appointment_time': '14:00', 'symptoms': 'Fever'}
+        response = self.client.post(reverse('api_appointments'), payload, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        appointment_id = response.json()['id']
+        response = self.client.post(reverse('api_appointments'), payload, content_type='application/json')
+        # Taken slots are reported by the booking service, like a lost race
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('already booked', response.json()['error'])
+
+        url = reverse('api_appointment_detail', args=[appointment_id])
+        self.assertEqual(self.client.patch(url, {'status': 'confirmed'}, content_type='application/json').status_code, 403)
+        self.client.login(username='doctor', password='secret')
+        response = self.client.patch(url, {'status': 'confirmed'}, content_type='application/json')
+        self.assertEqual(response.json()['status'], 'confirmed')
+
+    def test_invoices_scoped_to_owner(self):
+        appointment = Appointment.objects.filter(patient=self.patients[1]).get()
+        Invoice.objects.create(appointment=appointment, amount=500)
+        self.client.login(username='patient0', password='secret')
+        self.assertEqual(self.client.get(reverse('api_invoices')).json()['results'], [])
+        self.client.login(username='patient1', password='secret')
+        results = self.client.get(reverse('api_invoices'), {'fields': 'appointment_id,amount'}).json()['results']
+        self.assertEqual(results, [{'appointment_id': appointment.id, 'amount': '500.00'}])
+
+    def test_invoice_created_concurrently_is_a_conflict(self):
+        User.objects.create_user('admin', password='secret', role='admin')
+        appointment = Appointment.objects.filter(patient=self.patients[1]).get()
+        Appointment.objects.filter(pk=appointment.pk).synced_update(status='confirmed')
+
+        def other_request(sender, instance, **kwargs):
+            # Another admin invoices the appointment after this request checked for an invoice
+            pre_save.disconnect(other_request, sender=Invoice)
+            Invoice.objects.create(appointment=instance.appointment, amount=400)
+        pre_save.connect(other_request, sender=Invoice)
+        self.addCleanup(pre_save.disconnect, other_request, sender=Invoice)
+
+        self.client.login(username='admin', password='secret')
+        response = self.client.post(
+            reverse('api_invoices'), {'appointment_id': appointment.id, 'amount': '500'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], 'Invoice already exists for this appointment.')
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """Exports stream the filtered rows in chunks, as CSV or as a valid XLSX workbook"""
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create_user('admin', password='secret', role='admin')
+        doctor = make_doctor(first_name='Asha')
+        patient = make_patient(first_name='Ravi')
+        for hour in range(9, 14):
+            book(
+                patient, doctor, time(hour), symptoms='Cough & "fever"',
+                status='cancelled' if hour == 13 else 'pending'
+            )
+
+    def setUp(self):
+        self.client.login(username='admin', password='secret')
+
+    def test_csv_streams_filtered_rows(self):
+        response = self.client.get(reverse('export_appointments'), {'format': 'csv', 'status': 'pending'})
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 2)
+        rows = list(csv.reader(b''.join(chunks).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][:4], ['ID', 'Patient', 'Patient Contact', 'Doctor'])
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[1][1:4], ['Ravi', '2', 'Asha'])
+        self.assertEqual(rows[1][11], 'Cough & "fever"')
+
+    def test_csv_escapes_formulas(self):
+        Appointment.objects.update(symptoms='=HYPERLINK("http://example.com","Fever")', payment_amount=Decimal('-5'))
+        response = self.client.get(reverse('export_appointments'), {'format': 'csv'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[1][11], '\'=HYPERLINK("http://example.com","Fever")')
+        # Numbers are not text and stay as they are
+        self.assertEqual(rows[1][10], '-5.00')
+
+    def test_xlsx_is_a_readable_workbook(self):
+        response = self.client.get(reverse('export_appointments'), {'format': 'xlsx'})
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        rows = sheet.findall('s:sheetData/s:row', namespace)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1].find('s:c/s:v', namespace).text, str(Appointment.objects.latest('created_at').id))
+
+    def test_admin_only(self):
+        self.client.login(username='patient', password='secret')
+        self.assertEqual(self.client.get(reverse('export_invoices')).status_code, 302)
+
+
+class InvoiceRendererTests(SimpleTestCase):
+    """A reused renderer lays out each invoice exactly as a fresh one does"""
+
+    def test_reuse_is_byte_identical(self):
+        from reportlab import rl_config
+        from .management.commands.benchmark_invoices import SAMPLE_INVOICE
+
+        self.addCleanup(setattr, rl_config, 'invariant', rl_config.invariant)
+        rl_config.invariant = 1  # no timestamps or random ids in the output
+        renderer = InvoiceRenderer()
+        long_symptoms = dict(SAMPLE_INVOICE, symptoms='Persistent cough. ' * 200)
+        first, second = renderer.render_many([long_symptoms, SAMPLE_INVOICE])
+        self.assertEqual(first, InvoiceRenderer().render(long_symptoms))
+        self.assertEqual(second, InvoiceRenderer().render(SAMPLE_INVOICE))
+
+
+class GenerateInvoicesTests(TestCase):
+    """The batch command invoices each completed appointment once, rendering PDFs in worker processes"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        doctor = make_doctor(first_name='Asha')
+        patient = make_patient(first_name='Ravi')
+        day = date.today() - timedelta(days=1)
+        for hour, status, assigned in [(9, 'completed', True), (10, 'completed', True), (11, 'completed', True),
+                                       (12, 'pending', True), (13, 'completed', False)]:
+            book(patient, doctor if assigned else None, time(hour), day=day, status=status, payment_amount=650)
+
+    def test_invoices_completed_appointments_once(self):
+        call_command('generate_invoices', '--batch-size', '2', '--workers', '2', stdout=io.StringIO())
+        invoices = Invoice.objects.select_related('appointment')
+        self.assertEqual(sorted(invoice.appointment.appointment_time.hour for invoice in invoices), [9, 10, 11])
+        for invoice in invoices:
+            self.assertEqual(invoice.amount, 650)
+            with invoice.pdf_file.open('rb') as pdf:
+                self.assertEqual(pdf.read(4), b'%PDF')
+
+        call_command('generate_invoices', stdout=io.StringIO())
+        self.assertEqual(Invoice.objects.count(), 3)
+
+
+class InvoiceJobTests(TestCase):
+    """Downloads never render a PDF in the request; one queued job serves every waiting download"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        doctor = make_doctor(first_name='Asha')
+        patient = make_patient(first_name='Ravi')
+        appointment = book(
+            patient, doctor, time(10), day=date.today() - timedelta(days=1), status='completed'
+        )
+        self.invoice = Invoice.objects.create(appointment=appointment, amount=500)
+        self.client.login(username='patient', password='secret')
+
+    def status(self):
+        return self.client.get(reverse('invoice_status', args=[self.invoice.id])).json()
+
+    def test_download_waits_for_worker(self):
+        download_url = reverse('download_invoice', args=[self.invoice.id])
+        response = self.client.get(download_url)
+        self.assertTemplateUsed(response, 'appointments/invoice_pending.html')
+        self.client.get(download_url)
+        self.assertEqual(InvoiceJob.objects.filter(invoice=self.invoice).count(), 1)
+        self.assertEqual(self.status(), {'status': 'queued', 'download_url': None})
+
+        call_command('process_invoice_jobs', '--once', stdout=io.StringIO())
+        self.assertEqual(InvoiceJob.objects.get().status, 'done')
+        self.assertEqual(self.status(), {'status': 'ready', 'download_url': download_url})
+        response = self.client.get(download_url)
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+
+    def test_failed_render_is_retried_later_then_marked_failed(self):
+        self.client.get(reverse('download_invoice', args=[self.invoice.id]))
+        # A doctorless appointment cannot be rendered
+        Appointment.objects.filter(pk=self.invoice.appointment_id).update(doctor=None)
+        with override_settings(INVOICE_JOB_MAX_ATTEMPTS=2):
+            call_command('process_invoice_jobs', '--once', stdout=io.StringIO())
+            job = InvoiceJob.objects.get()
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            self.assertIsNone(claim_invoice_job())
+
+            retry_at = timezone.now() - timedelta(seconds=settings.INVOICE_JOB_RETRY_SECONDS)
+            InvoiceJob.objects.update(updated_at=retry_at)
+            call_command('process_invoice_jobs', '--once', stdout=io.StringIO())
+        job = InvoiceJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_deleted_invoice_fails_its_job(self):
+        request_invoice_pdf(self.invoice)
+        job = claim_invoice_job()
+        Invoice.objects.filter(pk=self.invoice.pk).delete()
+        self.assertFalse(run_invoice_job(job))
+
+    def test_generate_rejects_bad_amounts(self):
+        User.objects.create_user('admin', password='secret', role='admin')
+        self.client.login(username='admin', password='secret')
+        appointment = book(
+            self.invoice.appointment.patient, self.invoice.appointment.doctor, time(11),
+            day=date.today() - timedelta(days=1), status='completed'
+        )
+        url = reverse('generate_invoice', args=[appointment.id])
+        for amount in ('abc', '-5', 'NaN', '1e9'):
+            response = self.client.post(url, {'amount': amount}, follow=True)
+            self.assertContains(response, 'Invoice amount must be a positive number')
+        self.assertFalse(Invoice.objects.filter(appointment=appointment).exists())
+
+        self.client.post(url, {'amount': '750.5'})
+        self.assertEqual(Invoice.objects.get(appointment=appointment).amount, Decimal('750.50'))
+
+    def test_other_patients_cannot_poll(self):
+        User.objects.create_user('other', password='secret', role='patient')
+        self.client.login(username='other', password='secret')
+        response = self.client.get(reverse('invoice_status', args=[self.invoice.id]))
+        self.assertEqual(response.status_code, 403)
+
+
+class FragmentCacheTests(TestCase):
+    """Cached appointment rows re-render as soon as the appointment or a name on it changes"""
+
+    def setUp(self):
+        caches['template_fragments'].clear()
+        self.doctor = make_doctor(first_name='Asha')
+        patient = make_patient()
+        self.appointment = book(patient, self.doctor, time(10))
+        self.client.login(username='patient', password='secret')
+
+    def page(self):
+        return self.client.get(reverse('patient_appointments'))
+
+    def test_rows_render_from_cache_until_changed(self):
+        self.assertContains(self.page(), 'Dr. Asha')
+        cached = len(caches['template_fragments']._cache)
+        self.assertGreater(cached, 0)
+        self.assertContains(self.page(), 'Dr. Asha')
+        self.assertEqual(len(caches['template_fragments']._cache), cached)
+
+        Appointment.objects.filter(pk=self.appointment.pk).synced_update(status='cancelled')
+        self.assertContains(self.page(), 'Cancelled')
+
+        self.doctor.user.first_name = 'Meera'
+        self.doctor.user.save()
+        self.assertContains(self.page(), 'Dr. Meera')
+
+    def test_profile_changes_touch_only_current_rows(self):
+        past = book(
+            self.appointment.patient, self.doctor, time(10), day=date.today() - timedelta(days=30),
+            symptoms='Old visit', status='completed'
+        )
+        stamps = dict(Appointment.objects.values_list('pk', 'updated_at'))
+
+        self.doctor.verified = False
+        self.doctor.save(update_fields=['verified'])
+        self.assertEqual(dict(Appointment.objects.values_list('pk', 'updated_at')), stamps)
+
+        self.doctor.contact = '9'
+        self.doctor.save()
+        self.doctor.user.last_name = 'Rao'
+        self.doctor.user.save()
+        touched = dict(Appointment.objects.values_list('pk', 'updated_at'))
+        self.assertGreater(touched[self.appointment.pk], stamps[self.appointment.pk])
+        self.assertEqual(touched[past.pk], stamps[past.pk])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class QueryPlanTests(TestCase):
+    """Hot appointment queries must be answered from an index, never a full table scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        doctors = []
+        patients = []
+        for number in range(3):
+            doctors.append(make_doctor(f'doctor{number}'))
+            patients.append(make_patient(f'patient{number}'))
+
+        start = date.today() - timedelta(days=30)
+        appointments = [
+            Appointment(
+                patient=patients[offset % 3],
+                doctor=doctors[offset % 3],
+                appointment_date=start + timedelta(days=offset // 3),
+                appointment_time=time(9 + offset % 8),
+                symptoms='Fever',
+                status=('pending', 'confirmed', 'completed', 'cancelled')[offset % 4],
+                reminder_sent=offset % 2 == 0,
+            )
+            for offset in range(180)
+        ]
+        for appointment in appointments:
+            appointment.update_schedule()
+        Appointment.objects.bulk_create(appointments)
+        refresh_availability({(appointment.doctor_id, appointment.appointment_date) for appointment in appointments})
+        cls.doctor = doctors[0]
+        cls.patient = patients[0]
+
+    def assertUsesIndex(self, queryset, index):
+        """Fail if the plan scans any table or does not search the expected index"""
+        plan = queryset.explain()
+        self.assertNotRegex(plan, re.compile(r'\bSCAN\b'), f'Full scan in plan:\n{plan}')
+        self.assertIn(f'USING INDEX {index}', plan, f'Index {index} not used:\n{plan}')
+
+    def test_slot_conflict_check(self):
+        appointment = Appointment(
+            doctor=self.doctor, patient=self.patient, appointment_date=date.today(), appointment_time=time(10)
+        )
+        appointment.update_schedule()
+        self.assertUsesIndex(appointment.conflicting_appointments(), 'appointment_doctor_start_idx')
+
+    def test_doctor_upcoming(self):
+        self.assertUsesIndex(
+            Appointment.objects.upcoming(timedelta(days=1)).filter(doctor=self.doctor),
+            'appointment_doctor_start_idx'
+        )
+
+    def test_availability_lookup(self):
+        self.assertUsesIndex(
+            DoctorAvailability.objects.filter(doctor=self.doctor, date=date.today()),
+            'sqlite_autoindex_appointments_doctoravailability_1'
+        )
+
+    def test_patient_appointment_list(self):
+        self.assertUsesIndex(
+            Appointment.objects.with_related().filter(patient=self.patient).order_by(
+                '-appointment_date', '-appointment_time'
+            ),
+            'appointment_patient_date_idx'
+        )
+
+    def test_doctor_appointment_list(self):
+        self.assertUsesIndex(
+            Appointment.objects.with_related().filter(doctor=self.doctor).order_by(
+                '-appointment_date', '-appointment_time'
+            ),
+            'appointment_doctor_date_idx'
+        )
+
+    def test_reminder_sweep(self):
+        self.assertUsesIndex(get_appointments_needing_reminders(), 'appointment_reminder_due_idx')
+
+    def test_admin_manager_later_page(self):
+        ordering = ('-created_at', '-id')
+        cursor = keyset_paginate(Appointment.objects.all(), ordering, page_size=25)['next_cursor']
+        later_page = seek(Appointment.objects.with_related(), ordering, cursor).order_by(*ordering)[:26]
+        self.assertUsesIndex(later_page, 'appointment_created_idx')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The replica is simulated with a second SQLite file')
+@skipIf(REPLICA_DB in settings.DATABASES, 'A real replica is configured')
+class ReplicaRoutingTests(TransactionTestCase):
+    """List pages read the replica, except right after the browser wrote"""
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias only exists while these tests run, so it is added to
+        # ``databases`` here rather than announced to the test runner
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA_DB}
+        cls.replica_dir = tempfile.TemporaryDirectory()
+        cls.replica_path = Path(cls.replica_dir.name) / 'replica.sqlite3'
+        connections.settings[REPLICA_DB] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: {},
+            REPLICA_DB: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': cls.replica_path},
+        })[REPLICA_DB]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA_DB].close()
+        del connections[REPLICA_DB]
+        del connections.settings[REPLICA_DB]
+        cls.replica_dir.cleanup()
+
+    def replicate(self):
+        """Copy the primary into the replica file, like replication catching up"""
+        connections[REPLICA_DB].close()
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+
+    def test_reads_follow_replica_until_the_browser_writes(self):
+        patient = make_patient()
+        day = booking_day()
+        book(patient, None, time(10), day=day, symptoms='Replicated')
+        self.replicate()
+        self.client.login(username='patient', password='secret')
+
+        # Not replicated yet
+        book(patient, None, time(11), day=day, symptoms='Lagging')
+        response = self.client.get(reverse('patient_appointments'))
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Lagging')
+
+        response = self.client.post(reverse('book_appointment'), {
+            'appointment_date': day.isoformat(), 'appointment_time': '12:00', 'symptoms': 'Just booked',
+        })
+        self.assertEqual(Appointment.objects.filter(symptoms='Just booked').count(), 1)
+        self.assertFalse(Appointment.objects.using(REPLICA_DB).filter(symptoms='Just booked').exists())
+
+        response = self.client.get(reverse('patient_appointments'))
+        self.assertContains(response, 'Lagging')
+        self.assertContains(response, 'Just booked')
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    """DATABASES is read from the environment and new SQLite connections get SQLITE_PRAGMAS"""
+
+    def load_databases(self, **env):
+        """Evaluate settings.py with only the given DB_* environment variables set"""
+        saved = {name: value for name, value in os.environ.items() if name.startswith('DB_')}
+        for name in saved:
+            del os.environ[name]
+        os.environ.update(env)
+        try:
+            return runpy.run_path(str(settings.BASE_DIR / 'vishubh_project' / 'settings.py'))['DATABASES']
+        finally:
+            for name in env:
+                del os.environ[name]
+            os.environ.update(saved)
+
+    def test_defaults_to_project_sqlite_file(self):
+        databases = self.load_databases()
+        self.assertEqual(set(databases), {DEFAULT_DB_ALIAS})
+        default = databases[DEFAULT_DB_ALIAS]
+        self.assertEqual(default['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(default['NAME'], settings.BASE_DIR / 'db.sqlite3')
+        self.assertEqual(default['CONN_MAX_AGE'], 60)
+        self.assertFalse(default['CONN_HEALTH_CHECKS'])
+
+    def test_server_database_and_replica_from_environment(self):
+        databases = self.load_databases(
+            DB_ENGINE='postgresql', DB_NAME='clinic', DB_HOST='primary', DB_CONN_MAX_AGE='0',
+            DB_REPLICA_HOST='replica'
+        )
+        default = databases[DEFAULT_DB_ALIAS]
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((default['NAME'], default['HOST']), ('clinic', 'primary'))
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertTrue(default['CONN_HEALTH_CHECKS'])
+        replica = databases[REPLICA_DB]
+        self.assertEqual((replica['NAME'], replica['HOST']), ('clinic', 'replica'))
+        self.assertEqual(replica['TEST'], {'MIRROR': DEFAULT_DB_ALIAS})
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLITE_PRAGMAS only apply to SQLite')
+    def test_new_sqlite_connections_are_tuned(self):
+        # The test database lives in memory, where WAL is unavailable, so open a file
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = type(connections[DEFAULT_DB_ALIAS])(
+            {**connection.settings_dict, 'NAME': Path(directory.name) / 'tuned.sqlite3'}, alias='tuned'
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            values = {}
+            for name in settings.SQLITE_PRAGMAS:
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {
+            'journal_mode': 'wal',
+            'synchronous': 1,  # NORMAL
+            'busy_timeout': 5000,
+            'mmap_size': 128 * 1024 * 1024,
+        })
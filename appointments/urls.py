@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     # Patient appointment URLs
     path('book/', views.book_appointment, name='book_appointment'),
+    path('waitlist/join/', views.join_waitlist, name='join_waitlist'),
     path('patient/appointments/', views.patient_appointments, name='patient_appointments'),
     path('doctors/', views.doctors_list, name='doctors_list'),
     
@@ -13,11 +14,14 @@ urlpatterns = [
     
     # Admin appointment URLs
     path('admin/appointments/', views.admin_manage_appointments, name='admin_manage_appointments'),
+    path('admin/export/appointments/', views.export_appointments, name='export_appointments'),
+    path('admin/export/invoices/', views.export_invoices, name='export_invoices'),
     path('admin/generate-invoice/<int:appointment_id>/', views.generate_invoice, name='generate_invoice'),
     
     # Invoice URLs
     path('invoice/<int:invoice_id>/', views.view_invoice, name='view_invoice'),
     path('invoice/<int:invoice_id>/download/', views.download_invoice, name='download_invoice'),
+    path('invoice/<int:invoice_id>/status/', views.invoice_status, name='invoice_status'),
     
     # Payment URLs
     path('payment/initiate/<int:appointment_id>/', views.initiate_payment, name='initiate_payment'),
@@ -27,4 +31,6 @@ urlpatterns = [
     
     # AJAX endpoints
     path('check-availability/', views.check_availability, name='check_availability'),
+    path('free-slots/', views.free_slots, name='free_slots'),
+    path('earliest-slots/', views.earliest_slots, name='earliest_slots'),
 ]
@@ -7,158 +7,198 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from django.core.files.base import ContentFile
 from io import BytesIO
 import datetime
+import threading
+
+
+def invoice_data(invoice):
+    """
+    Everything an invoice PDF shows, as plain picklable values
+    
+    Reads the invoice's appointment, patient, doctor and their users; load
+    them with select_related to keep this query-free.
+    
+    Returns:
+        dict: Preformatted strings for render_invoice_pdf
+    """
+    appointment = invoice.appointment
+    patient = appointment.patient
+    doctor = appointment.doctor
+    return {
+        'number': f'#{invoice.id}',
+        'date': invoice.generated_date.strftime('%d %B %Y'),
+        'status': 'PAID' if appointment.status == 'completed' else 'PENDING',
+        'patient_name': patient.user.get_full_name(),
+        'patient_contact': patient.contact,
+        'patient_age': str(patient.age) if patient.age else 'N/A',
+        'patient_blood_group': patient.blood_group if patient.blood_group else 'N/A',
+        'doctor_name': f"Dr. {doctor.user.get_full_name()}",
+        'doctor_specialization': doctor.specialization,
+        'doctor_contact': doctor.contact,
+        'appointment_date': appointment.appointment_date.strftime('%d %B %Y'),
+        'appointment_time': appointment.appointment_time.strftime('%I:%M %p'),
+        'symptoms': appointment.symptoms,
+        'amount': f'₹{invoice.amount}',
+    }
 
 
 def generate_invoice_pdf(invoice):
     """
     Generate PDF invoice for an appointment
     """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
-                           topMargin=72, bottomMargin=18)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2563eb'),
-        spaceAfter=30,
-        alignment=TA_CENTER
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=12,
-    )
-    
-    # Title
-    title = Paragraph("VISHUBH HEALTHCARE", title_style)
-    elements.append(title)
-    
-    subtitle = Paragraph("Medical Invoice", styles['Heading2'])
-    elements.append(subtitle)
-    elements.append(Spacer(1, 12))
-    
-    # Invoice details
-    invoice_data = [
-        ['Invoice Number:', f'#{invoice.id}'],
-        ['Date:', invoice.generated_date.strftime('%d %B %Y')],
-        ['Status:', 'PAID' if invoice.appointment.status == 'completed' else 'PENDING'],
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[2*inch, 4*inch])
-    invoice_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(invoice_table)
-    elements.append(Spacer(1, 20))
-    
-    # Patient Information
-    elements.append(Paragraph("Patient Information", heading_style))
-    patient = invoice.appointment.patient
-    patient_data = [
-        ['Name:', patient.user.get_full_name()],
-        ['Contact:', patient.contact],
-        ['Age:', str(patient.age) if patient.age else 'N/A'],
-        ['Blood Group:', patient.blood_group if patient.blood_group else 'N/A'],
-    ]
-    
-    patient_table = Table(patient_data, colWidths=[2*inch, 4*inch])
-    patient_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(patient_table)
-    elements.append(Spacer(1, 20))
-    
-    # Doctor Information
-    elements.append(Paragraph("Doctor Information", heading_style))
-    doctor = invoice.appointment.doctor
-    doctor_data = [
-        ['Doctor:', f"Dr. {doctor.user.get_full_name()}"],
-        ['Specialization:', doctor.specialization],
-        ['Contact:', doctor.contact],
-    ]
-    
-    doctor_table = Table(doctor_data, colWidths=[2*inch, 4*inch])
-    doctor_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(doctor_table)
-    elements.append(Spacer(1, 20))
-    
-    # Appointment Details
-    elements.append(Paragraph("Appointment Details", heading_style))
-    appointment_data = [
-        ['Date:', invoice.appointment.appointment_date.strftime('%d %B %Y')],
-        ['Time:', invoice.appointment.appointment_time.strftime('%I:%M %p')],
-        ['Symptoms:', invoice.appointment.symptoms],
-    ]
-    
-    appointment_table = Table(appointment_data, colWidths=[2*inch, 4*inch])
-    appointment_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(appointment_table)
-    elements.append(Spacer(1, 30))
-    
-    # Billing Information
-    elements.append(Paragraph("Billing Summary", heading_style))
-    billing_data = [
-        ['Description', 'Amount'],
-        ['Consultation Fee', f'₹{invoice.amount}'],
-        ['', ''],
-        ['Total Amount', f'₹{invoice.amount}'],
-    ]
-    
-    billing_table = Table(billing_data, colWidths=[4*inch, 2*inch])
-    billing_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e0e7ff')),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
-        ('GRID', (0, 0), (-1, -2), 1, colors.grey),
-        ('BOX', (0, -1), (-1, -1), 2, colors.HexColor('#2563eb')),
-    ]))
-    elements.append(billing_table)
-    elements.append(Spacer(1, 40))
+    return render_invoice_pdf(invoice_data(invoice))
+
+
+class InvoiceRenderer:
+    """
+    Lays out invoice PDFs from invoice_data() values
     
-    # Footer
-    footer_text = Paragraph(
-        "Thank you for choosing Vishubh Healthcare!<br/>For any queries, please contact us.",
-        ParagraphStyle('Footer', parent=styles['Normal'], alignment=TA_CENTER, fontSize=9)
-    )
-    elements.append(footer_text)
+    Paragraph and table styles and the fixed header, section headings and
+    footer are built once, when the renderer is created, and reused for
+    every invoice; each render only builds the four data tables. Flowables
+    are not thread-safe, so use one renderer per thread (see
+    get_invoice_renderer).
+    """
     
-    # Build PDF
-    doc.build(elements)
+    def __init__(self):
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#2563eb'),
+            spaceAfter=30,
+            alignment=TA_CENTER
+        )
+        heading_style = ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=12,
+        )
+        footer_style = ParagraphStyle('Footer', parent=styles['Normal'], alignment=TA_CENTER, fontSize=9)
+        
+        # Label/value tables: invoice, patient and doctor details
+        self.details_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ])
+        # Same, top-aligned for multi-line symptoms
+        self.appointment_style = TableStyle(
+            self.details_style.getCommands() + [('VALIGN', (0, 0), (-1, -1), 'TOP')]
+        )
+        self.billing_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e0e7ff')),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#dbeafe')),
+            ('GRID', (0, 0), (-1, -2), 1, colors.grey),
+            ('BOX', (0, -1), (-1, -1), 2, colors.HexColor('#2563eb')),
+        ])
+        
+        self.header = [
+            Paragraph("VISHUBH HEALTHCARE", title_style),
+            Paragraph("Medical Invoice", styles['Heading2']),
+            Spacer(1, 12),
+        ]
+        self.headings = {
+            name: Paragraph(name, heading_style)
+            for name in ("Patient Information", "Doctor Information", "Appointment Details", "Billing Summary")
+        }
+        self.footer = Paragraph(
+            "Thank you for choosing Vishubh Healthcare!<br/>For any queries, please contact us.",
+            footer_style
+        )
+    
+    def _details(self, rows, style=None):
+        table = Table(rows, colWidths=[2*inch, 4*inch])
+        table.setStyle(style or self.details_style)
+        return table
+    
+    def render(self, data):
+        """
+        Lay out one invoice
+        
+        Returns:
+            bytes: PDF document
+        """
+        buffer = BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72,
+                               topMargin=72, bottomMargin=18)
+        
+        billing_table = Table([
+            ['Description', 'Amount'],
+            ['Consultation Fee', data['amount']],
+            ['', ''],
+            ['Total Amount', data['amount']],
+        ], colWidths=[4*inch, 2*inch])
+        billing_table.setStyle(self.billing_style)
+        
+        doc.build(self.header + [
+            self._details([
+                ['Invoice Number:', data['number']],
+                ['Date:', data['date']],
+                ['Status:', data['status']],
+            ]),
+            Spacer(1, 20),
+            self.headings["Patient Information"],
+            self._details([
+                ['Name:', data['patient_name']],
+                ['Contact:', data['patient_contact']],
+                ['Age:', data['patient_age']],
+                ['Blood Group:', data['patient_blood_group']],
+            ]),
+            Spacer(1, 20),
+            self.headings["Doctor Information"],
+            self._details([
+                ['Doctor:', data['doctor_name']],
+                ['Specialization:', data['doctor_specialization']],
+                ['Contact:', data['doctor_contact']],
+            ]),
+            Spacer(1, 20),
+            self.headings["Appointment Details"],
+            self._details([
+                ['Date:', data['appointment_date']],
+                ['Time:', data['appointment_time']],
+                ['Symptoms:', data['symptoms']],
+            ], self.appointment_style),
+            Spacer(1, 30),
+            self.headings["Billing Summary"],
+            billing_table,
+            Spacer(1, 40),
+            self.footer,
+        ])
+        return buffer.getvalue()
+    
+    def render_many(self, items):
+        """Lay out several invoices; returns their PDFs in order"""
+        return [self.render(data) for data in items]
+
+
+_renderers = threading.local()
+
+
+def get_invoice_renderer():
+    """The calling thread's InvoiceRenderer, created on first use"""
+    renderer = getattr(_renderers, 'renderer', None)
+    if renderer is None:
+        renderer = _renderers.renderer = InvoiceRenderer()
+    return renderer
+
+
+def render_invoice_pdf(data):
+    """
+    Lay out an invoice PDF from invoice_data() values
     
-    # Get the value of the BytesIO buffer and save it to the model
-    pdf = buffer.getvalue()
-    buffer.close()
+    Needs no database access, so it can run in worker processes.
     
-    return pdf
+    Returns:
+        bytes: PDF document
+    """
+    return get_invoice_renderer().render(data)
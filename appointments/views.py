@@ -1,17 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponse, FileResponse, JsonResponse
-from django.core.files.base import ContentFile
+from django.http import HttpResponse, FileResponse, JsonResponse, StreamingHttpResponse
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+from django.conf import settings
+from django.urls import reverse
+from django.core.paginator import Paginator
 from .models import Appointment, Invoice
-from .forms import AppointmentForm, AppointmentUpdateForm
+from .forms import AppointmentForm, AppointmentUpdateForm, WaitlistForm, AppointmentFilterForm, InvoiceFilterForm
 from accounts.models import Doctor, Patient
-from .utils import generate_invoice_pdf
-from .payment_utils import create_payment_order, verify_payment_signature
-from decimal import Decimal
+from accounts.search_utils import search_doctors
+from accounts.directory_utils import get_doctor_directory
+from .invoice_utils import (
+    DEFAULT_INVOICE_AMOUNT, invoice_blocker, create_invoice, parse_invoice_amount,
+    request_invoice_pdf, invoice_pdf_status
+)
+from .payment_utils import create_payment_order, verify_payment_signature, refund_payment, settle_lapsed_payment
+from .booking_utils import (
+    book_appointment_slot, book_recurring_appointments, save_appointment, release_expired_holds
+)
+from .waitlist_utils import add_to_waitlist
+from .assignment_utils import auto_assign_appointments
+from .availability_utils import slot_status, get_free_slots, earliest_free_slots, get_slot_minutes
+from .pagination_utils import keyset_paginate
+from .search_utils import search_appointment_ids
+from .database_utils import replica_reads
+from .export_utils import APPOINTMENT_COLUMNS, INVOICE_COLUMNS, stream_csv, stream_xlsx
+from datetime import timedelta
 import json
 
 
@@ -37,9 +56,21 @@ def book_appointment(request):
             appointment = form.save(commit=False)
             appointment.patient = patient
             
-            # Check for conflicts before saving
+            # The slot constraint decides races between concurrent bookings
             try:
-                appointment.save()
+                repeat = form.cleaned_data.get('repeat')
+                if repeat:
+                    series, skipped = book_recurring_appointments(
+                        appointment, repeat, form.cleaned_data.get('occurrences') or 1
+                    )
+                    messages.success(request, f'{len(series)} appointments booked successfully! Please proceed to payment.')
+                    if skipped:
+                        messages.warning(request, 'Some dates could not be booked: ' + '; '.join(
+                            f'{day:%d %b %Y} ({reason})' for day, reason in skipped.items()
+                        ))
+                    return redirect('initiate_payment', appointment_id=series[0].id)
+                
+                book_appointment_slot(appointment)
                 messages.success(request, 'Appointment booked successfully! Please proceed to payment.')
                 return redirect('initiate_payment', appointment_id=appointment.id)
             except ValidationError as e:
@@ -48,11 +79,42 @@ def book_appointment(request):
     else:
         form = AppointmentForm()
     
-    doctors = Doctor.objects.filter(verified=True)
-    return render(request, 'patient/book_appointment.html', {'form': form, 'doctors': doctors})
+    return render(request, 'patient/book_appointment.html', {'form': form, 'doctors': get_doctor_directory()})
+
+
+@login_required
+def join_waitlist(request):
+    """Add the patient to a doctor's waitlist for a fully booked day"""
+    if request.user.role != 'patient':
+        messages.error(request, 'Only patients can join a waitlist.')
+        return redirect('home')
+    
+    if request.method != 'POST':
+        return redirect('book_appointment')
+    
+    form = WaitlistForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Could not join the waitlist. Please choose a doctor and a future date.')
+        return redirect('book_appointment')
+    
+    doctor = form.cleaned_data['doctor']
+    date = form.cleaned_data['appointment_date']
+    entry, created = add_to_waitlist(
+        request.user.patient_profile, doctor, date, form.cleaned_data['symptoms']
+    )
+    if created:
+        messages.success(
+            request,
+            f'You are on the waitlist for Dr. {doctor.user.get_full_name()} on {date}. '
+            'We will book you automatically and email you if a slot opens up.'
+        )
+    else:
+        messages.info(request, 'You are already on the waitlist for this doctor and date.')
+    return redirect('patient_appointments')
 
 
 @login_required
+@replica_reads
 def patient_appointments(request):
     """View patient appointments"""
     if request.user.role != 'patient':
@@ -60,12 +122,13 @@ def patient_appointments(request):
         return redirect('home')
     
     patient = request.user.patient_profile
-    appointments = Appointment.objects.filter(patient=patient).order_by('-appointment_date', '-appointment_time')
+    appointments = Appointment.objects.with_related().filter(patient=patient).order_by('-appointment_date', '-appointment_time')
     
     return render(request, 'patient/appointments.html', {'appointments': appointments})
 
 
 @login_required
+@replica_reads
 def doctor_appointments(request):
     """View doctor appointments"""
     if request.user.role != 'doctor':
@@ -73,60 +136,169 @@ def doctor_appointments(request):
         return redirect('home')
     
     doctor = request.user.doctor_profile
-    appointments = Appointment.objects.filter(doctor=doctor).order_by('-appointment_date', '-appointment_time')
+    appointments = Appointment.objects.with_related().filter(doctor=doctor).order_by('-appointment_date', '-appointment_time')
     
     return render(request, 'doctor/appointments.html', {'appointments': appointments})
 
 
+def _page_query(filter_params, page):
+    """Query string of a page link that keeps the active filters"""
+    if page is None:
+        return None
+    params = filter_params.copy()
+    for key, value in page.items():
+        params[key] = value
+    return params.urlencode()
+
+
 @login_required
+@replica_reads
 def admin_manage_appointments(request):
     """Admin appointment management view"""
     if request.user.role != 'admin':
         messages.error(request, 'Access denied. Admin only.')
         return redirect('home')
     
-    appointments = Appointment.objects.all().order_by('-created_at')
-    
     # Handle appointment updates
     if request.method == 'POST':
         appointment_id = request.POST.get('appointment_id')
         action = request.POST.get('action')
         
-        appointment = get_object_or_404(Appointment, id=appointment_id)
-        
-        if action == 'confirm':
-            appointment.status = 'confirmed'
-            appointment.save()
-            messages.success(request, 'Appointment confirmed successfully.')
-        
-        elif action == 'complete':
-            appointment.status = 'completed'
-            appointment.save()
-            messages.success(request, 'Appointment marked as completed.')
+        if action == 'auto_assign':
+            # One capped batch per click, earliest appointments first
+            result = auto_assign_appointments()
+            messages.success(
+                request,
+                f"Assigned {result['assigned']} appointment(s) automatically; "
+                f"{result['unassigned']} could not be matched to a free doctor."
+            )
+            if result['next_cursor']:
+                messages.info(request, 'More unassigned appointments are waiting; run auto-assign again.')
+            return redirect('admin_manage_appointments')
         
-        elif action == 'cancel':
-            appointment.status = 'cancelled'
-            appointment.save()
-            messages.success(request, 'Appointment cancelled.')
+        appointment = get_object_or_404(Appointment, id=appointment_id)
         
-        elif action == 'assign_doctor':
-            doctor_id = request.POST.get('doctor_id')
-            if doctor_id:
-                doctor = get_object_or_404(Doctor, id=doctor_id)
-                appointment.doctor = doctor
-                appointment.save()
-                messages.success(request, f'Doctor {doctor.user.get_full_name()} assigned successfully.')
+        try:
+            if action == 'confirm':
+                appointment.status = 'confirmed'
+                save_appointment(appointment)
+                messages.success(request, 'Appointment confirmed successfully.')
+            
+            elif action == 'complete':
+                appointment.status = 'completed'
+                save_appointment(appointment)
+                messages.success(request, 'Appointment marked as completed.')
+            
+            elif action == 'cancel':
+                appointment.status = 'cancelled'
+                save_appointment(appointment)
+                messages.success(request, 'Appointment cancelled.')
+            
+            elif action == 'assign_doctor':
+                doctor_id = request.POST.get('doctor_id')
+                if doctor_id:
+                    doctor = get_object_or_404(Doctor, id=doctor_id)
+                    appointment.doctor = doctor
+                    save_appointment(appointment)
+                    messages.success(request, f'Doctor {doctor.user.get_full_name()} assigned successfully.')
+        except ValidationError as e:
+            messages.error(request, ' '.join(e.messages))
         
-        return redirect('admin_manage_appointments')
+        # Stay on the same filtered page
+        return redirect(request.get_full_path())
     
-    doctors = Doctor.objects.filter(verified=True)
+    filter_form = AppointmentFilterForm(request.GET)
+    appointments = filter_form.filter(Appointment.objects.with_related())
+    search_query = filter_form.cleaned_data['search'] if filter_form.is_valid() else ''
+    page_size = getattr(settings, 'ADMIN_APPOINTMENTS_PAGE_SIZE', 25)
+    
+    # Query string of the active filters, reused by the page links
+    filter_params = request.GET.copy()
+    for key in ('after', 'before', 'page'):
+        filter_params.pop(key, None)
+    
+    if search_query:
+        # Search results are paged in relevance order
+        page = Paginator(search_appointment_ids(appointments, search_query), page_size).get_page(
+            request.GET.get('page')
+        )
+        found = appointments.in_bulk(page.object_list)
+        items = [found[pk] for pk in page.object_list if pk in found]
+        previous_page = {'page': page.previous_page_number()} if page.has_previous() else None
+        next_page = {'page': page.next_page_number()} if page.has_next() else None
+    else:
+        page = keyset_paginate(
+            appointments,
+            ordering=('-created_at', '-id'),
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+        )
+        items = page['items']
+        previous_page = {'before': page['previous_cursor']} if page['previous_cursor'] else None
+        next_page = {'after': page['next_cursor']} if page['next_cursor'] else None
+    
+    doctors = get_doctor_directory()
     context = {
-        'appointments': appointments,
+        'appointments': items,
+        'previous_query': _page_query(filter_params, previous_page),
+        'next_query': _page_query(filter_params, next_page),
+        'filter_form': filter_form,
+        'search_query': search_query,
         'doctors': doctors,
+        'export_query': filter_params.urlencode(),
     }
     return render(request, 'admin/manage_appointments.html', context)
 
 
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def _export_response(request, queryset, columns, name):
+    """Stream a queryset as CSV or XLSX, as chosen by the format parameter"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_CONTENT_TYPES:
+        return HttpResponse('Unknown export format.', status=400)
+    # The rows are read while the response streams, after the view has
+    # returned; pin the database chosen now (replica or primary)
+    queryset = queryset.using(queryset.db)
+    if export_format == 'csv':
+        content = stream_csv(queryset, columns)
+    else:
+        content = stream_xlsx(queryset, columns, name.title())
+    response = StreamingHttpResponse(content, content_type=EXPORT_CONTENT_TYPES[export_format])
+    filename = f'{name}_{timezone.localdate():%Y%m%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@replica_reads
+def export_appointments(request):
+    """Stream the filtered appointments as CSV or XLSX (Admin only)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Access denied. Admin only.')
+        return redirect('home')
+    
+    appointments = AppointmentFilterForm(request.GET).filter(Appointment.objects.order_by('-created_at', '-id'))
+    return _export_response(request, appointments, APPOINTMENT_COLUMNS, 'appointments')
+
+
+@login_required
+@replica_reads
+def export_invoices(request):
+    """Stream the filtered invoices as CSV or XLSX (Admin only)"""
+    if request.user.role != 'admin':
+        messages.error(request, 'Access denied. Admin only.')
+        return redirect('home')
+    
+    invoices = InvoiceFilterForm(request.GET).filter(Invoice.objects.order_by('-generated_date', '-id'))
+    return _export_response(request, invoices, INVOICE_COLUMNS, 'invoices')
+
+
 @login_required
 def generate_invoice(request, appointment_id):
     """Generate invoice for an appointment (Admin only)"""
@@ -136,12 +308,9 @@ def generate_invoice(request, appointment_id):
     
     appointment = get_object_or_404(Appointment, id=appointment_id)
     
-    if appointment.status != 'confirmed' and appointment.status != 'completed':
-        messages.error(request, 'Can only generate invoice for confirmed or completed appointments.')
-        return redirect('admin_manage_appointments')
-    
-    if not appointment.doctor:
-        messages.error(request, 'Please assign a doctor before generating invoice.')
+    blocker = invoice_blocker(appointment)
+    if blocker:
+        messages.error(request, blocker)
         return redirect('admin_manage_appointments')
     
     # Check if invoice already exists
@@ -149,19 +318,17 @@ def generate_invoice(request, appointment_id):
         invoice = appointment.invoice
         messages.info(request, 'Invoice already exists for this appointment.')
     except Invoice.DoesNotExist:
-        # Create new invoice
-        amount = request.POST.get('amount', '500')  # Default consultation fee
-        invoice = Invoice.objects.create(
-            appointment=appointment,
-            amount=Decimal(amount)
-        )
-        
-        # Generate PDF
-        pdf_content = generate_invoice_pdf(invoice)
-        invoice.pdf_file.save(f'invoice_{invoice.id}.pdf', ContentFile(pdf_content))
-        invoice.save()
-        
-        messages.success(request, 'Invoice generated successfully.')
+        amount = parse_invoice_amount(request.POST.get('amount') or DEFAULT_INVOICE_AMOUNT)
+        if amount is None:
+            messages.error(request, 'Invoice amount must be a positive number below 100,000,000.')
+            return redirect('admin_manage_appointments')
+        try:
+            invoice = create_invoice(appointment, amount)
+        except IntegrityError:
+            # Another request invoiced it between the check and the insert
+            messages.info(request, 'Invoice already exists for this appointment.')
+            return redirect('admin_manage_appointments')
+        messages.success(request, 'Invoice generated successfully. Its PDF will be ready to download shortly.')
     
     return redirect('admin_manage_appointments')
 
@@ -205,11 +372,10 @@ def download_invoice(request, invoice_id):
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    # If PDF doesn't exist, generate it
+    # PDFs are rendered by the process_invoice_jobs worker, never in the request
     if not invoice.pdf_file:
-        pdf_content = generate_invoice_pdf(invoice)
-        invoice.pdf_file.save(f'invoice_{invoice.id}.pdf', ContentFile(pdf_content))
-        invoice.save()
+        job = request_invoice_pdf(invoice)
+        return render(request, 'appointments/invoice_pending.html', {'invoice': invoice, 'job': job})
     
     # Return PDF file
     response = FileResponse(invoice.pdf_file.open('rb'), content_type='application/pdf')
@@ -218,29 +384,49 @@ def download_invoice(request, invoice_id):
 
 
 @login_required
+def invoice_status(request, invoice_id):
+    """Report whether an invoice's PDF is ready (polled by the pending page)"""
+    invoice = get_object_or_404(Invoice.objects.select_related('appointment__patient', 'appointment__doctor'), id=invoice_id)
+    
+    # Same access as download_invoice
+    if request.user.role == 'patient':
+        allowed = invoice.appointment.patient.user_id == request.user.id
+    elif request.user.role == 'doctor':
+        allowed = invoice.appointment.doctor is not None and invoice.appointment.doctor.user_id == request.user.id
+    else:
+        allowed = request.user.role == 'admin'
+    if not allowed:
+        return JsonResponse({'error': 'Access denied.'}, status=403)
+    
+    status = invoice_pdf_status(invoice)
+    return JsonResponse({
+        'status': status,
+        'download_url': reverse('download_invoice', args=[invoice.id]) if status == 'ready' else None,
+    })
+
+
+@login_required
+@replica_reads
 def doctors_list(request):
     """List all verified doctors (for patients)"""
     if request.user.role != 'patient':
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    doctors = Doctor.objects.filter(verified=True)
+    doctors = get_doctor_directory()
     
     # Search functionality
-    search_query = request.GET.get('search', '')
+    search_query = request.GET.get('search', '').strip()
     if search_query:
-        doctors = doctors.filter(
-            specialization__icontains=search_query
-        ) | doctors.filter(
-            user__first_name__icontains=search_query
-        ) | doctors.filter(
-            user__last_name__icontains=search_query
-        )
+        directory = {doctor['id']: doctor for doctor in doctors}
+        matches = search_doctors(Doctor.objects.filter(verified=True).only('id'), search_query)
+        doctors = [directory[doctor.id] for doctor in matches if doctor.id in directory]
     
     return render(request, 'patient/doctors_list.html', {'doctors': doctors, 'search_query': search_query})
 
 
 @login_required
+@replica_reads
 def check_availability(request):
     """AJAX endpoint to check doctor availability"""
     if request.method == 'GET':
@@ -252,24 +438,105 @@ def check_availability(request):
             return JsonResponse({'available': True})
         
         try:
-            doctor = Doctor.objects.get(id=doctor_id)
-            conflicting = Appointment.objects.filter(
-                doctor=doctor,
-                appointment_date=date,
-                appointment_time=time,
-                status__in=['pending', 'confirmed']
-            ).exists()
-            
-            return JsonResponse({
-                'available': not conflicting,
-                'message': 'Time slot is available' if not conflicting else 'This time slot is already booked'
-            })
-        except Doctor.DoesNotExist:
-            return JsonResponse({'available': True})
+            date = parse_date(date)
+            time = parse_time(time)
+        except ValueError:
+            date = time = None
+        if not doctor_id.isdigit() or date is None or time is None:
+            return JsonResponse({'error': 'Invalid doctor, date or time'}, status=400)
+        
+        status = slot_status(int(doctor_id), date, time)
+        messages_by_status = {
+            'free': 'Time slot is available',
+            'booked': 'This time slot is already booked',
+            'closed': 'The doctor is not available at this time',
+        }
+        return JsonResponse({
+            'available': status == 'free',
+            'message': messages_by_status[status]
+        })
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+@login_required
+@replica_reads
+def free_slots(request):
+    """AJAX endpoint listing every free slot of a doctor across a date range"""
+    doctor_id = request.GET.get('doctor_id', '')
+    
+    try:
+        start_date = parse_date(request.GET.get('start', '')) or timezone.localdate()
+        end_date = parse_date(request.GET.get('end', '')) or start_date + timedelta(days=6)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+    
+    if not doctor_id.isdigit():
+        return JsonResponse({'error': 'doctor_id is required'}, status=400)
+    
+    max_days = getattr(settings, 'FREE_SLOTS_MAX_DAYS', 31)
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return JsonResponse({'error': f'Date range must cover 1 to {max_days} days'}, status=400)
+    
+    slots = get_free_slots(int(doctor_id), start_date, end_date)
+    return JsonResponse({
+        'doctor_id': int(doctor_id),
+        'slot_minutes': get_slot_minutes(),
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'slots': {
+            day.isoformat(): [start.strftime('%H:%M') for start in starts]
+            for day, starts in slots.items()
+        },
+    })
+
+
+@login_required
+@replica_reads
+def earliest_slots(request):
+    """AJAX endpoint listing the earliest free slots of any doctor of a specialization"""
+    specialization = request.GET.get('specialization', '').strip()
+    
+    try:
+        start_date = parse_date(request.GET.get('start', '')) or timezone.localdate()
+        end_date = parse_date(request.GET.get('end', '')) or start_date + timedelta(days=6)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+    
+    if not specialization:
+        return JsonResponse({'error': 'specialization is required'}, status=400)
+    
+    max_days = getattr(settings, 'FREE_SLOTS_MAX_DAYS', 31)
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return JsonResponse({'error': f'Date range must cover 1 to {max_days} days'}, status=400)
+    
+    max_results = getattr(settings, 'EARLIEST_SLOTS_MAX_RESULTS', 50)
+    limit = request.GET.get('limit', '10')
+    if not limit.isdigit() or not 1 <= int(limit) <= max_results:
+        return JsonResponse({'error': f'limit must be between 1 and {max_results}'}, status=400)
+    
+    doctors = {
+        doctor['id']: doctor for doctor in get_doctor_directory()
+        if doctor['specialization'].lower() == specialization.lower()
+    }
+    openings = earliest_free_slots(doctors, start_date, end_date, int(limit))
+    return JsonResponse({
+        'specialization': specialization,
+        'slot_minutes': get_slot_minutes(),
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'slots': [
+            {
+                'doctor_id': doctor_id,
+                'doctor_name': f"Dr. {doctors[doctor_id]['full_name']}",
+                'date': day.isoformat(),
+                'time': start.strftime('%H:%M'),
+            }
+            for doctor_id, day, start in openings
+        ],
+    })
+
+
 @login_required
 def doctor_update_status(request, appointment_id):
     """Allow doctors to update appointment status"""
@@ -289,8 +556,11 @@ def doctor_update_status(request, appointment_id):
         
         if new_status in ['confirmed', 'completed', 'cancelled']:
             appointment.status = new_status
-            appointment.save()
-            messages.success(request, f'Appointment status updated to {appointment.get_status_display()}.')
+            try:
+                save_appointment(appointment)
+                messages.success(request, f'Appointment status updated to {appointment.get_status_display()}.')
+            except ValidationError as e:
+                messages.error(request, ' '.join(e.messages))
         else:
             messages.error(request, 'Invalid status.')
     
@@ -316,6 +586,16 @@ def initiate_payment(request, appointment_id):
         messages.info(request, 'This appointment has already been paid for.')
         return redirect('patient_appointments')
     
+    # Abandoned checkouts release their slot once the hold expires, even
+    # before the sweeper gets to them
+    hold = appointment.hold_expires_at
+    if appointment.status == 'pending' and hold and hold <= timezone.now():
+        release_expired_holds(pk=appointment.pk)
+        appointment.refresh_from_db()
+    if appointment.status == 'cancelled':
+        messages.error(request, 'This booking is no longer held for you. Please book a new slot.')
+        return redirect('patient_appointments')
+    
     # Create payment order
     try:
         from django.conf import settings
@@ -325,6 +605,7 @@ def initiate_payment(request, appointment_id):
             # Mock payment for development
             appointment.payment_status = 'paid'
             appointment.payment_id = f'MOCK_{appointment.id}_{timezone.now().timestamp()}'
+            appointment.hold_expires_at = None
             appointment.save()
             messages.success(request, 'Payment completed successfully (Development Mode)!')
             return redirect('payment_success', appointment_id=appointment.id)
@@ -363,8 +644,15 @@ def payment_callback(request):
             
             # Verify payment signature
             if verify_payment_signature(order_id, payment_id, signature):
-                appointment.payment_status = 'paid'
+                # The hold expired mid-checkout and the slot was released
+                if appointment.status == 'cancelled':
+                    refund = refund_payment(payment_id)
+                    messages.error(request, settle_lapsed_payment(appointment, payment_id, refund))
+                    return redirect('payment_failure', appointment_id=appointment.id)
+                
                 appointment.payment_id = payment_id
+                appointment.hold_expires_at = None
+                appointment.payment_status = 'paid'
                 appointment.save()
                 
                 return redirect('payment_success', appointment_id=appointment.id)
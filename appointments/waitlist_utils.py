@@ -0,0 +1,85 @@
+"""
+Waitlist utilities
+
+Patients can queue for a doctor on a given day. When an appointment on that
+day is cancelled, the head of the queue (highest priority, then earliest) is
+booked into the freed slot in the same transaction as the cancellation.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .models import Appointment, WaitlistEntry
+from .booking_utils import save_appointment
+from .reminder_utils import send_waitlist_promotion
+
+
+def add_to_waitlist(patient, doctor, date, symptoms, priority=0):
+    """
+    Add a patient to a doctor's waitlist for a day
+    
+    Returns:
+        tuple: (WaitlistEntry, created) - an existing waiting entry is reused
+    """
+    return WaitlistEntry.objects.get_or_create(
+        patient=patient,
+        doctor=doctor,
+        date=date,
+        status='waiting',
+        defaults={'symptoms': symptoms, 'priority': priority},
+    )
+
+
+def promote_waitlist(doctor_id, day, start):
+    """
+    Book the head of a doctor's waitlist into a freed slot
+    
+    The queue head is found through ``waitlist_queue_idx`` so the lookup stays
+    logarithmic in the queue length. The entry is locked and promoted in one
+    transaction, nested in the one that freed the slot when there is one;
+    a cancellation saved in autocommit mode gets its own.
+    
+    Args:
+        doctor_id: Doctor whose slot was freed
+        day: Date of the freed slot
+        start: Start time of the freed slot
+        
+    Returns:
+        Appointment: The promoted booking, or None if nobody was waiting
+    """
+    if not doctor_id or day < timezone.localdate():
+        return None
+    
+    # select_for_update() needs a transaction on backends that support it
+    with transaction.atomic():
+        entry = WaitlistEntry.objects.select_for_update().filter(
+            doctor_id=doctor_id, date=day, status='waiting'
+        ).order_by('-priority', 'created_at').select_related('patient').first()
+        if entry is None:
+            return None
+        
+        appointment = Appointment(
+            patient=entry.patient,
+            doctor_id=doctor_id,
+            appointment_date=day,
+            appointment_time=start,
+            symptoms=entry.symptoms,
+        )
+        try:
+            # Keep the overlap check: a longer neighbouring booking may still
+            # cover part of the freed slot
+            save_appointment(appointment)
+        except ValidationError:
+            # Someone else took the slot first; keep the entry queued
+            return None
+        
+        entry.status = 'promoted'
+        entry.appointment = appointment
+        entry.save(update_fields=['status', 'appointment'])
+        
+        transaction.on_commit(lambda: send_waitlist_promotion(appointment))
+    return appointment
+
+
+def is_cancellation(before, after):
+    """Whether a change moved an appointment from an active state to cancelled"""
+    return before.get('status') in Appointment.ACTIVE_STATUSES and after.get('status') == 'cancelled'
@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'appointments.database_utils.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,13 +79,109 @@ WSGI_APPLICATION = 'vishubh_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Configured from the environment; defaults to the SQLite file in the project root.
+# DB_ENGINE is a Django backend name: sqlite3, postgresql or mysql.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        # Keep connections open between requests (seconds; 0 closes after each request)
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Check a reused connection before each request so a dropped server
+        # connection is replaced instead of failing the request
+        'CONN_HEALTH_CHECKS': DB_ENGINE != 'sqlite3',
     }
 }
 
+# Optional read replica for dashboards and lists; same engine and credentials
+# as the primary unless overridden. Tests read the primary through it.
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['appointments.database_utils.PrimaryReplicaRouter']
+
+# Seconds a browser reads from the primary after a POST, covering replica lag
+REPLICA_PIN_SECONDS = 5
+
+# Applied to every new SQLite connection (see appointments.database_utils).
+# WAL lets readers run alongside a writer, NORMAL skips the fsync per commit
+# (still durable across crashes in WAL mode), busy_timeout makes writers wait
+# for the lock instead of failing, and mmap_size serves reads from memory.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+}
+
+
+# Cache
+# Configured from the environment like DATABASES. CACHE_BACKEND is one of:
+#   locmem    - memory of each server process; only for a single process
+#   db        - tables in the database (run `python manage.py createcachetable`)
+#   redis     - CACHE_LOCATION is the server URL, e.g. redis://127.0.0.1:6379
+#   memcached - CACHE_LOCATION is host:port (needs pymemcache)
+# A per-process cache only drops a changed doctor directory in the process
+# that saved the change, so with several server processes (WEB_CONCURRENCY
+# above 1) the default is the shared database cache.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'db' if WEB_CONCURRENCY > 1 else 'locmem')
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(f'CACHE_BACKEND must be one of {", ".join(CACHE_BACKENDS)}')
+SHARED_CACHE = CACHE_BACKEND != 'locmem'
+
+
+def cache_location(name):
+    """LOCATION of a cache: its own table or memory area, or the shared server"""
+    if CACHE_BACKEND == 'locmem':
+        return f'vishubh-{name}'
+    if CACHE_BACKEND == 'db':
+        return f'vishubh_cache_{name}'
+    return os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379' if CACHE_BACKEND == 'redis' else '127.0.0.1:11211')
+
+
+# Template fragments ({% cache %}, one per appointment row) get their own
+# cache so they cannot evict the doctor directory; on a shared server they
+# are kept apart by KEY_PREFIX instead.
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': cache_location('default'),
+        'KEY_PREFIX': 'vishubh',
+    },
+    'template_fragments': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': cache_location('fragments'),
+        'KEY_PREFIX': 'vishubh-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CACHE_BACKEND in ('locmem', 'db') else {},
+    },
+}
+
+# Seconds the verified doctor directory is cached; it is also dropped whenever
+# a doctor changes (see accounts.directory_utils). A per-process cache keeps
+# it briefly, since other processes never see that drop.
+DOCTOR_DIRECTORY_CACHE_SECONDS = int(
+    os.environ.get('DOCTOR_DIRECTORY_CACHE_SECONDS', 3600 if SHARED_CACHE else 60)
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -139,6 +238,59 @@ LOGOUT_REDIRECT_URL = 'home'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Appointment slots
+# The day is split into fixed-length slots; the availability index stores one
+# bitmap per doctor per day. Days without generated working hours fall back
+# to clinic hours.
+APPOINTMENT_SLOT_MINUTES = 30
+CLINIC_OPENING_HOUR = 9
+CLINIC_CLOSING_HOUR = 18
+
+# Longest appointment in minutes; new appointments last one slot. Overlap
+# checks only scan appointments starting this long before a booking.
+APPOINTMENT_MAX_DURATION_MINUTES = 120
+
+# How far ahead doctor working-hour templates are expanded into slots
+SCHEDULE_HORIZON_WEEKS = 8
+
+# Minutes an unpaid booking keeps its slot during checkout before the
+# release_expired_holds sweeper cancels it; reopening the checkout restarts
+# a running hold, but never past SLOT_HOLD_MAX_MINUTES after booking
+SLOT_HOLD_MINUTES = 15
+SLOT_HOLD_MAX_MINUTES = 45
+
+# Largest number of appointments in a recurring series
+RECURRING_MAX_OCCURRENCES = 12
+
+# Longest date range (in days) served by the free slots endpoint
+FREE_SLOTS_MAX_DAYS = 31
+
+# Most openings returned by one earliest slots search
+EARLIEST_SLOTS_MAX_RESULTS = 50
+
+# Rows per page in the admin appointment manager
+ADMIN_APPOINTMENTS_PAGE_SIZE = 25
+
+# Most unassigned appointments the auto-assign button or admin action
+# handles per click; the management command walks through all of them
+AUTO_ASSIGN_BATCH_SIZE = 500
+
+# Rows per page of the JSON API lists when no limit is given, and the
+# largest limit a client may ask for
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 5000
+
+# Rows fetched per database round trip by the streaming CSV/XLSX exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Invoice PDF jobs (process_invoice_jobs): tries per job before it is marked
+# failed, seconds between tries, seconds a running job may go silent before
+# it is requeued, and seconds an idle worker waits between polls
+INVOICE_JOB_MAX_ATTEMPTS = 3
+INVOICE_JOB_RETRY_SECONDS = 30
+INVOICE_JOB_TIMEOUT_SECONDS = 300
+INVOICE_WORKER_POLL_SECONDS = 2
+
 # Email Configuration (Console backend for development)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@vishubhhealthcare.com'
@@ -25,6 +25,7 @@ urlpatterns = [
     path('', home, name='home'),
     path('accounts/', include('accounts.urls')),
     path('appointments/', include('appointments.urls')),
+    path('api/v1/', include('appointments.api_urls')),
 ]
 
 # Serve media files in development